@@ -3,8 +3,13 @@ import streamlit as st
 from config.config import get_openai_api_key, DEFAULT_USDJPY
 from ui.sidebarOld import init_metrics_state, render_sidebar
 from ui.style import hide_anchor_links
+from ui.job_panel import keep_session_jobs_alive
 
 st.set_page_config(page_title="Minutes Maker — Home", layout="wide")
+
+with st.sidebar:
+    keep_session_jobs_alive()  # ほかのページで投入した実行中ジョブの生存確認
+
 # 鎖アイコンを非表示にする
 hide_anchor_links()
 st.title("🎛️ Minutes Maker — Home")
@@ -1,12 +1,22 @@
 # config/config.py
+import tempfile
+from pathlib import Path
+
 import streamlit as st
 
 # ===== OpenAI API =====
 OPENAI_TRANSCRIBE_URL = "https://api.openai.com/v1/audio/transcriptions"
 # OPENAI_CHAT_URL = "https://api.openai.com/v1/chat/completions"  # modern移行済みなら未使用のままでOK
 
+def _secret(key: str, default):
+    """st.secrets.get。secrets.toml が無い環境（tools/ の CLI など）では既定値を返す。"""
+    try:
+        return st.secrets.get(key, default)
+    except FileNotFoundError:
+        return default
+
 def get_openai_api_key() -> str:
-    return st.secrets.get("OPENAI_API_KEY", "")
+    return _secret("OPENAI_API_KEY", "")
 
 # ===== 価格（USD / 100万トークン）=====  ※テキスト生成用（chat）
 MODEL_PRICES_USD = {
@@ -28,8 +38,88 @@ TRANSCRIBE_PRICES_USD_PER_MIN = {
     "whisper-1":              WHISPER_PRICE_PER_MIN,
 }
 
+# 音声 1 分あたりの API 処理時間（秒）モデル別の目安。フォルダ見積りの処理時間に使う（実測に合わせて調整）
+TRANSCRIBE_SEC_PER_AUDIO_MIN = {
+    "gpt-4o-mini-transcribe": 3.0,
+    "gpt-4o-transcribe":      4.0,
+    "whisper-1":              6.0,
+}
+
+# 文字起こし API の 1 リクエストあたりのアップロード上限（バイト）
+TRANSCRIBE_MAX_UPLOAD_BYTES = 25 * 1000 * 1000
+
+# 長い音声をチャンクに分けて文字起こしするときの同時リクエスト数の上限（secretsで上書き可）
+TRANSCRIBE_MAX_CONCURRENCY = int(_secret("TRANSCRIBE_MAX_CONCURRENCY", 4))
+
+# ===== HTTP 接続（全ページ・全セッションで共有するキープアライブのプール）=====
+HTTP_POOL_MAXSIZE = int(_secret("HTTP_POOL_MAXSIZE", 32))                 # ホストあたりの保持接続数
+HTTP_KEEPALIVE_EXPIRY_SEC = float(_secret("HTTP_KEEPALIVE_EXPIRY_SEC", 120))
+HTTP2_ENABLED = bool(_secret("HTTP2_ENABLED", True))                        # OpenAI クライアントのみ（h2 があれば）
+# エンドポイント別のタイムアウト（接続, 読み取り）秒
+HTTP_TIMEOUTS = {
+    "transcribe": (10.0, 600.0),
+    "chat":       (10.0, 600.0),
+}
+
+# ===== API のレート制限（クライアント側・全セッション共通。組織の上限より少し下に設定）=====
+# rpm: 1 分あたりのリクエスト数 / tpm: 1 分あたりのトークン数（0 = 制限しない）
+# concurrency: 同時に送信中のリクエスト数の上限（全セッション合計）
+API_RATE_LIMITS = {
+    "transcribe": {
+        "rpm": int(_secret("TRANSCRIBE_RPM", 50)),
+        "tpm": int(_secret("TRANSCRIBE_TPM", 0)),
+        "concurrency": int(_secret("TRANSCRIBE_SERVER_CONCURRENCY", 8)),
+    },
+    "chat": {
+        "rpm": int(_secret("CHAT_RPM", 500)),
+        "tpm": int(_secret("CHAT_TPM", 200_000)),
+        "concurrency": int(_secret("CHAT_SERVER_CONCURRENCY", 8)),
+    },
+}
+API_MAX_ATTEMPTS = int(_secret("API_MAX_ATTEMPTS", 6))        # 初回を含む送信回数の上限
+API_BACKOFF_BASE_SEC = float(_secret("API_BACKOFF_BASE_SEC", 1.0))
+API_BACKOFF_MAX_SEC = float(_secret("API_BACKOFF_MAX_SEC", 60.0))
+
+# ===== バックグラウンドのジョブキュー（文字起こし・話者分離・議事録。全セッション共通）=====
+JOB_QUEUE_WORKERS = int(_secret("JOB_QUEUE_WORKERS", 4))       # 同時に実行するジョブ数（超えた分は待機）
+JOB_KEEP_SEC = float(_secret("JOB_KEEP_SEC", 3600))            # 終わったジョブの結果を保持する秒数
+JOB_ABANDON_SEC = float(_secret("JOB_ABANDON_SEC", 300))       # この間だれも状態を見に来なければ中止する
+# （同じタブならどのページでもサイドバーが生存確認する。タブを閉じた場合だけが対象）
+
 # ===== 為替の初期値 =====（secretsにUSDJPYがあれば上書き）
-DEFAULT_USDJPY = float(st.secrets.get("USDJPY", 150.0))
+DEFAULT_USDJPY = float(_secret("USDJPY", 150.0))
+
+# ===== 音声分割の出力 =====
+# ZIP はこのサイズ（MB）まではメモリ上、超えたら一時ファイル（ディスク）に退避（secretsで上書き可）
+SPLIT_ZIP_SPOOL_MAX_BYTES = int(float(_secret("SPLIT_ZIP_SPOOL_MAX_MB", 64)) * 1024 * 1024)
+
+# ===== デコード／エンコード結果のキャッシュ（全セッション共通・ディスク）=====
+DECODE_CACHE_DIR = Path(_secret("DECODE_CACHE_DIR", Path(tempfile.gettempdir()) / "transcription-app" / "decode_cache"))
+DECODE_CACHE_MAX_BYTES = int(float(_secret("DECODE_CACHE_MAX_GB", 4)) * 1024 ** 3)
+
+# ===== 文字起こし結果のキャッシュ（全セッション共通・SQLite 索引＋圧縮した本文）=====
+TRANSCRIPT_CACHE_DIR = Path(_secret("TRANSCRIPT_CACHE_DIR", Path(tempfile.gettempdir()) / "transcription-app" / "transcripts"))
+TRANSCRIPT_CACHE_MAX_BYTES = int(float(_secret("TRANSCRIPT_CACHE_MAX_MB", 512)) * 1024 * 1024)
+
+# ===== 文字起こしジョブのチェックポイント（中断したジョブを残りのチャンクから再開する）=====
+TRANSCRIBE_JOBS_DIR = Path(_secret("TRANSCRIBE_JOBS_DIR", Path(tempfile.gettempdir()) / "transcription-app" / "jobs"))
+TRANSCRIBE_JOB_MAX_AGE_DAYS = float(_secret("TRANSCRIBE_JOB_MAX_AGE_DAYS", 7))
+
+# ===== モデルのカスケード（安いモデルで全体 → 信頼度の低い区間だけ高精度モデルで再実行）=====
+# しきい値は Whisper 自身のフォールバック判定（logprob -1.0 / no_speech 0.6 / 圧縮率 2.4）に合わせた既定値
+CASCADE_MIN_AVG_LOGPROB = float(_secret("CASCADE_MIN_AVG_LOGPROB", -1.0))        # これより低いセグメントは低信頼
+CASCADE_MAX_NO_SPEECH_PROB = float(_secret("CASCADE_MAX_NO_SPEECH_PROB", 0.6))   # 無音らしいのに文字がある（幻聴の疑い）
+CASCADE_MAX_COMPRESSION_RATIO = float(_secret("CASCADE_MAX_COMPRESSION_RATIO", 2.4))  # 繰り返しが多い（ループの疑い）
+CASCADE_MERGE_GAP_MS = int(_secret("CASCADE_MERGE_GAP_MS", 2000))   # これより近い低信頼区間は 1 リクエストにまとめる
+CASCADE_PAD_MS = int(_secret("CASCADE_PAD_MS", 250))                # 区間の前後に足す余白
+CASCADE_MIN_RANGE_MS = int(_secret("CASCADE_MIN_RANGE_MS", 2000))   # 短すぎる区間はこの長さまで広げる
+CASCADE_TEXT_PAD_MS = int(_secret("CASCADE_TEXT_PAD_MS", 3000))     # タイムスタンプの無いモデル：文字位置から時刻を見積もるので余白を広めに
+
+# ===== フォルダ見積り（プリフライト）の再生時間キャッシュ（パス＋mtime＋サイズがキー）=====
+PREFLIGHT_CACHE_PATH = Path(_secret("PREFLIGHT_CACHE_PATH", Path(tempfile.gettempdir()) / "transcription-app" / "preflight_cache.json"))
+# 画面から見積もれるフォルダ（この下だけ。未設定なら画面からは使えない。CLI の tools/preflight は制限なし）
+_roots = _secret("PREFLIGHT_ALLOWED_ROOTS", [])
+PREFLIGHT_ALLOWED_ROOTS = [Path(p) for p in ([_roots] if isinstance(_roots, str) else _roots)]
 
 # ---- モデル別の推奨出力上限（目安） ----
 # v1=128000
@@ -0,0 +1,436 @@
+# lib/api_client.py
+# ============================================================
+# API 呼び出しの流量制御（asyncio・全セッション共通）
+# ------------------------------------------------------------
+# 以前は文字起こしが urllib3 の Retry(total=3, backoff_factor=1.2)、Chat は再送なしだった。
+# チャンクを並列に送ると 429 を連発し、全員が同じ間隔で再送してまた 429 になって失敗していた。
+#
+# 【しくみ】（エンドポイント "transcribe" / "chat" ごとに 1 つ）
+# - トークンバケット: 1 分あたりのリクエスト数（rpm）とトークン数（tpm）。config.API_RATE_LIMITS
+# - 同時実行数の上限: asyncio.Semaphore（全セッションの合計）
+# - 応答ヘッダ:
+#     x-ratelimit-remaining-* / x-ratelimit-reset-* … 残りが 0 ならリセットまで全体で待つ
+#     x-ratelimit-limit-*                          … 設定より小さければバケットを縮める
+#     Retry-After / retry-after-ms                 … 429・503 はこの時間だけ待つ（429 は全体で待つ）
+# - 再送: 429 / 408 / 409 / 5xx / 接続エラー。待ち時間は指数バックオフ＋ジッター（同時再送を散らす）。
+#   429 でも insufficient_quota（残高切れ）は再送しない。
+#
+# HTTP 自体は lib/http_clients の共有クライアント（同期）をスレッドで呼ぶ（asyncio.to_thread）。
+# ここが持つのは「いつ送るか」だけで、送信・応答の解釈は呼び出し側の関数 fn に任せる。
+#
+# - AsyncAPIClient.call()      : await で使う（バッチ処理などイベントループを持つ側）
+# - AsyncAPIClient.call_sync() : Streamlit のスクリプト／ワーカースレッドから使う（専用ループに投げて待つ）
+# - get_api_client(name)       : 共有ループ上の AsyncAPIClient（st.cache_resource）
+# - chat_completion()          : OpenAI Chat を流量制御つきでストリーミングで 1 回呼ぶ（途中経過・中止に対応）
+# - chat_job()                 : chat_completion() を lib/job_queue のジョブとして実行する関数
+# - rate_stats()               : 送信数・再送数・429 の回数・待ち時間（デバッグ表示用）
+# ============================================================
+from __future__ import annotations
+
+import asyncio
+import random
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from email.utils import parsedate_to_datetime
+from typing import Any, Callable, Dict, List, Mapping, Optional
+
+import requests
+import streamlit as st
+
+from config.config import API_BACKOFF_BASE_SEC, API_BACKOFF_MAX_SEC, API_MAX_ATTEMPTS, API_RATE_LIMITS
+from lib.job_queue import JobCancelled
+
+try:
+    import openai
+except Exception:  # pragma: no cover - requirements に入っている
+    openai = None
+
+RETRY_STATUS = frozenset({408, 409, 429, 500, 502, 503, 504})
+PARTIAL_EMIT_SEC = 0.25   # ストリーミングの途中経過を渡す最短間隔
+BURST_SEC = 10.0   # バケットの容量 = この秒数分（API 側も 1 分より細かい単位で数えるため、1 分ぶんを一気に出さない）
+
+
+# ---------- ヘッダの解釈 ----------
+_DURATION_RE = re.compile(r"(\d+(?:\.\d+)?)(ms|s|m|h)")
+_UNIT_SEC = {"ms": 0.001, "s": 1.0, "m": 60.0, "h": 3600.0}
+
+
+def parse_duration(value: Optional[str]) -> Optional[float]:
+    """"6m0s" / "1.5s" / "20ms" / "2"（単位なしは秒）を秒にする。解釈できなければ None。"""
+    if value is None:
+        return None
+    value = str(value).strip()
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    parts = _DURATION_RE.findall(value)
+    if not parts:
+        return None
+    return sum(float(n) * _UNIT_SEC[u] for n, u in parts)
+
+
+def retry_after_sec(headers: Optional[Mapping[str, str]]) -> Optional[float]:
+    """retry-after-ms / Retry-After（秒 or HTTP 日付）から待つ秒数。無ければ None。"""
+    if not headers:
+        return None
+    ms = headers.get("retry-after-ms")
+    if ms is not None:
+        try:
+            return max(0.0, float(ms) / 1000)
+        except ValueError:
+            pass
+    ra = headers.get("retry-after")
+    if ra is None:
+        return None
+    try:
+        return max(0.0, float(ra))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(ra).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def _int_header(headers: Mapping[str, str], key: str) -> Optional[int]:
+    try:
+        return int(float(headers[key]))
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+def backoff_delay(attempt: int, retry_after: Optional[float] = None,
+                  base: float = API_BACKOFF_BASE_SEC, cap: float = API_BACKOFF_MAX_SEC) -> float:
+    """attempt 回目（1 始まり）の失敗後に待つ秒数。Retry-After があればそれ＋少しのジッター。"""
+    if retry_after is not None:
+        return retry_after + random.uniform(0, min(1.0, 0.1 * retry_after + 0.1))
+    d = min(cap, base * 2 ** (attempt - 1))
+    return d / 2 + random.uniform(0, d / 2)
+
+
+# ---------- トークンバケット ----------
+class TokenBucket:
+    """1 分あたり per_minute を補充するバケット（容量は BURST_SEC 秒分）。per_minute <= 0 なら制限しない。"""
+
+    def __init__(self, per_minute: float):
+        self.per_minute = float(per_minute)
+        self.tokens = self.capacity
+        self._t = time.monotonic()
+
+    @property
+    def capacity(self) -> float:
+        return max(1.0, self.per_minute * BURST_SEC / 60)
+
+    @property
+    def enabled(self) -> bool:
+        return self.per_minute > 0
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self._t) * self.per_minute / 60)
+        self._t = now
+
+    def wait_time(self, n: float) -> float:
+        """n 個取り出せるまでの秒数（容量を超える n は容量で頭打ち）。"""
+        if not self.enabled:
+            return 0.0
+        self._refill()
+        n = min(n, self.capacity)
+        return 0.0 if self.tokens >= n else (n - self.tokens) * 60 / self.per_minute
+
+    def take(self, n: float) -> None:
+        if self.enabled:
+            self.tokens -= min(n, self.capacity)
+
+    def clamp(self, remaining: int) -> None:
+        """サーバーが返した残り数に合わせる（こちらの見積もりより少なければ）。"""
+        if self.enabled:
+            self._refill()
+            self.tokens = min(self.tokens, float(remaining))
+
+    def shrink(self, limit: int) -> None:
+        """サーバー側の上限が設定より小さければ、それに合わせる。"""
+        if self.enabled and 0 < limit < self.per_minute:
+            self.per_minute = float(limit)
+            self.tokens = min(self.tokens, self.capacity)
+
+
+class RateLimiter:
+    """rpm と tpm の 2 つのバケット＋全体の一時停止（ヘッダ・429 による）。待つ順番は先着順。"""
+
+    def __init__(self, rpm: int, tpm: int):
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self._paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def pause(self, seconds: float) -> None:
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    def _wait_time(self, tokens: int) -> float:
+        return max(
+            self._paused_until - time.monotonic(),
+            self.requests.wait_time(1),
+            self.tokens.wait_time(tokens),
+        )
+
+    async def acquire(self, tokens: int = 0) -> float:
+        """1 リクエスト分（＋tokens）を取り出す。待った秒数を返す。"""
+        t0 = time.monotonic()
+        async with self._lock:
+            while (wait := self._wait_time(tokens)) > 0:
+                await asyncio.sleep(wait)
+            self.requests.take(1)
+            self.tokens.take(tokens)
+        return time.monotonic() - t0
+
+    def observe(self, headers: Optional[Mapping[str, str]]) -> None:
+        """x-ratelimit-* ヘッダでバケットを補正する。"""
+        if not headers:
+            return
+        for bucket, kind in ((self.requests, "requests"), (self.tokens, "tokens")):
+            limit = _int_header(headers, f"x-ratelimit-limit-{kind}")
+            if limit is not None:
+                bucket.shrink(limit)
+            remaining = _int_header(headers, f"x-ratelimit-remaining-{kind}")
+            if remaining is None:
+                continue
+            bucket.clamp(remaining)
+            if remaining <= 0:
+                reset = parse_duration(headers.get(f"x-ratelimit-reset-{kind}"))
+                if reset:
+                    self.pause(reset)
+
+
+# ---------- 失敗の分類 ----------
+@dataclass(frozen=True)
+class _Failure:
+    retryable: bool
+    status: Optional[int]
+    headers: Optional[Mapping[str, str]]
+
+
+def _classify(exc: BaseException) -> _Failure:
+    """例外から (再送するか, ステータス, 応答ヘッダ) を取り出す。"""
+    if isinstance(exc, (requests.ConnectionError, requests.Timeout)):
+        return _Failure(True, None, None)
+    if openai is not None and isinstance(exc, openai.APIConnectionError):  # APITimeoutError を含む
+        return _Failure(True, None, None)
+
+    status = getattr(exc, "status", None) or getattr(exc, "status_code", None)
+    headers = getattr(exc, "headers", None)
+    if headers is None:
+        headers = getattr(getattr(exc, "response", None), "headers", None)
+    if not isinstance(status, int):
+        return _Failure(False, None, headers)
+    body = str(getattr(exc, "body", "") or exc)
+    if status == 429 and "insufficient_quota" in body:
+        return _Failure(False, status, headers)
+    return _Failure(status in RETRY_STATUS, status, headers)
+
+
+# ---------- クライアント ----------
+@dataclass
+class ApiStats:
+    calls: int = 0         # call() の回数
+    attempts: int = 0      # 実際に送った回数（再送を含む）
+    retries: int = 0
+    throttled: int = 0     # 429 を受けた回数
+    failures: int = 0      # 再送しても失敗した call() の回数
+    waited_sec: float = 0.0  # 流量制御・バックオフで待った合計秒
+
+
+class AsyncAPIClient:
+    """1 エンドポイント分の流量制御。fn は同期関数（HTTP を 1 回送って結果を返す／失敗なら例外）。"""
+
+    def __init__(
+        self,
+        name: str,
+        rpm: int,
+        tpm: int = 0,
+        concurrency: int = 8,
+        max_attempts: int = API_MAX_ATTEMPTS,
+        loop: Optional[asyncio.AbstractEventLoop] = None,
+    ):
+        self.name = name
+        self.limiter = RateLimiter(rpm, tpm)
+        self.concurrency = max(1, int(concurrency))
+        self.max_attempts = max(1, int(max_attempts))
+        self.stats = ApiStats()
+        self._sem = asyncio.Semaphore(self.concurrency)
+        self._loop = loop
+
+    async def call(self, fn: Callable[[], Any], tokens: int = 0,
+                   cancel: Optional[threading.Event] = None) -> Any:
+        """
+        流量制御・再送つきで fn() をスレッドで実行し、その戻り値を返す（戻り値の .headers も読む）。
+        cancel（lib/job_queue のジョブの中止）が立っていれば、送る前に JobCancelled を投げる。
+        """
+        self.stats.calls += 1
+        attempt = 0
+        while True:
+            attempt += 1
+            async with self._sem:
+                self.stats.waited_sec += await self.limiter.acquire(tokens)
+                if cancel is not None and cancel.is_set():
+                    raise JobCancelled()
+                self.stats.attempts += 1
+                try:
+                    result = await asyncio.to_thread(fn)
+                except JobCancelled:
+                    raise
+                except Exception as e:
+                    failure = _classify(e)
+                    self.limiter.observe(failure.headers)
+                    if not failure.retryable or attempt >= self.max_attempts:
+                        self.stats.failures += 1
+                        raise
+                else:
+                    self.limiter.observe(getattr(result, "headers", None))
+                    return result
+
+            # スロットを返してから待つ（待っている間も他のリクエストは進める）
+            delay = backoff_delay(attempt, retry_after_sec(failure.headers))
+            if failure.status == 429:
+                self.stats.throttled += 1
+                self.limiter.pause(delay)
+            self.stats.retries += 1
+            self.stats.waited_sec += delay
+            await asyncio.sleep(delay)
+
+    def call_sync(self, fn: Callable[[], Any], tokens: int = 0,
+                  cancel: Optional[threading.Event] = None) -> Any:
+        """別スレッドで回っているループに call() を投げて結果を待つ（ループを持たない呼び出し元用）。"""
+        if self._loop is None:
+            raise RuntimeError("call_sync() にはループ付きのクライアントが必要です（get_api_client を使う）")
+        return asyncio.run_coroutine_threadsafe(self.call(fn, tokens, cancel), self._loop).result()
+
+
+class _LoopThread:
+    """流量制御用のイベントループを回すデーモンスレッド。HTTP は default executor のスレッドで実行。"""
+
+    def __init__(self, max_workers: int):
+        self.loop = asyncio.new_event_loop()
+        self.loop.set_default_executor(ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="api-io"))
+        threading.Thread(target=self.loop.run_forever, name="api-loop", daemon=True).start()
+
+
+@st.cache_resource
+def _api_loop() -> _LoopThread:
+    return _LoopThread(sum(v["concurrency"] for v in API_RATE_LIMITS.values()) + 2)
+
+
+@st.cache_resource
+def get_api_client(name: str) -> AsyncAPIClient:
+    """エンドポイント名（config.API_RATE_LIMITS のキー）ごとに 1 つ。全セッション共通。"""
+    cfg = API_RATE_LIMITS.get(name, API_RATE_LIMITS["chat"])
+    return AsyncAPIClient(name, cfg["rpm"], cfg["tpm"], cfg["concurrency"], loop=_api_loop().loop)
+
+
+# ---------- Chat ----------
+def estimate_chat_tokens(messages: List[Dict[str, Any]], max_completion_tokens: int) -> int:
+    """tpm の見積もり：入力は 1 文字 ≒ 1 トークン（日本語寄りの安全側）＋出力の上限。"""
+    n_in = sum(len(str(m.get("content", ""))) for m in messages)
+    return n_in + int(max_completion_tokens or 0)
+
+
+@dataclass
+class ChatResult:
+    text: str = ""
+    finish_reason: Optional[str] = None
+    usage: Dict[str, int] = field(default_factory=dict)  # modern 形式（input_tokens / output_tokens / total_tokens）
+    model: str = ""
+    request_id: Optional[str] = None
+    elapsed: float = 0.0
+    headers: Optional[Mapping[str, str]] = field(default=None, repr=False)
+
+
+def _usage_dict(usage) -> Dict[str, int]:
+    """Chat Completions の usage（prompt_tokens / completion_tokens）を lib/tokens の modern 形式に揃える。"""
+    if usage is None:
+        return {}
+    n_in = getattr(usage, "prompt_tokens", None) or getattr(usage, "input_tokens", 0) or 0
+    n_out = getattr(usage, "completion_tokens", None) or getattr(usage, "output_tokens", 0) or 0
+    return {"input_tokens": int(n_in), "output_tokens": int(n_out),
+            "total_tokens": int(getattr(usage, "total_tokens", 0) or n_in + n_out)}
+
+
+def chat_completion(
+    client,
+    on_text: Optional[Callable[[str], None]] = None,
+    cancel: Optional[threading.Event] = None,
+    api: Optional[AsyncAPIClient] = None,
+    **chat_kwargs,
+) -> ChatResult:
+    """
+    client.chat.completions.create(**chat_kwargs) を流量制御・再送つきで、ストリーミングで呼ぶ。
+    on_text(ここまでの本文) は受信のたびに呼ぶ（途中経過）。cancel が立ったら接続を閉じて
+    JobCancelled を投げる（サーバー側の生成も止まり、以降の出力トークンは課金されない）。
+    api はスクリプト外のスレッドから呼ぶときに渡す（st.cache_resource をそのスレッドで引かない）。
+    """
+    api = api or get_api_client("chat")
+    tokens = estimate_chat_tokens(chat_kwargs.get("messages", []), chat_kwargs.get("max_completion_tokens", 0))
+
+    def stream_once() -> ChatResult:
+        t0 = time.perf_counter()
+        raw = client.chat.completions.with_raw_response.create(
+            stream=True, stream_options={"include_usage": True}, **chat_kwargs
+        )
+        res = ChatResult(model=chat_kwargs.get("model", ""), request_id=raw.headers.get("x-request-id"),
+                         headers=raw.headers)
+        parts: List[str] = []
+        last_emit = 0.0
+        stream = raw.parse()
+        try:
+            for chunk in stream:
+                if cancel is not None and cancel.is_set():
+                    raise JobCancelled()
+                if getattr(chunk, "usage", None) is not None:
+                    res.usage = _usage_dict(chunk.usage)
+                for choice in chunk.choices or []:
+                    if choice.delta is not None and choice.delta.content:
+                        parts.append(choice.delta.content)
+                    if choice.finish_reason:
+                        res.finish_reason = choice.finish_reason
+                if on_text is not None and parts and time.monotonic() - last_emit >= PARTIAL_EMIT_SEC:
+                    on_text("".join(parts))   # 毎回連結すると長文で重いので間引く
+                    last_emit = time.monotonic()
+        finally:
+            stream.close()
+        res.text = "".join(parts)
+        if on_text is not None:
+            on_text(res.text)
+        res.elapsed = time.perf_counter() - t0
+        return res
+
+    return api.call_sync(stream_once, tokens=tokens, cancel=cancel)
+
+
+def chat_job(ctx, client, api: AsyncAPIClient, chat_kwargs: Dict[str, Any]) -> ChatResult:
+    """lib/job_queue 用：chat_completion() の途中経過を ctx に流し、ジョブの中止で止める。"""
+    return chat_completion(client, on_text=ctx.partial, cancel=ctx.cancel_event, api=api, **chat_kwargs)
+
+
+# ---------- デバッグ表示 ----------
+def rate_stats() -> List[dict]:
+    """エンドポイントごとの累計（送信数・再送・429・待ち時間）と現在の設定。"""
+    rows = []
+    for name in API_RATE_LIMITS:
+        api = get_api_client(name)
+        s = api.stats
+        rows.append({
+            "エンドポイント": name,
+            "呼び出し": s.calls,
+            "送信": s.attempts,
+            "再送": s.retries,
+            "429": s.throttled,
+            "失敗": s.failures,
+            "待ち時間": f"{s.waited_sec:.1f}s",
+            "設定": f"rpm={api.limiter.requests.per_minute:.0f}, tpm={api.limiter.tokens.per_minute:.0f}, "
+                    f"同時={api.concurrency}",
+        })
+    return rows
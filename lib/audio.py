@@ -3,68 +3,136 @@
 # get_audio_duration_seconds(uploaded_file)
 # ------------------------------------------------------------
 # アップロードされた音声ファイルの再生時間（秒）を推定して返す関数。
-# 複数のライブラリを順番に試し、どれも失敗した場合は None を返す。
+# 複数の手段を順番に試し、どれも失敗した場合は None を返す。
 #
 # 【処理の流れ】
-# 1) mutagen
+# 0) メモ化
+#    - アップロードの file_id（無ければ サイズ＋先頭・末尾の SHA-256）をキーに結果を覚えておき、
+#      同じ音声は再計算しない（Streamlit の再実行・ページ間の移動で何度も呼ばれるため）。
+#      全体のハッシュは取らない（数百 MB のアップロードでもプローブ前に全体を読まない）。
+#
+# 1) ヘッダのみのプローブ（lib/duration_probe）
+#    - WAV の fmt/data、MP3 の Xing/VBRI（無ければ CBR 推定）、MP4 の mvhd、
+#      Ogg の最終 granule、FLAC の STREAMINFO を、必要な位置だけ読んで計算。
+#
+# 2) mutagen
 #    - mutagen.File() でファイルを解析し、メタ情報 (info.length) があれば返す。
 #    - MP3, AAC, FLAC など多くの形式に対応。
 #
-# 2) wave（WAV専用）
-#    - ファイル名が .wav の場合にのみ実行。
-#    - wave.open() でフレーム数とサンプリングレートを取得し、
-#      duration = frames / rate で秒数を計算。
+# 3) PyAV（lib/audio_io, 任意依存）
+#    - メモリ上のバイト列をそのままプロセス内で開き、コンテナの duration を返す。
 #
-# 3) audioread
+# 4) audioread
 #    - 一時ファイルに保存してから audioread.audio_open() で開き、
-#      duration 属性があれば返す。
-#    - 多くの形式（FFmpegバックエンドなど）に対応。
+#      duration 属性があれば返す（最後の手段。全体を書き出すので重い）。
 #
-# 4) 全ての方法で失敗した場合
+# 5) 全ての方法で失敗した場合
 #    - None を返す。
 #
 # 【特徴】
+# - 入力は UploadedFile / BytesIO / bytes など。ファイル名（.name）は不要。
+# - ディスク上のファイルは probe_buffer_seconds(mmap) で直接プローブできる
+#   （フォルダ見積り lib/preflight はパス＋mtime＋サイズでキャッシュするので、内容ハッシュは取らない）。
+# - 1)〜3) はアップロードのバッファを memoryview で共有し、全体のコピーを作らない
+#   （mutagen / PyAV には読んだ分だけコピーする読み取り専用ファイルとして渡す）。
 # - 例外が発生しても握りつぶし、次の手段にフォールバックする安全設計。
-# - 複数の形式に対応できる「汎用的な音声長取得ユーティリティ」。
 # ============================================================
 
+from __future__ import annotations
 
 import io
 import os
 import tempfile
+import threading
+from collections import OrderedDict
 
-def get_audio_duration_seconds(uploaded_file) -> float | None:
+from lib.content_hash import content_key
+from lib.duration_probe import header_duration_seconds
+
+DURATION_MEMO_SIZE = 256
+MEMO_HEAD_TAIL_BYTES = 64 << 10  # file_id が無いときのキー：先頭・末尾のこのバイト数＋サイズ
+_duration_memo: "OrderedDict[str, float | None]" = OrderedDict()
+_memo_lock = threading.Lock()
+
+
+class _BufferReader(io.RawIOBase):
+    """bytes-like を読み取り専用・シーク可能なファイルとして見せる（コピーは読んだ分だけ）。"""
+
+    def __init__(self, buf):
+        self._mv = memoryview(buf).cast("B")
+        self._pos = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def readinto(self, b) -> int:
+        n = max(0, min(len(b), len(self._mv) - self._pos))
+        b[:n] = self._mv[self._pos:self._pos + n]
+        self._pos += n
+        return n
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        base = {io.SEEK_SET: 0, io.SEEK_CUR: self._pos, io.SEEK_END: len(self._mv)}[whence]
+        self._pos = max(0, base + offset)
+        return self._pos
+
+    def tell(self) -> int:
+        return self._pos
+
+
+def _buffer_of(uploaded_file):
+    """UploadedFile / BytesIO は getbuffer()（コピーなし）、bytes-like はそのまま。"""
+    if hasattr(uploaded_file, "getbuffer"):
+        return uploaded_file.getbuffer()
+    if hasattr(uploaded_file, "read"):
+        pos = uploaded_file.tell() if hasattr(uploaded_file, "tell") else None
+        data = uploaded_file.read()
+        if pos is not None:
+            uploaded_file.seek(pos)
+        return data
+    return uploaded_file
+
+
+def probe_buffer_seconds(buf, name: str = "") -> float | None:
     """
-    mutagen → wave（WAV） → audioread の順で音声長（秒）を推定。
-    どれも失敗なら None。
+    bytes-like（getbuffer() / mmap など）の音声長（秒）。メモ化なし。
+    name は audioread の一時ファイルの拡張子にだけ使う（無くてもよい）。
     """
-    # 1) mutagen
+    # 1) ヘッダのみ
+    try:
+        sec = header_duration_seconds(buf)
+        if sec:
+            return float(sec)
+    except Exception:
+        pass
+
+    # 2) mutagen
     try:
         from mutagen import File as MutagenFile
-        f = MutagenFile(io.BytesIO(uploaded_file.getbuffer()))
+        f = MutagenFile(_BufferReader(buf))
         if getattr(f, "info", None) and getattr(f.info, "length", None):
             return float(f.info.length)
     except Exception:
         pass
 
-    # 2) wave（WAVのみ）
+    # 3) PyAV（プロセス内。入っていなければスキップ）
     try:
-        import wave, contextlib
-        if uploaded_file.name.lower().endswith(".wav"):
-            with contextlib.closing(wave.open(io.BytesIO(uploaded_file.getbuffer()))) as wf:
-                frames = wf.getnframes()
-                rate = wf.getframerate()
-                if rate > 0:
-                    return frames / float(rate)
+        from lib.audio_io import probe_duration_seconds
+        sec = probe_duration_seconds(io.BufferedReader(_BufferReader(buf)))
+        if sec:
+            return float(sec)
     except Exception:
         pass
 
-    # 3) audioread
+    # 4) audioread
     try:
         import audioread
-        suffix = os.path.splitext(uploaded_file.name)[1] or ".tmp"
+        suffix = os.path.splitext(name)[1] or ".tmp"
         with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as tmp:
-            tmp.write(uploaded_file.getbuffer())
+            tmp.write(buf)
             tmp_path = tmp.name
         try:
             with audioread.audio_open(tmp_path) as af:
@@ -79,3 +147,34 @@ def get_audio_duration_seconds(uploaded_file) -> float | None:
         pass
 
     return None
+
+
+def _memo_key(uploaded_file, buf) -> str:
+    """メモのキー。UploadedFile なら file_id、それ以外はサイズ＋先頭・末尾のハッシュ（小さければ全体）。"""
+    fid = getattr(uploaded_file, "file_id", None)
+    if fid:
+        return f"id:{fid}"
+    mv = memoryview(buf).cast("B")
+    if len(mv) <= 2 * MEMO_HEAD_TAIL_BYTES:
+        return content_key(mv)
+    return f"ht:{len(mv)}:{content_key(mv[:MEMO_HEAD_TAIL_BYTES])}:{content_key(mv[-MEMO_HEAD_TAIL_BYTES:])}"
+
+
+def get_audio_duration_seconds(uploaded_file) -> float | None:
+    """
+    ヘッダのみ → mutagen → PyAV → audioread の順で音声長（秒）を推定。
+    結果は file_id（またはサイズ＋先頭・末尾のハッシュ）でメモ化。どれも失敗なら None。
+    """
+    buf = _buffer_of(uploaded_file)
+    key = _memo_key(uploaded_file, buf)
+    with _memo_lock:
+        if key in _duration_memo:
+            _duration_memo.move_to_end(key)
+            return _duration_memo[key]
+
+    sec = probe_buffer_seconds(buf, getattr(uploaded_file, "name", "") or "")
+    with _memo_lock:
+        _duration_memo[key] = sec
+        while len(_duration_memo) > DURATION_MEMO_SIZE:
+            _duration_memo.popitem(last=False)
+    return sec
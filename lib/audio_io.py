@@ -0,0 +1,185 @@
+# lib/audio_io.py
+# ============================================================
+# 音声のデコード／エンコード（PyAV でプロセス内実行・pydub へフォールバック）
+# ------------------------------------------------------------
+# pydub は from_file() / export() のたびに ffmpeg を起動し、パイプ・一時ファイル
+# 経由でデータをやり取りする。短いチャンクを大量に書き出すと、この起動コストが
+# 支配的になる。PyAV（libav のバインディング）が入っていれば同じ処理を
+# プロセス内で行う。
+#
+# - decode()                 : ファイル/バイト列 → AudioSegment（PCM は s16 に揃える）
+# - export_bytes()           : AudioSegment → エンコード済みバイト列（pydub の export と同じ引数）
+# - probe_duration_seconds() : コンテナのヘッダから再生時間（秒）
+#
+# decode() / export_bytes() の backend は既定（None）で自動選択。"av" / "pydub" を渡すと
+# その実装だけを使い、フォールバックしない（ベンチマーク・比較用）。
+#
+# 【使い分け・フォールバック】
+# - WAV（PCM）は pydub 自身が wave モジュールで読み書きする（ffmpeg を起動しない）ので、
+#   PyAV より速い pydub をそのまま使う。
+# - PyAV が無い / 未対応の形式・引数 / PyAV 側で失敗 → pydub（ffmpeg 起動）で処理する。
+# ============================================================
+from __future__ import annotations
+
+import io
+import os
+from typing import Optional
+
+try:
+    import av  # PyAV（任意依存）
+except Exception:  # ImportError だけでなく、共有ライブラリの読み込み失敗も含む
+    av = None
+
+import numpy as np
+
+from lib.size_plan import parse_bitrate
+
+# pydub の format → (PyAV の muxer, 既定のエンコーダ)
+AV_CONTAINERS = {
+    "mp3": ("mp3", "libmp3lame"),
+    "wav": ("wav", "pcm_s16le"),
+    "opus": ("opus", "libopus"),
+    "ogg": ("ogg", "libvorbis"),
+    "flac": ("flac", "flac"),
+}
+# export_bytes() が PyAV で扱える export 引数（これ以外が来たら pydub に任せる）
+AV_EXPORT_KEYS = frozenset({"format", "codec", "bitrate"})
+# pydub がプロセス内で処理できる形式（PyAV を使わない）
+PYDUB_NATIVE_FORMATS = frozenset({"wav"})
+
+
+BACKENDS = ("av", "pydub")
+
+
+def backend_name() -> str:
+    return "pyav" if av is not None else "pydub"
+
+
+def _check_backend(backend: Optional[str]) -> None:
+    if backend is not None and backend not in BACKENDS:
+        raise ValueError(f"backend は {BACKENDS} のいずれか: {backend!r}")
+    if backend == "av" and av is None:
+        raise RuntimeError("PyAV がインストールされていません（pip install av）")
+
+
+def _rewind(src) -> None:
+    if hasattr(src, "seek"):
+        try:
+            src.seek(0)
+        except Exception:
+            pass
+
+
+def _as_av_input(src):
+    """av.open() に渡せる形に（パス・ファイルオブジェクトはそのまま、bytes-like は BytesIO に包む）。"""
+    if isinstance(src, (str, os.PathLike)) or hasattr(src, "read"):
+        return src
+    return io.BytesIO(src)
+
+
+# ---------- デコード ----------
+def _decode_av(src):
+    from pydub import AudioSegment
+
+    chunks = []
+    with av.open(_as_av_input(src), mode="r") as container:
+        stream = container.streams.audio[0]
+        channels = stream.channels or 1
+        rate = stream.rate
+        layout = "mono" if channels == 1 else "stereo" if channels == 2 else stream.layout.name
+        resampler = av.AudioResampler(format="s16", layout=layout, rate=rate)
+        for frame in container.decode(stream):
+            for out in resampler.resample(frame):
+                chunks.append(out.to_ndarray().tobytes())
+        for out in resampler.resample(None):
+            chunks.append(out.to_ndarray().tobytes())
+    return AudioSegment(data=b"".join(chunks), sample_width=2, frame_rate=rate, channels=channels)
+
+
+def decode(src, format: Optional[str] = None, backend: Optional[str] = None):
+    """src（パス / ファイルオブジェクト / bytes-like）を AudioSegment に。backend は冒頭の説明を参照。"""
+    _check_backend(backend)
+    if backend == "av":
+        return _decode_av(src)
+    if backend is None and av is not None and format not in PYDUB_NATIVE_FORMATS:
+        try:
+            return _decode_av(src)
+        except Exception:
+            _rewind(src)
+    from pydub import AudioSegment
+
+    if not isinstance(src, (str, os.PathLike)) and not hasattr(src, "read"):
+        src = io.BytesIO(src)
+    return AudioSegment.from_file(src, format=format)
+
+
+# ---------- エンコード ----------
+def _encode_av(seg, fmt: str, codec: Optional[str], bitrate: Optional[str]) -> bytes:
+    muxer, default_codec = AV_CONTAINERS[fmt]
+    if seg.sample_width != 2:
+        seg = seg.set_sample_width(2)
+    layout = "mono" if seg.channels == 1 else "stereo"
+    pcm = np.frombuffer(seg.raw_data, dtype=np.int16)
+
+    buf = io.BytesIO()
+    with av.open(buf, mode="w", format=muxer) as container:
+        stream = container.add_stream(codec or default_codec, rate=seg.frame_rate)
+        stream.layout = layout
+        if bitrate:
+            stream.bit_rate = parse_bitrate(bitrate)
+        # 1 秒ずつ渡す（フレームサイズへの詰め直しは PyAV 側で行われる）
+        step = seg.frame_rate * seg.channels
+        for pos in range(0, len(pcm), step):
+            frame = av.AudioFrame.from_ndarray(pcm[pos:pos + step].reshape(1, -1), format="s16", layout=layout)
+            frame.sample_rate = seg.frame_rate
+            for packet in stream.encode(frame):
+                container.mux(packet)
+        for packet in stream.encode(None):
+            container.mux(packet)
+    return buf.getvalue()
+
+
+def export_bytes(seg, export_kwargs: dict, backend: Optional[str] = None) -> bytes:
+    """
+    pydub の seg.export(**export_kwargs) と同じ結果のバイト列を返す（可能なら PyAV で）。
+    backend="av" は PyAV だけでエンコードする（codec / bitrate 以外の引数は無視）。
+    """
+    _check_backend(backend)
+    fmt = export_kwargs.get("format", "mp3")
+    if backend == "av":
+        return _encode_av(seg, fmt, export_kwargs.get("codec"), export_kwargs.get("bitrate"))
+    use_av = (
+        backend is None
+        and av is not None
+        and fmt in AV_CONTAINERS
+        and fmt not in PYDUB_NATIVE_FORMATS
+        and set(export_kwargs) <= AV_EXPORT_KEYS
+        and seg.channels <= 2
+    )
+    if use_av:
+        try:
+            return _encode_av(seg, fmt, export_kwargs.get("codec"), export_kwargs.get("bitrate"))
+        except Exception:
+            pass
+    buf = io.BytesIO()
+    seg.export(buf, **export_kwargs)
+    return buf.getvalue()
+
+
+# ---------- 再生時間 ----------
+def probe_duration_seconds(src) -> Optional[float]:
+    """PyAV でコンテナ（無ければ音声ストリーム）の duration を読む。PyAV が無い・失敗なら None。"""
+    if av is None:
+        return None
+    try:
+        with av.open(_as_av_input(src), mode="r") as container:
+            if container.duration:
+                return container.duration / av.time_base
+            stream = container.streams.audio[0]
+            if stream.duration and stream.time_base:
+                return float(stream.duration * stream.time_base)
+    except Exception:
+        pass
+    finally:
+        _rewind(src)
+    return None
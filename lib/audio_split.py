@@ -0,0 +1,208 @@
+# lib/audio_split.py
+# ============================================================
+# 音声分割の共通ロジック（pages/01_音声ファイル分割.py から切り出し）
+# ------------------------------------------------------------
+# - ChunkPlan             : 1 チャンク分の計画（start/end/fade のみ。サンプルは持たない）
+# - plan_ranges()         : 長さ(ms)だけから (start_ms, end_ms) の分割計画を作る
+# - plan_silence_ranges() : 目標長の手前 tolerance 内で最も静かな位置に境界を寄せる
+# - billed_minutes()      : 分割計画の課金対象分数（オーバーラップ重複を含む）
+# - split_with_overlap()  : AudioSegment に対する分割計画（ChunkPlan のリスト）を返す
+# - build_index_csv()     : ZIP に同梱するインデックス CSV を組み立てる
+#
+# 分割計画は「音声長(ms)」だけで決まるため、デコードしない
+# コピー分割（lib/stream_copy.py）でも同じ start_ms/end_ms を得られる。
+# サンプルの切り出しは ChunkPlan.materialize() でエンコード直前に 1 チャンクずつ行う。
+# ============================================================
+from __future__ import annotations
+
+import csv
+import io
+from datetime import timedelta
+from typing import Callable, List, Tuple
+
+import numpy as np
+
+from lib.envelope import ENVELOPE_WIN_MS, envelope_from_segment, quietest_offset_ms
+
+
+def hhmmss(ms: int) -> str:
+    return str(timedelta(milliseconds=ms)).split(".")[0]
+
+
+class ChunkPlan:
+    """1 チャンク分の分割計画。プレビューや CSV はこれだけで作れる（サンプルに触れない）。"""
+
+    __slots__ = ("start_ms", "end_ms", "nominal_end_ms", "fade_ms")
+
+    def __init__(self, start_ms: int, end_ms: int, nominal_end_ms: int | None = None, fade_ms: int = 0):
+        self.start_ms = start_ms
+        self.end_ms = end_ms
+        self.nominal_end_ms = end_ms if nominal_end_ms is None else nominal_end_ms
+        self.fade_ms = fade_ms
+
+    @property
+    def duration_ms(self) -> int:
+        return self.end_ms - self.start_ms
+
+    def materialize(self, audio):
+        """audio からこのチャンクを切り出し（フェード付き）、AudioSegment を返す。"""
+        seg = audio[self.start_ms:self.end_ms]
+        if self.fade_ms > 0 and len(seg) > self.fade_ms * 2:
+            seg = seg.fade_in(self.fade_ms).fade_out(self.fade_ms)
+        return seg
+
+    def __repr__(self) -> str:
+        return f"ChunkPlan({self.start_ms}, {self.end_ms}, nominal_end_ms={self.nominal_end_ms}, fade_ms={self.fade_ms})"
+
+
+def plan_ranges(total_ms: int, chunk_ms: int, overlap_ms: int, absorb_tiny_tail: bool) -> List[Tuple[int, int]]:
+    """
+    overlap を含めた (start_ms, end_ms) のリストを返す。サンプルには触れない。
+    最後の短すぎる尻尾（overlap 未満）は前チャンクに吸収（オプション）。
+    """
+    if chunk_ms <= 0:
+        raise ValueError("chunk_ms must be > 0")
+    if overlap_ms < 0:
+        raise ValueError("overlap_ms must be >= 0")
+    if overlap_ms >= chunk_ms:
+        raise ValueError("overlap_ms must be < chunk_ms")
+
+    ranges: List[Tuple[int, int]] = []
+    step = max(1, chunk_ms - overlap_ms)  # 次の開始位置
+
+    start = 0
+    while start < total_ms:
+        end = min(start + chunk_ms, total_ms)
+
+        # 短すぎる最後の尻尾（例： overlap 以下）を、前チャンクに吸収して重複を増やさない
+        if absorb_tiny_tail and start > 0 and end == total_ms:
+            if end - start < overlap_ms:
+                prev_start, _ = ranges[-1]
+                ranges[-1] = (prev_start, total_ms)
+                break
+
+        ranges.append((start, end))
+
+        if end == total_ms:
+            break
+        start += step
+
+    return ranges
+
+
+def plans_from_ranges(ranges, fade_ms: int = 0) -> List[ChunkPlan]:
+    return [ChunkPlan(start, end, fade_ms=fade_ms) for start, end in ranges]
+
+
+def plan_silence_ranges(
+    total_ms: int,
+    chunk_ms: int,
+    overlap_ms: int,
+    tolerance_ms: int,
+    envelope_fn: Callable[[int, int], np.ndarray],
+    absorb_tiny_tail: bool = True,
+    win_ms: int = ENVELOPE_WIN_MS,
+    fade_ms: int = 0,
+    strict_max: bool = False,
+) -> List[ChunkPlan]:
+    """
+    無音寄せの分割計画。各チャンクは「開始 + chunk_ms」（= 公称の切れ目）を上限とし、
+    その手前 tolerance_ms の範囲で最も静かな位置で切る。次のチャンクは切れ目の overlap_ms 手前から。
+    envelope_fn(a_ms, b_ms) は a_ms（win_ms の倍数）から b_ms までの RMS 包絡を返すこと。
+    strict_max=True（サイズ上限から chunk_ms を決めた場合）は、尻尾を吸収しても chunk_ms を超えないときだけ吸収する。
+    戻り値: list[ChunkPlan]
+    """
+    if chunk_ms <= 0:
+        raise ValueError("chunk_ms must be > 0")
+    if overlap_ms < 0:
+        raise ValueError("overlap_ms must be >= 0")
+    if tolerance_ms < 0 or overlap_ms + tolerance_ms >= chunk_ms:
+        raise ValueError("overlap_ms + tolerance_ms must be < chunk_ms")
+
+    parts: List[ChunkPlan] = []
+    start = 0
+    while start < total_ms:
+        nominal_end = start + chunk_ms
+        if nominal_end >= total_ms:
+            parts.append(ChunkPlan(start, total_ms, fade_ms=fade_ms))
+            break
+
+        lo = (nominal_end - tolerance_ms) // win_ms * win_ms
+        lo = max(lo, start + overlap_ms + win_ms)
+        cut = min(nominal_end, lo + quietest_offset_ms(envelope_fn(lo, nominal_end), win_ms))
+        parts.append(ChunkPlan(start, cut, nominal_end, fade_ms))
+        start = cut - overlap_ms
+
+    # 短すぎる最後の尻尾は前チャンクに吸収（前チャンクは最大 tolerance 程度まで長くなる）
+    if absorb_tiny_tail and len(parts) > 1:
+        fits = not strict_max or total_ms - parts[-2].start_ms <= chunk_ms
+        if parts[-1].duration_ms < max(overlap_ms, tolerance_ms) and fits:
+            parts.pop()
+            parts[-1].end_ms = total_ms
+            parts[-1].nominal_end_ms = total_ms
+
+    return parts
+
+
+def billed_minutes(parts) -> float:
+    """各チャンクを個別に文字起こしした場合の課金対象分数（重複部分は二重に数える）。"""
+    return sum(p.duration_ms for p in parts) / 60_000
+
+
+def chunk_filename(base_name: str, i: int, p: ChunkPlan, ext: str) -> str:
+    """例: talk_part003_001800-002400.mp3"""
+    start_tag = hhmmss(p.start_ms).replace(":", "")
+    end_tag = hhmmss(p.end_ms).replace(":", "")
+    return f"{base_name}_part{i:03d}_{start_tag}-{end_tag}.{ext}"
+
+
+def split_with_overlap(
+    audio,
+    chunk_ms: int,
+    overlap_ms: int,
+    fade_ms: int,
+    absorb_tiny_tail: bool,
+    snap_tolerance_ms: int = 0,
+    strict_max: bool = False,
+) -> List[ChunkPlan]:
+    """
+    overlap を含めて分割計画を作る。最後の短すぎる尻尾は吸収（オプション）。
+    snap_tolerance_ms > 0 なら境界を無音付近に寄せる（plan_silence_ranges。strict_max はそちらへ）。
+    サンプルは切り出さない。必要になった時点で ChunkPlan.materialize(audio) を呼ぶこと。
+    """
+    if snap_tolerance_ms > 0:
+        env = envelope_from_segment(audio, ENVELOPE_WIN_MS)
+        return plan_silence_ranges(
+            len(audio), chunk_ms, overlap_ms, snap_tolerance_ms,
+            envelope_fn=lambda a, b: env[a // ENVELOPE_WIN_MS: -(-b // ENVELOPE_WIN_MS)],
+            absorb_tiny_tail=absorb_tiny_tail,
+            fade_ms=fade_ms,
+            strict_max=strict_max,
+        )
+    return plans_from_ranges(plan_ranges(len(audio), chunk_ms, overlap_ms, absorb_tiny_tail), fade_ms)
+
+
+def build_index_csv(parts, sizes=None, offset_map=None) -> str:
+    """
+    分割計画（ChunkPlan の列）からインデックス CSV 文字列を作る。
+    nominal_end_ms は固定長で切った場合の切れ目（無音寄せしていなければ end_ms と同じ）。
+    sizes（書き出し後のバイト数）を渡すと bytes 列を追加する。
+    offset_map（lib.vad.OffsetMap：無音カット済みの場合）を渡すと、元の録音での
+    orig_start_ms / orig_end_ms 列を追加する。
+    """
+    index_csv = io.StringIO()
+    writer = csv.writer(index_csv)
+    header = ["part", "start_ms", "end_ms", "start_hhmmss", "end_hhmmss", "nominal_end_ms"]
+    if sizes is not None:
+        header.append("bytes")
+    if offset_map is not None:
+        header += ["orig_start_ms", "orig_end_ms"]
+    writer.writerow(header)
+    for i, p in enumerate(parts):
+        row = [i, p.start_ms, p.end_ms, hhmmss(p.start_ms), hhmmss(p.end_ms), p.nominal_end_ms]
+        if sizes is not None:
+            row.append(sizes[i])
+        if offset_map is not None:
+            row += [int(offset_map.to_original(p.start_ms)), int(offset_map.to_original(p.end_ms, end=True))]
+        writer.writerow(row)
+    return index_csv.getvalue()
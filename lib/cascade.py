@@ -0,0 +1,263 @@
+# lib/cascade.py
+# ============================================================
+# モデルのカスケード（安いモデルで全体 → 信頼度の低い区間だけ高精度モデルで再実行して差し替え）
+# ------------------------------------------------------------
+# ファイル全体を高精度モデル（gpt-4o-transcribe）で送ると、聞き取りやすい大半の区間にも高い単価を払う。
+# ここでは安いモデルの結果（lib/transcribe_chunks の ChunkResult。応答本文そのまま）から
+#   1) 低信頼の区間を探し（find_low_confidence）
+#        - verbose_json（whisper-1）: セグメントごとの avg_logprob / no_speech_prob / compression_ratio
+#        - セグメントが無いモデル   : 本文を WINDOW_CHARS の窓に分けて、窓ごとの圧縮率（繰り返し・ループ）と
+#                                     トークンの平均 logprob（gpt-4o 系に include[]=logprobs で頼む）で判定。
+#                                     圧縮率は本文が長いほど上がるので、チャンク全体では判定しない。
+#                                     時刻は文字位置からの比例で見積もる（余白は CASCADE_TEXT_PAD_MS と広め）
+#   2) 近い区間をまとめ、前後に余白を足し（CASCADE_MERGE_GAP_MS / CASCADE_PAD_MS / CASCADE_MIN_RANGE_MS）
+#   3) 呼び出し側がその区間だけを高精度モデルで文字起こしし、
+#   4) stitch_cascade() で差し替える
+#        - セグメント単位: 連結後のセグメントのうち中心が区間内のものを、区間 1 つ分のセグメント（高精度モデルの本文）に置き換え
+#        - 本文だけ      : チャンクの本文の該当文字範囲に差し込む（前後の余白の重なりを lib/stitch で照合）
+# 再実行に失敗した区間は安いモデルの結果のまま残す。
+# ============================================================
+from __future__ import annotations
+
+import bisect
+import dataclasses
+import json
+import zlib
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from config.config import (
+    CASCADE_MAX_COMPRESSION_RATIO,
+    CASCADE_MAX_NO_SPEECH_PROB,
+    CASCADE_MERGE_GAP_MS,
+    CASCADE_MIN_AVG_LOGPROB,
+    CASCADE_MIN_RANGE_MS,
+    CASCADE_PAD_MS,
+    CASCADE_TEXT_PAD_MS,
+)
+from lib.stitch import Piece, Segment, StitchResult, stitch_texts
+from lib.transcribe_chunks import ChunkResult, parse_response, stitch
+
+WINDOW_CHARS = 200        # 本文だけのモデルは、この長さの窓ごとに判定する
+WINDOW_STEP_CHARS = 100   # 窓をずらす幅（窓の境界をまたぐループも拾う）
+
+
+@dataclass
+class CascadeRange:
+    """
+    高精度モデルで送り直す区間（送信音声の時刻 ms）。
+    chunk_index / chars があれば本文だけのチャンクの一部（chars はそのチャンクの本文中の文字範囲）。
+    """
+    start_ms: int
+    end_ms: int
+    reasons: Tuple[str, ...] = ()
+    chunk_index: Optional[int] = None
+    chars: Optional[Tuple[int, int]] = None
+
+    @property
+    def duration_ms(self) -> int:
+        return self.end_ms - self.start_ms
+
+
+def compression_ratio(text: str) -> float:
+    """Whisper と同じ「UTF-8 のバイト数 ÷ zlib 圧縮後のバイト数」（繰り返しが多いほど大きい）。"""
+    b = text.encode("utf-8")
+    return len(b) / len(zlib.compress(b)) if b else 0.0
+
+
+def segment_reasons(seg: dict) -> Tuple[str, ...]:
+    """verbose_json のセグメント 1 つを判定し、低信頼の理由を返す（問題なければ空）。"""
+    text = str(seg.get("text", "")).strip()
+    reasons = []
+    lp = seg.get("avg_logprob")
+    if lp is not None and float(lp) < CASCADE_MIN_AVG_LOGPROB:
+        reasons.append("logprob")
+    ns = seg.get("no_speech_prob")
+    if ns is not None and float(ns) > CASCADE_MAX_NO_SPEECH_PROB and text:
+        reasons.append("無音")
+    cr = seg.get("compression_ratio")
+    cr = float(cr) if cr is not None else compression_ratio(text)
+    if cr > CASCADE_MAX_COMPRESSION_RATIO:
+        reasons.append("繰り返し")
+    return tuple(reasons)
+
+
+def _parse_json(r: ChunkResult) -> Optional[dict]:
+    try:
+        d = json.loads(r.text)
+    except ValueError:
+        return None
+    return d if isinstance(d, dict) else None
+
+
+def _token_positions(text: str, logprobs: Sequence[dict]) -> List[Tuple[int, float]]:
+    """include[]=logprobs の各トークンの (本文中の開始文字位置, logprob)。位置はバイト数の累計から求める。"""
+    char_at = []  # バイト位置 → 文字位置
+    for ci, ch in enumerate(text):
+        char_at.extend([ci] * len(ch.encode("utf-8")))
+    n_bytes = len(char_at)
+    toks, pos = [], 0
+    for t in logprobs:
+        b = t.get("bytes")
+        size = len(b) if isinstance(b, list) else len(str(t.get("token", "")).encode("utf-8"))
+        if t.get("logprob") is not None:
+            toks.append((pos, float(t["logprob"])))
+        pos += size
+    if not toks or not n_bytes:
+        return []
+    scale = n_bytes / pos if pos else 1.0  # トークンの合計と本文の長さがずれていても比例で合わせる
+    return [(char_at[min(n_bytes - 1, int(p * scale))], lp) for p, lp in toks]
+
+
+def text_windows(text: str, logprobs: Optional[Sequence[dict]] = None) -> List[Tuple[int, int, Tuple[str, ...]]]:
+    """
+    本文を WINDOW_CHARS の窓（WINDOW_STEP_CHARS ずつずらす）で判定し、低信頼の (開始文字, 終了文字, 理由) を返す。
+    重なる窓は 1 つにまとめる。窓の長さが一定なので、圧縮率のしきい値は本文の長さによらない。
+    """
+    n = len(text)
+    if n == 0:
+        return []
+    starts = list(range(0, max(0, n - WINDOW_CHARS) + 1, WINDOW_STEP_CHARS))
+    if starts[-1] + WINDOW_CHARS < n:
+        starts.append(n - WINDOW_CHARS)
+    toks = _token_positions(text, logprobs) if logprobs else []
+    tok_pos = [p for p, _ in toks]
+    out: List[Tuple[int, int, Tuple[str, ...]]] = []
+    for a in starts:
+        b = min(n, a + WINDOW_CHARS)
+        reasons = []
+        # 窓の半分に満たない短い本文は圧縮率が当てにならないので見ない
+        if b - a >= WINDOW_CHARS // 2 and compression_ratio(text[a:b]) > CASCADE_MAX_COMPRESSION_RATIO:
+            reasons.append("繰り返し")
+        lps = [lp for _, lp in toks[bisect.bisect_left(tok_pos, a):bisect.bisect_left(tok_pos, b)]]
+        if lps and sum(lps) / len(lps) < CASCADE_MIN_AVG_LOGPROB:
+            reasons.append("logprob")
+        if not reasons:
+            continue
+        if out and a <= out[-1][1]:
+            pa, _, pr = out[-1]
+            out[-1] = (pa, b, tuple(dict.fromkeys(pr + tuple(reasons))))
+        else:
+            out.append((a, b, tuple(reasons)))
+    return out
+
+
+def merge_ranges(
+    ranges: Sequence[CascadeRange],
+    total_ms: int,
+    gap_ms: int = CASCADE_MERGE_GAP_MS,
+    pad_ms: int = CASCADE_PAD_MS,
+    min_ms: int = CASCADE_MIN_RANGE_MS,
+) -> List[CascadeRange]:
+    """
+    余白を足し、短い区間を広げ、重なる・近い区間を 1 つにまとめる。
+    本文だけのチャンクの区間（余白は作るときに足し済み）は、同じチャンクの中でだけまとめる。
+    """
+    text_spans: List[CascadeRange] = []
+    for r in sorted((r for r in ranges if r.chunk_index is not None), key=lambda r: (r.chunk_index, r.start_ms)):
+        last = text_spans[-1] if text_spans else None
+        if last is not None and last.chunk_index == r.chunk_index and r.start_ms - last.end_ms <= gap_ms:
+            last.end_ms = max(last.end_ms, r.end_ms)
+            last.chars = (last.chars[0], max(last.chars[1], r.chars[1]))
+            last.reasons = tuple(dict.fromkeys(last.reasons + r.reasons))
+        else:
+            text_spans.append(dataclasses.replace(r))
+    spans: List[CascadeRange] = []
+    for r in sorted((r for r in ranges if r.chunk_index is None), key=lambda r: r.start_ms):
+        a, b = max(0, r.start_ms - pad_ms), min(total_ms, r.end_ms + pad_ms)
+        if b - a < min_ms:
+            mid = (a + b) // 2
+            a, b = max(0, mid - min_ms // 2), min(total_ms, mid + min_ms // 2)
+        if spans and a - spans[-1].end_ms <= gap_ms:
+            last = spans[-1]
+            last.end_ms = max(last.end_ms, b)
+            last.reasons = tuple(dict.fromkeys(last.reasons + r.reasons))
+        else:
+            spans.append(CascadeRange(a, b, r.reasons))
+    return sorted(text_spans + spans, key=lambda r: r.start_ms)
+
+
+def find_low_confidence(results: Sequence[ChunkResult], total_ms: Optional[int] = None) -> List[CascadeRange]:
+    """安いモデルの結果から、高精度モデルで送り直す区間を選ぶ（時刻は各チャンクの開始でずらした絶対時刻）。"""
+    ranges = []
+    for r in results:
+        if not r.ok:
+            continue
+        d = _parse_json(r)
+        segs = d.get("segments") if d is not None else None
+        if not isinstance(segs, list):
+            text = parse_response(r.text)[0]
+            dur, n = r.end_ms - r.start_ms, len(text)
+            for ca, cb, reasons in text_windows(text, (d or {}).get("logprobs")):
+                a, b = r.start_ms + dur * ca // n, r.start_ms + dur * cb // n
+                ranges.append(CascadeRange(max(r.start_ms, a - CASCADE_TEXT_PAD_MS), min(r.end_ms, b + CASCADE_TEXT_PAD_MS),
+                                           reasons, chunk_index=r.index, chars=(ca, cb)))
+            continue
+        for seg in segs:
+            reasons = segment_reasons(seg)
+            if reasons:
+                a = r.start_ms + int(round(float(seg["start"]) * 1000))
+                b = r.start_ms + int(round(float(seg["end"]) * 1000))
+                ranges.append(CascadeRange(max(r.start_ms, a), min(r.end_ms, max(a, b)), reasons))
+    end = total_ms if total_ms else max((r.end_ms for r in results), default=0)
+    return merge_ranges(ranges, end)
+
+
+def splice(res: StitchResult, replacements: Sequence[Tuple[int, int, str]]) -> StitchResult:
+    """連結後のセグメントのうち、中心が (start, end) に入るものを高精度モデルの本文 1 セグメントに置き換える。"""
+    if res.segments is None or not replacements:
+        return res
+    kept = [s for s in res.segments if not any(a <= s.mid_ms < b for a, b, _ in replacements)]
+    new = []
+    for a, b, text in replacements:
+        if not text:
+            continue  # 高精度モデルが何も聞き取らなかった区間（無音での幻聴など）は、安いモデルの文字を消すだけ
+        # 余白の分だけ前後に残したセグメントと時刻が重ならないよう、隣の境界で詰める
+        a2 = max([a] + [s.end_ms for s in kept if s.mid_ms < a])
+        b2 = min([b] + [s.start_ms for s in kept if s.mid_ms >= b])
+        new.append(Segment(a2, b2, text) if a2 < b2 else Segment(a, b, text))
+    segs = sorted(kept + new, key=lambda s: s.start_ms)
+    return dataclasses.replace(res, text="".join(s.text for s in segs), segments=segs)
+
+
+def splice_text(r: ChunkResult, replacements: Sequence[Tuple[CascadeRange, str]]) -> str:
+    """
+    本文だけのチャンクの各文字範囲を送り直した本文に差し替える。送り直した音声は前後に余白があるので、
+    「手前の本文 → 送り直し → 後ろの本文」を重なり付きの Piece として lib/stitch でつなぎ、重複を除く。
+    """
+    text = parse_response(r.text)[0]
+    dur, n = r.end_ms - r.start_ms, max(1, len(text))
+
+    def t_at(c: int) -> int:
+        return r.start_ms + dur * c // n
+
+    pieces, cursor = [], 0
+    for rg, new in sorted(replacements, key=lambda x: x[0].start_ms):
+        ca, cb = rg.chars
+        pieces.append(Piece(t_at(cursor), t_at(ca), text[cursor:ca]))
+        pieces.append(Piece(rg.start_ms, rg.end_ms, new))  # 空なら（何も聞き取れなかった）その範囲を消すだけ
+        cursor = cb
+    pieces.append(Piece(t_at(cursor), r.end_ms, text[cursor:]))
+    return stitch_texts(pieces, sep="").text
+
+
+def stitch_cascade(
+    results: Sequence[ChunkResult],
+    ranges: Sequence[CascadeRange],
+    refined: Sequence[ChunkResult],
+) -> StitchResult:
+    """安いモデルの結果を連結し、再実行に成功した区間（ranges と同じ並びの refined）を差し替える。"""
+    by_chunk: Dict[int, list] = {}
+    for rg, rr in zip(ranges, refined):
+        if rr.ok and rg.chunk_index is not None:
+            by_chunk.setdefault(rg.chunk_index, []).append((rg, parse_response(rr.text)[0].strip()))
+    base = [
+        dataclasses.replace(r, text=json.dumps({"text": splice_text(r, by_chunk[r.index])}, ensure_ascii=False))
+        if r.index in by_chunk else r
+        for r in results
+    ]
+    res = stitch(base)
+    return splice(res, [
+        (rg.start_ms, rg.end_ms, parse_response(rr.text)[0].strip())
+        for rg, rr in zip(ranges, refined) if rr.ok and rg.chunk_index is None
+    ])
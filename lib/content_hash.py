@@ -0,0 +1,36 @@
+# lib/content_hash.py
+# ============================================================
+# bytes-like の SHA-256（キャッシュ・メモ化のキー用）
+# ------------------------------------------------------------
+# memoryview をブロック単位で hashlib に渡すので、全体のコピーは作らない。
+# lib/decode_cache（ディスクキャッシュ）と lib/audio（再生時間のメモ）で共用。
+# upload_content_key() はアップロードごとの値を session_state に覚え、分割・文字起こしページで共用する。
+# ============================================================
+from __future__ import annotations
+
+import hashlib
+
+import streamlit as st
+
+HASH_BLOCK_BYTES = 4 << 20
+UPLOAD_KEY_MEMO = 4  # session_state に覚えておくアップロードの数（ページごとに別のファイルでも計算し直さない）
+
+
+def content_key(buf) -> str:
+    """bytes-like 全体の SHA-256（ブロック単位で計算し、コピーを作らない）。"""
+    mv = memoryview(buf).cast("B")
+    h = hashlib.sha256()
+    for pos in range(0, len(mv), HASH_BLOCK_BYTES):
+        h.update(mv[pos:pos + HASH_BLOCK_BYTES])
+    return h.hexdigest()
+
+
+def upload_content_key(uploaded) -> str:
+    """UploadedFile の SHA-256。同じアップロードに対する再実行では session_state のメモを使う。"""
+    memo = st.session_state.setdefault("_upload_sha256", {})
+    fid = getattr(uploaded, "file_id", None) or f"{uploaded.name}:{uploaded.size}"
+    if fid not in memo:
+        while len(memo) >= UPLOAD_KEY_MEMO:
+            memo.pop(next(iter(memo)))
+        memo[fid] = content_key(uploaded.getbuffer())
+    return memo[fid]
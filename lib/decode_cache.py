@@ -0,0 +1,218 @@
+# lib/decode_cache.py
+# ============================================================
+# アップロード内容の SHA-256 をキーにしたデコード／エンコード結果のディスクキャッシュ
+# ------------------------------------------------------------
+# Streamlit はサイドバーを触るたびにスクリプト全体を再実行するため、
+# そのままだと毎回 AudioSegment.from_file()（全体デコード）と全チャンクの
+# エンコードが走る。ここでは
+#   - デコード済み PCM : <root>/<sha256>/<variant>.pcm ＋ .json（フォーマット情報）
+#                        読み出しは mmap（必要なページだけ OS が読み込む）
+#   - エンコード済みチャンク : <root>/<sha256>/enc/<パラメータのハッシュ>.bin
+# をディスクに保存し、セッション・再起動をまたいで再利用する。
+#
+# 【容量管理】
+# - 合計サイズが max_bytes を超えたら、最終アクセス（mtime を touch で更新）が
+#   古いファイルから削除する（LRU）。
+# - ファイルごとのサイズとアクセス順はメモリ上の索引で持つ（起動時に 1 度だけ走査。
+#   保存のたびにディレクトリ全体を stat しない）。
+# - pcm_spool() で並列エンコードのワーカーに渡した PCM は、ワーカーがチャンクごとに
+#   開き直すので、unpin() されるまでそのキーのファイルは削除しない（pin の参照カウント）。
+# - 削除済みファイルを mmap 中でも Linux/macOS では読み続けられる。
+# ============================================================
+from __future__ import annotations
+
+import hashlib
+import json
+import mmap
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, Optional
+
+import streamlit as st
+
+from config.config import DECODE_CACHE_DIR, DECODE_CACHE_MAX_BYTES
+from lib.content_hash import HASH_BLOCK_BYTES, content_key
+from lib.encode_pool import PcmSpool
+
+
+def params_key(params: dict) -> str:
+    return hashlib.sha256(json.dumps(params, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()[:32]
+
+
+class DecodeCache:
+    def __init__(self, root: Path, max_bytes: int):
+        self.root = Path(root)
+        self.max_bytes = int(max_bytes)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._pins: Dict[str, int] = {}  # キー → 使用中の数（0 になるまで追い出さない）
+        # 索引：パス → サイズ（先頭ほど最終アクセスが古い）
+        self._files: "OrderedDict[Path, int]" = OrderedDict()
+        self._total = 0
+        found = []
+        for p in self.root.rglob("*"):
+            if p.is_file() and p.suffix != ".tmp":
+                try:
+                    st_ = p.stat()
+                except OSError:
+                    continue
+                found.append((st_.st_mtime, st_.st_size, p))
+        for _, size, p in sorted(found, key=lambda t: t[0]):
+            self._files[p] = size
+            self._total += size
+
+    # ---------- 内部ユーティリティ ----------
+    def _dir(self, key: str) -> Path:
+        return self.root / key
+
+    def _touch(self, path: Path) -> None:
+        try:
+            os.utime(path, None)
+        except OSError:
+            pass
+        with self._lock:
+            if path in self._files:
+                self._files.move_to_end(path)
+
+    def _record(self, path: Path) -> None:
+        """書き込んだファイルを索引に載せる（ロック内で呼ぶ）。"""
+        self._total -= self._files.pop(path, 0)
+        size = path.stat().st_size
+        self._files[path] = size
+        self._total += size
+
+    def _write_atomic(self, path: Path, chunks) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                for c in chunks:
+                    f.write(c)
+            os.replace(tmp, path)
+        except BaseException:
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+            raise
+
+    # ---------- デコード済み PCM ----------
+    def _pcm_paths(self, key: str, variant: str) -> tuple[Path, Path]:
+        d = self._dir(key)
+        return d / f"{variant}.pcm", d / f"{variant}.json"
+
+    def get_audio(self, key: str, variant: str):
+        """キャッシュ済みなら mmap を背後に持つ AudioSegment を返す。無ければ None。"""
+        pcm_path, meta_path = self._pcm_paths(key, variant)
+        try:
+            meta = json.loads(meta_path.read_text(encoding="utf-8"))
+            with open(pcm_path, "rb") as f:
+                data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if os.path.getsize(pcm_path) else b""
+        except (OSError, ValueError):
+            return None
+        self._touch(pcm_path)
+        self._touch(meta_path)
+
+        from pydub import AudioSegment
+        return AudioSegment(
+            data=data,
+            sample_width=meta["sample_width"],
+            frame_rate=meta["frame_rate"],
+            channels=meta["channels"],
+        )
+
+    def put_audio(self, key: str, variant: str, audio):
+        """audio の PCM を保存し、mmap 版の AudioSegment を返す（元のメモリ上の PCM は解放できる）。"""
+        pcm_path, meta_path = self._pcm_paths(key, variant)
+        raw = memoryview(audio.raw_data)
+        with self._lock:
+            self._write_atomic(pcm_path, (raw[i:i + HASH_BLOCK_BYTES] for i in range(0, len(raw), HASH_BLOCK_BYTES)))
+            meta = {"sample_width": audio.sample_width, "frame_rate": audio.frame_rate, "channels": audio.channels}
+            self._write_atomic(meta_path, [json.dumps(meta).encode("utf-8")])
+            self._record(pcm_path)
+            self._record(meta_path)
+            self._evict()
+        return self.get_audio(key, variant) or audio
+
+    def pcm_spool(self, key: str, variant: str) -> Optional[PcmSpool]:
+        """
+        キャッシュの PCM ファイルをそのまま並列エンコードのスプールとして使う（削除はしない）。
+        返したときはキーを pin 済み。使い終わったら unpin(key) を呼ぶこと。
+        """
+        pcm_path, meta_path = self._pcm_paths(key, variant)
+        self.pin(key)
+        try:
+            meta = json.loads(meta_path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            meta = None
+        if meta is None or not pcm_path.exists():
+            self.unpin(key)  # pin する前に追い出されていた
+            return None
+        self._touch(pcm_path)
+        return PcmSpool(str(pcm_path), meta["sample_width"], meta["frame_rate"], meta["channels"], owned=False)
+
+    def pin(self, key: str) -> None:
+        """key のファイルを使用中にする（unpin されるまで追い出さない。入れ子可）。"""
+        with self._lock:
+            self._pins[key] = self._pins.get(key, 0) + 1
+
+    def unpin(self, key: str) -> None:
+        with self._lock:
+            n = self._pins.get(key, 0) - 1
+            if n > 0:
+                self._pins[key] = n
+            else:
+                self._pins.pop(key, None)
+
+    # ---------- エンコード済みチャンク ----------
+    def _blob_path(self, key: str, params: dict) -> Path:
+        return self._dir(key) / "enc" / f"{params_key(params)}.bin"
+
+    def has_blob(self, key: str, params: dict) -> bool:
+        return self._blob_path(key, params).exists()
+
+    def get_blob(self, key: str, params: dict) -> Optional[bytes]:
+        path = self._blob_path(key, params)
+        try:
+            data = path.read_bytes()
+        except OSError:
+            return None
+        self._touch(path)
+        return data
+
+    def put_blob(self, key: str, params: dict, data: bytes) -> None:
+        with self._lock:
+            path = self._blob_path(key, params)
+            self._write_atomic(path, [data])
+            self._record(path)
+            self._evict()
+
+    # ---------- LRU 追い出し ----------
+    def total_bytes(self) -> int:
+        return self._total
+
+    def _evict(self) -> None:
+        """合計が max_bytes を超えていたら、最終アクセスが古いものから削除する（ロック内で呼ぶ。pin 中のキーは残す）。"""
+        if self._total <= self.max_bytes:
+            return
+        for p in list(self._files):
+            if self._total <= self.max_bytes:
+                break
+            if p.relative_to(self.root).parts[0] in self._pins:
+                continue
+            try:
+                p.unlink()
+            except FileNotFoundError:
+                pass  # 他で消された。索引から外すだけ
+            except OSError:
+                continue
+            self._total -= self._files.pop(p)
+
+
+@st.cache_resource
+def get_decode_cache() -> DecodeCache:
+    """プロセス内で共有する DecodeCache（全セッション共通）。"""
+    return DecodeCache(DECODE_CACHE_DIR, DECODE_CACHE_MAX_BYTES)
@@ -0,0 +1,163 @@
+# lib/duration_probe.py
+# ============================================================
+# コンテナのヘッダだけを読んで再生時間（秒）を求めるプローブ
+# ------------------------------------------------------------
+# 入力は bytes-like（UploadedFile.getbuffer() や mmap）。memoryview で参照し、
+# 必要な位置へ直接ジャンプして数十〜数百バイトだけを読む（全体のコピー・デコードなし）。
+#
+# - WAV  : fmt / data チャンク → data サイズ ÷ byte_rate
+# - MP3  : 先頭フレームの Xing/Info（フレーム数）→ VBRI（フレーム数）→ CBR とみなして
+#          音声部分のバイト数 ÷ ビットレート
+# - MP4  : moov/mvhd の duration ÷ timescale（moov が末尾にあってもボックス単位で飛ぶ）
+# - Ogg  : 末尾のページの granule position（Opus は 48kHz・pre-skip を差し引く、Vorbis は識別ヘッダのレート）
+# - FLAC : STREAMINFO の総サンプル数 ÷ サンプルレート
+#
+# 判定できない形式・壊れたヘッダは None（呼び出し側で mutagen 等にフォールバック）。
+# ============================================================
+from __future__ import annotations
+
+import struct
+from typing import Optional
+
+from lib.stream_copy import (
+    _MP3_BITRATES_V1,
+    _MP3_BITRATES_V2,
+    _parse_mp3_header,
+    _skip_id3v2,
+    parse_wav,
+)
+
+MP3_SYNC_SEARCH_BYTES = 64 << 10  # 先頭フレームを探す範囲（ID3v2 の後ろから）
+OGG_TAIL_BYTES = 64 << 10         # 最終ページを探す範囲（Ogg のページは最大 約 64KB）
+
+
+def _wav_seconds(mv) -> Optional[float]:
+    layout = parse_wav(mv)
+    if layout is None or layout.byte_rate <= 0:
+        return None
+    return layout.data_size / layout.byte_rate
+
+
+def _mp3_seconds(mv) -> Optional[float]:
+    end = len(mv)
+    if end >= 128 and bytes(mv[end - 128:end - 125]) == b"TAG":
+        end -= 128  # ID3v1
+
+    start = _skip_id3v2(mv)
+    limit = min(end, start + MP3_SYNC_SEARCH_BYTES)
+    pos = start
+    while pos + 4 <= limit:
+        hdr = _parse_mp3_header(mv, pos)
+        if hdr is not None:
+            nxt = _parse_mp3_header(mv, pos + hdr[2])
+            if pos + hdr[2] >= end or (nxt is not None and nxt[:2] == hdr[:2]):
+                break
+        pos += 1
+    else:
+        return None
+
+    version, sr, frame_len, samples = hdr
+    mono = (mv[pos + 3] >> 6) == 3
+    side_info = (17 if mono else 32) if version == 3 else (9 if mono else 17)
+
+    # Xing / Info（VBR・LAME の CBR）：フラグの bit0 が立っていればフレーム数あり
+    x = pos + 4 + side_info
+    if bytes(mv[x:x + 4]) in (b"Xing", b"Info"):
+        (flags,) = struct.unpack(">I", mv[x + 4:x + 8])
+        if flags & 1:
+            (frames,) = struct.unpack(">I", mv[x + 8:x + 12])
+            return frames * samples / sr
+    # VBRI（Fraunhofer）：ヘッダ直後から 32 byte の位置に固定
+    v = pos + 36
+    if bytes(mv[v:v + 4]) == b"VBRI":
+        (frames,) = struct.unpack(">I", mv[v + 14:v + 18])
+        return frames * samples / sr
+
+    # タグなし → CBR とみなして推定
+    kbps = (_MP3_BITRATES_V1 if version == 3 else _MP3_BITRATES_V2)[(mv[pos + 2] >> 4) & 0x0F]
+    return (end - pos) * 8 / (kbps * 1000) if kbps else None
+
+
+def _mp4_boxes(mv, pos: int, end: int):
+    """[pos, end) のボックスを (type, body_start, box_end) で列挙する。"""
+    while pos + 8 <= end:
+        size, typ = struct.unpack(">I4s", mv[pos:pos + 8])
+        hdr = 8
+        if size == 1:
+            if pos + 16 > end:
+                return
+            (size,) = struct.unpack(">Q", mv[pos + 8:pos + 16])
+            hdr = 16
+        elif size == 0:
+            size = end - pos
+        if size < hdr:
+            return
+        yield typ, pos + hdr, min(end, pos + size)
+        pos += size
+
+
+def _mp4_seconds(mv) -> Optional[float]:
+    for typ, body, box_end in _mp4_boxes(mv, 0, len(mv)):
+        if typ != b"moov":
+            continue
+        for sub, sbody, _ in _mp4_boxes(mv, body, box_end):
+            if sub != b"mvhd":
+                continue
+            if mv[sbody] == 1:
+                timescale, duration = struct.unpack(">IQ", mv[sbody + 20:sbody + 32])
+            else:
+                timescale, duration = struct.unpack(">II", mv[sbody + 12:sbody + 20])
+            return duration / timescale if timescale else None
+    return None
+
+
+def _ogg_seconds(mv) -> Optional[float]:
+    # 最初のページの最初のパケット（識別ヘッダ）からコーデックとレートを得る
+    n_segs = mv[26]
+    packet = bytes(mv[27 + n_segs:27 + n_segs + 64])
+    if packet.startswith(b"OpusHead"):
+        rate, pre_skip = 48000, struct.unpack("<H", packet[10:12])[0]
+    elif packet.startswith(b"\x01vorbis"):
+        rate, pre_skip = struct.unpack("<I", packet[12:16])[0], 0
+    else:
+        return None
+
+    tail_start = max(0, len(mv) - OGG_TAIL_BYTES)
+    last = bytes(mv[tail_start:]).rfind(b"OggS")
+    if last < 0 or rate <= 0:
+        return None
+    p = tail_start + last
+    (granule,) = struct.unpack("<q", mv[p + 6:p + 14])
+    return max(0, granule - pre_skip) / rate if granule >= 0 else None
+
+
+def _flac_seconds(mv) -> Optional[float]:
+    # "fLaC" の直後が STREAMINFO（メタデータブロックヘッダ 4 byte ＋ 本体）
+    info = bytes(mv[8:8 + 18])
+    if len(info) < 18:
+        return None
+    sr = (info[10] << 12) | (info[11] << 4) | (info[12] >> 4)
+    total = ((info[13] & 0x0F) << 32) | struct.unpack(">I", info[14:18])[0]
+    return total / sr if sr and total else None
+
+
+def header_duration_seconds(buf) -> Optional[float]:
+    """先頭のマジックで形式を判定し、ヘッダだけから再生時間（秒）を返す。判定できなければ None。"""
+    mv = memoryview(buf).cast("B")
+    if len(mv) < 12:
+        return None
+    magic = bytes(mv[0:12])
+    try:
+        if magic[0:4] == b"RIFF" and magic[8:12] == b"WAVE":
+            return _wav_seconds(mv)
+        if magic[4:8] == b"ftyp":
+            return _mp4_seconds(mv)
+        if magic[0:4] == b"OggS":
+            return _ogg_seconds(mv)
+        if magic[0:4] == b"fLaC":
+            return _flac_seconds(mv)
+        if magic[0:3] == b"ID3" or (magic[0] == 0xFF and (magic[1] & 0xE0) == 0xE0):
+            return _mp3_seconds(mv)
+    except (struct.error, IndexError, ValueError):
+        return None
+    return None
@@ -0,0 +1,113 @@
+# lib/encode_pool.py
+# ============================================================
+# チャンクの並列エンコード（ProcessPoolExecutor）
+# ------------------------------------------------------------
+# pydub の export() はチャンクごとに ffmpeg を起動するため、逐次実行だと
+# 1 コアしか使わない。ここでは
+#   1) デコード済み PCM を一時ファイル（生 PCM）に 1 回だけ書き出し（spool_pcm）
+#   2) 各ワーカーはファイルから自分の範囲だけを読み、AudioSegment を組み立てて export
+#   3) 結果（エンコード済みバイト列）を元の順序で返す（encode_chunks）
+# とする。ワーカーへ渡すのはパスと範囲だけで、AudioSegment は pickle しない。
+# 各プロセスが同時に持つ PCM は 1 チャンク分だけ。
+#
+# 【注意】
+# - Streamlit はマルチスレッドなので fork ではなく spawn でプロセスを起動する。
+# - workers <= 1 のときはプロセスを作らずその場で逐次エンコードする。
+# ============================================================
+from __future__ import annotations
+
+import multiprocessing as mp
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from typing import Iterable, Iterator
+
+from lib.audio_io import export_bytes
+
+SPOOL_BLOCK_BYTES = 8 << 20
+DEFAULT_ENCODE_WORKERS = max(1, min(4, os.cpu_count() or 1))
+
+
+@dataclass(frozen=True)
+class PcmSpool:
+    """一時ファイルに書き出した生 PCM（インターリーブ）の所在とフォーマット。"""
+    path: str
+    sample_width: int
+    frame_rate: int
+    channels: int
+    owned: bool = True  # False: 他（lib/decode_cache）が管理するファイル。remove() しない
+
+    @property
+    def frame_bytes(self) -> int:
+        return self.sample_width * self.channels
+
+    def byte_offset(self, ms: int) -> int:
+        return ms * self.frame_rate // 1000 * self.frame_bytes
+
+    def remove(self) -> None:
+        if not self.owned:
+            return
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+
+def spool_pcm(audio, dir: str | None = None) -> PcmSpool:
+    """AudioSegment の PCM を一時ファイルへ書き出す（呼び出し側で remove() すること）。"""
+    raw = memoryview(audio.raw_data)
+    with tempfile.NamedTemporaryFile(delete=False, suffix=".pcm", dir=dir) as tmp:
+        for pos in range(0, len(raw), SPOOL_BLOCK_BYTES):
+            tmp.write(raw[pos:pos + SPOOL_BLOCK_BYTES])
+        path = tmp.name
+    return PcmSpool(path, audio.sample_width, audio.frame_rate, audio.channels)
+
+
+def encode_range(spool: PcmSpool, start_ms: int, end_ms: int, fade_ms: int, export_kwargs: dict) -> bytes:
+    """spool の start_ms〜end_ms を読み出してエンコードする（ワーカー側で実行）。"""
+    from pydub import AudioSegment
+
+    a, b = spool.byte_offset(start_ms), spool.byte_offset(end_ms)
+    with open(spool.path, "rb") as f:
+        f.seek(a)
+        data = f.read(b - a)
+
+    seg = AudioSegment(
+        data=data,
+        sample_width=spool.sample_width,
+        frame_rate=spool.frame_rate,
+        channels=spool.channels,
+    )
+    # フェード（任意）
+    if fade_ms > 0 and len(seg) > fade_ms * 2:
+        seg = seg.fade_in(fade_ms).fade_out(fade_ms)
+    return export_bytes(seg, export_kwargs)  # PyAV があればプロセス内でエンコード。無ければ pydub → ffmpeg
+
+
+def encode_inline(audio, parts: Iterable, export_kwargs: dict) -> Iterator[bytes]:
+    """並列なし：1 チャンクずつ切り出し → エンコード（同時に持つスライスは 1 つだけ）。"""
+    for p in parts:
+        yield export_bytes(p.materialize(audio), export_kwargs)
+
+
+def encode_chunks(
+    spool: PcmSpool,
+    parts: Iterable,
+    export_kwargs: dict,
+    workers: int = DEFAULT_ENCODE_WORKERS,
+) -> Iterator[bytes]:
+    """parts（lib.audio_split.ChunkPlan の列）を並列にエンコードし、parts と同じ順序で返す。"""
+    ranges = [(p.start_ms, p.end_ms, p.fade_ms) for p in parts]
+    if workers <= 1 or len(ranges) <= 1:
+        for start, end, fade_ms in ranges:
+            yield encode_range(spool, start, end, fade_ms, export_kwargs)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers, mp_context=mp.get_context("spawn")) as ex:
+        futures = [
+            ex.submit(encode_range, spool, start, end, fade_ms, export_kwargs)
+            for start, end, fade_ms in ranges
+        ]
+        for fut in futures:
+            yield fut.result()
@@ -0,0 +1,134 @@
+# lib/envelope.py
+# ============================================================
+# 短時間窓のエネルギー包絡（RMS）を NumPy でベクトル計算するユーティリティ
+# ------------------------------------------------------------
+# - samples_from_segment() : pydub AudioSegment → モノラル float32 配列（-1.0〜1.0）
+# - rms_envelope()         : win_ms ごとの RMS（reshape して一括計算、Python ループなし）
+# - quietest_offset_ms()   : 包絡の中で最も静かな位置（窓中心, ms）を返す
+#
+# 分割境界を無音付近に寄せる（lib/audio_split.plan_silence_ranges）ために使う。
+#
+# 【ラウドネス索引（ZIP 同梱用）】
+# - loudness_envelope()           : res_ms ごとの min / max / RMS を int16 (n, 3) で返す
+# - loudness_envelope_streaming() : 長い音声を window_ms ずつデコードしながら計算（メモリ一定）
+# - envelope_to_npy_bytes() / envelope_from_npy_bytes() : .npy としての保存・読込
+# - silent_spans()                : 索引だけから無音区間を列挙（再デコード不要）
+# ============================================================
+from __future__ import annotations
+
+import io
+from typing import Callable, List, Tuple
+
+import numpy as np
+
+ENVELOPE_WIN_MS = 20      # 包絡の窓幅
+QUIET_SMOOTH_WINDOWS = 5  # 最小値探索前の移動平均（瞬間的な谷より「続く静けさ」を優先）
+
+LOUDNESS_RES_MS = 10            # ラウドネス索引の解像度
+LOUDNESS_WINDOW_MS = 300_000    # ストリーミング計算時に一度にデコードする長さ（5分）
+LOUDNESS_COLUMNS = ("min", "max", "rms")
+
+
+def samples_from_segment(audio) -> tuple[np.ndarray, int]:
+    """AudioSegment をモノラル float32 に変換して (samples, sample_rate) を返す。"""
+    raw = np.frombuffer(audio.raw_data, dtype={1: np.int8, 2: np.int16, 4: np.int32}[audio.sample_width])
+    full_scale = float(1 << (8 * audio.sample_width - 1))
+    x = raw.astype(np.float32) / full_scale
+    if audio.channels > 1:
+        x = x[: len(x) - len(x) % audio.channels].reshape(-1, audio.channels).mean(axis=1)
+    return x, audio.frame_rate
+
+
+def rms_envelope(samples: np.ndarray, sample_rate: int, win_ms: int = ENVELOPE_WIN_MS) -> np.ndarray:
+    """win_ms ごとの RMS。末尾の端数窓も 0 埋めして 1 窓として数える。"""
+    win = max(1, sample_rate * win_ms // 1000)
+    n_win = -(-len(samples) // win)
+    if n_win == 0:
+        return np.zeros(0, dtype=np.float32)
+    padded = np.zeros(n_win * win, dtype=np.float32)
+    padded[: len(samples)] = samples
+    frames = padded.reshape(n_win, win)
+    return np.sqrt(np.einsum("ij,ij->i", frames, frames) / win).astype(np.float32)
+
+
+def envelope_from_segment(audio, win_ms: int = ENVELOPE_WIN_MS) -> np.ndarray:
+    samples, sr = samples_from_segment(audio)
+    return rms_envelope(samples, sr, win_ms)
+
+
+def quietest_offset_ms(env: np.ndarray, win_ms: int = ENVELOPE_WIN_MS, smooth: int = QUIET_SMOOTH_WINDOWS) -> int:
+    """
+    包絡 env（先頭 = 0 ms）の中で最も静かな窓の中心位置（ms）。同値なら末尾側（目標位置寄り）を選ぶ。
+    移動平均は端で窓が欠ける分を実際の窓数で割る（0 埋めのままだと両端が静かに見えて端に寄る）。
+    """
+    if len(env) == 0:
+        return 0
+    if smooth > 1 and len(env) >= smooth:
+        kernel = np.ones(smooth, dtype=np.float32)
+        counts = np.convolve(np.ones(len(env), dtype=np.float32), kernel, mode="same")
+        env = np.convolve(env, kernel, mode="same") / counts
+    idx = len(env) - 1 - int(np.argmin(env[::-1]))
+    return idx * win_ms + win_ms // 2
+
+
+def loudness_envelope(samples: np.ndarray, sample_rate: int, res_ms: int = LOUDNESS_RES_MS) -> np.ndarray:
+    """res_ms ごとの (min, max, RMS)。フルスケール ±32767 の int16、形状 (n, 3)。"""
+    win = max(1, sample_rate * res_ms // 1000)
+    n = -(-len(samples) // win)
+    if n == 0:
+        return np.zeros((0, 3), dtype=np.int16)
+    padded = np.zeros(n * win, dtype=np.float32)
+    padded[: len(samples)] = samples
+    frames = padded.reshape(n, win)
+    out = np.empty((n, 3), dtype=np.float32)
+    out[:, 0] = frames.min(axis=1)
+    out[:, 1] = frames.max(axis=1)
+    out[:, 2] = np.sqrt(np.einsum("ij,ij->i", frames, frames) / win)
+    return np.clip(np.round(out * 32767), -32768, 32767).astype(np.int16)
+
+
+def loudness_envelope_streaming(
+    decode_fn: Callable[[int, int], object],
+    total_ms: int,
+    res_ms: int = LOUDNESS_RES_MS,
+    window_ms: int = LOUDNESS_WINDOW_MS,
+) -> np.ndarray:
+    """
+    decode_fn(a_ms, b_ms) → AudioSegment を window_ms ずつ呼んで索引を作る。
+    各窓の行数は (b - a) / res_ms に揃える（フレーム境界の丸めで数 ms ずれても位置がずれないように）。
+    """
+    window_ms = max(res_ms, window_ms // res_ms * res_ms)
+    n_total = -(-total_ms // res_ms)
+    out = np.zeros((n_total, 3), dtype=np.int16)
+    for a in range(0, total_ms, window_ms):
+        b = min(total_ms, a + window_ms)
+        samples, sr = samples_from_segment(decode_fn(a, b))
+        env = loudness_envelope(samples, sr, res_ms)
+        row0 = a // res_ms
+        rows = min(len(env), n_total - row0, -(-(b - a) // res_ms))
+        out[row0:row0 + rows] = env[:rows]
+    return out
+
+
+def envelope_to_npy_bytes(env: np.ndarray) -> bytes:
+    buf = io.BytesIO()
+    np.save(buf, env, allow_pickle=False)
+    return buf.getvalue()
+
+
+def envelope_from_npy_bytes(data: bytes) -> np.ndarray:
+    return np.load(io.BytesIO(data), allow_pickle=False)
+
+
+def silent_spans(
+    env: np.ndarray, res_ms: int = LOUDNESS_RES_MS, threshold_dbfs: float = -45.0, min_ms: int = 500
+) -> List[Tuple[int, int]]:
+    """ラウドネス索引の RMS 列から、threshold_dbfs 未満が min_ms 以上続く区間 (start_ms, end_ms) を返す。"""
+    if len(env) == 0:
+        return []
+    thr = 32767 * 10 ** (threshold_dbfs / 20)
+    quiet = np.concatenate(([False], env[:, 2] < thr, [False]))
+    edges = np.flatnonzero(np.diff(quiet.astype(np.int8)))
+    starts, ends = edges[0::2], edges[1::2]
+    keep = (ends - starts) * res_ms >= min_ms
+    return [(int(s) * res_ms, int(e) * res_ms) for s, e in zip(starts[keep], ends[keep])]
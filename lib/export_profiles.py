@@ -0,0 +1,66 @@
+# lib/export_profiles.py
+# ============================================================
+# 文字起こし向けの書き出しプロファイル
+# ------------------------------------------------------------
+# 音声認識には mono / 16 kHz / 低ビットレートで十分。128k〜320k の MP3 や
+# PCM16 WAV に比べて 5〜20 倍小さくなり、アップロード時間を大きく削れる。
+#
+# - ExportProfile.prepare()         : ダウンミックス＋リサンプル（既に満たしていれば何もしない）
+# - ExportProfile.accepts_source()  : 元ファイルがそのまま使えるか（→ コピー分割で再エンコード不要）
+# - ExportProfile.estimated_bytes() : 長さからの出力サイズ見積り（プレビュー表用）
+# ============================================================
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import Dict, Optional
+
+
+@dataclass(frozen=True)
+class ExportProfile:
+    label: str
+    ext: str
+    format: str            # pydub export(format=...)
+    codec: Optional[str]   # pydub export(codec=...)
+    bitrate: str           # 例: "24k"
+    channels: int = 1
+    frame_rate: int = 16000
+
+    @property
+    def bitrate_bps(self) -> int:
+        return int(self.bitrate.rstrip("k")) * 1000
+
+    def export_kwargs(self) -> dict:
+        kw = {"format": self.format, "bitrate": self.bitrate}
+        if self.codec:
+            kw["codec"] = self.codec
+        return kw
+
+    def prepare(self, audio):
+        """mono / frame_rate に揃える。pydub は同じ値なら自分自身を返すので余計なコピーは起きない。"""
+        return audio.set_channels(self.channels).set_frame_rate(self.frame_rate)
+
+    def accepts_source(self, src) -> bool:
+        """コピー分割用の索引（lib.stream_copy）を見て、元ファイルが既に目標を満たすか判定。"""
+        return (
+            getattr(src, "fmt", None) == self.format
+            and getattr(src, "channels", 0) == self.channels
+            and getattr(src, "sample_rate", 0) <= self.frame_rate
+            and getattr(src, "bitrate_bps", 0.0) <= self.bitrate_bps * 1.1
+        )
+
+    def estimated_bytes(self, duration_ms: int) -> int:
+        return self.bitrate_bps * duration_ms // 8000
+
+
+TRANSCRIPTION_PROFILES: Dict[str, ExportProfile] = {
+    p.label: p
+    for p in (
+        ExportProfile("文字起こし用（mono/16kHz・Opus 24k）", ext="opus", format="opus", codec="libopus", bitrate="24k"),
+        ExportProfile("文字起こし用（mono/16kHz・MP3 32k）", ext="mp3", format="mp3", codec=None, bitrate="32k"),
+    )
+}
+
+
+def upload_seconds(n_bytes: float, mbps: float) -> float:
+    """n_bytes を mbps（Mbit/s）で送る所要秒数の目安。"""
+    return n_bytes * 8 / (mbps * 1_000_000) if mbps > 0 else 0.0
@@ -0,0 +1,141 @@
+# lib/http_clients.py
+# ============================================================
+# API 呼び出し用の HTTP クライアント（プロセス内で 1 つだけ作って共有）
+# ------------------------------------------------------------
+# 以前は pages/02 がクリックのたびに requests.Session と HTTPAdapter を作り、
+# pages/03・04 は再実行のたびに OpenAI(api_key=...) を作っていたため、
+# 毎回 TCP + TLS のハンドシェイクからやり直し、接続プールも捨てていた。
+#
+# - get_http_session()  : requests.Session（文字起こし API。urllib3 のプールを保持）
+# - get_openai_client() : OpenAI クライアント（Chat。httpx のプール、h2 があれば HTTP/2）
+# - endpoint_timeout()  : エンドポイント別の (接続, 読み取り) タイムアウト（config.HTTP_TIMEOUTS）
+# - pool_stats()        : リクエスト数・新規接続数・接続の再利用率（デバッグ表示用）
+#
+# どちらも st.cache_resource で全セッション共通。スレッドから同時に使ってよい。
+# どちらも自前では再送しない（429・5xx の待ち合わせと再送は lib/api_client が一元的に行う）。
+# httpx は openai パッケージの依存。無い環境では OpenAI の既定のクライアントを 1 回だけ作る。
+# ============================================================
+from __future__ import annotations
+
+import threading
+from typing import Dict, List, Tuple
+
+import requests
+import streamlit as st
+from requests.adapters import HTTPAdapter
+
+from config.config import HTTP2_ENABLED, HTTP_KEEPALIVE_EXPIRY_SEC, HTTP_POOL_MAXSIZE, HTTP_TIMEOUTS
+
+try:
+    import httpx
+except Exception:  # pragma: no cover - openai の依存なので通常は入っている
+    httpx = None
+
+
+def endpoint_timeout(name: str) -> Tuple[float, float]:
+    """(接続, 読み取り) タイムアウト秒。未定義の名前は "chat" と同じ。"""
+    return HTTP_TIMEOUTS.get(name, HTTP_TIMEOUTS["chat"])
+
+
+def _http2_available() -> bool:
+    if not HTTP2_ENABLED:
+        return False
+    try:
+        import h2  # noqa: F401
+        return True
+    except Exception:
+        return False
+
+
+# ---------- 接続数の計測 ----------
+class _ConnCounter:
+    """httpx 用：リクエスト数と新規 TCP 接続数（httpcore の trace 拡張で数える）。"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.connections = 0
+
+    def on_request(self, request) -> None:
+        with self._lock:
+            self.requests += 1
+        request.extensions["trace"] = self._trace
+
+    def _trace(self, event_name: str, info: dict) -> None:
+        if event_name == "connection.connect_tcp.complete":
+            with self._lock:
+                self.connections += 1
+
+
+@st.cache_resource
+def _openai_counters() -> Dict[str, _ConnCounter]:
+    return {}
+
+
+# ---------- requests（文字起こし API）----------
+@st.cache_resource
+def get_http_session() -> requests.Session:
+    """キープアライブの requests.Session（全セッション共通）。"""
+    sess = requests.Session()
+    # 再送は lib/api_client（Retry-After・レート制限ヘッダを見て待つ）に任せ、ここでは行わない
+    sess.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=HTTP_POOL_MAXSIZE, max_retries=0))
+    return sess
+
+
+# ---------- OpenAI（Chat）----------
+@st.cache_resource
+def get_openai_client(api_key: str):
+    """プールを保持した OpenAI クライアント（API キーごとに 1 つ）。"""
+    from openai import OpenAI
+
+    connect, read = endpoint_timeout("chat")
+    if httpx is None:
+        return OpenAI(api_key=api_key, timeout=read, max_retries=0)
+
+    counter = _openai_counters().setdefault("openai", _ConnCounter())
+    http_client = httpx.Client(
+        http2=_http2_available(),
+        timeout=httpx.Timeout(read, connect=connect),
+        limits=httpx.Limits(
+            max_connections=HTTP_POOL_MAXSIZE,
+            max_keepalive_connections=HTTP_POOL_MAXSIZE,
+            keepalive_expiry=HTTP_KEEPALIVE_EXPIRY_SEC,
+        ),
+        event_hooks={"request": [counter.on_request]},
+    )
+    return OpenAI(api_key=api_key, http_client=http_client, max_retries=0)  # 再送は lib/api_client
+
+
+# ---------- デバッグ表示 ----------
+def _row(name: str, n_requests: int, n_connections: int, detail: str) -> dict:
+    reuse = 1 - n_connections / n_requests if n_requests else None
+    return {
+        "クライアント": name,
+        "リクエスト": n_requests,
+        "新規接続": n_connections,
+        "再利用率": f"{reuse:.0%}" if reuse is not None else "—",
+        "設定": detail,
+    }
+
+
+def pool_stats() -> List[dict]:
+    """起動後の累計（リクエスト数・新規接続数・再利用率）。"""
+    rows = []
+    sess = get_http_session()
+    adapter = sess.get_adapter("https://")
+    pools = [adapter.poolmanager.pools[k] for k in adapter.poolmanager.pools.keys()]
+    rows.append(_row(
+        "requests（文字起こし）",
+        sum(p.num_requests for p in pools),
+        sum(p.num_connections for p in pools),
+        f"pool_maxsize={HTTP_POOL_MAXSIZE}, timeout={endpoint_timeout('transcribe')}",
+    ))
+    for name, c in _openai_counters().items():
+        rows.append(_row(
+            f"{name}（Chat）",
+            c.requests,
+            c.connections,
+            f"HTTP/2={'on' if _http2_available() else 'off'}, keepalive={HTTP_KEEPALIVE_EXPIRY_SEC:.0f}s, "
+            f"timeout={endpoint_timeout('chat')}",
+        ))
+    return rows
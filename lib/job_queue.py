@@ -0,0 +1,192 @@
+# lib/job_queue.py
+# ============================================================
+# サーバー全体で共有するバックグラウンドのジョブキュー（スレッドプール）
+# ------------------------------------------------------------
+# 文字起こし・話者分離・議事録は st.spinner の中で API の応答を待っていたため、
+#   - 10 分かかる呼び出しがスクリプトのスレッドを占有し、
+#   - ウィジェットを触ると再実行で中断（結果も支払いも無駄）になり、
+#   - 同時利用者が増えるとサーバー上で処理が積み上がっていた。
+# ここではページがジョブを投入して job_id を受け取り、実行状況・途中経過を読みに来る（ポーリング）。
+#
+# - submit(kind, fn, *args, label=, meta=) : fn(ctx, *args) をワーカーで実行。job_id を返す
+# - get(job_id)                            : Job（状態・進捗・途中経過・結果・エラー）。読むと「生存確認」になる
+# - cancel(job_id)                         : 待機中なら即取り消し、実行中なら ctx に中止を知らせる
+#
+# 【中止】実行中のスレッドは外から止められないので協調的に止める。fn は ctx.check() を要所で呼ぶか、
+#   ctx.cancel_event を下位（lib/transcribe_chunks・lib/api_client）に渡して、未送信の分を送らない。
+# 【放置】JOB_ABANDON_SEC の間だれも get() しなかった実行中ジョブは中止する（タブを閉じた等）。
+# 終わったジョブは JOB_KEEP_SEC 後に一覧から消える。
+# ============================================================
+from __future__ import annotations
+
+import threading
+import time
+import traceback
+import uuid
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional
+
+import streamlit as st
+
+from config.config import JOB_ABANDON_SEC, JOB_KEEP_SEC, JOB_QUEUE_WORKERS
+
+QUEUED, RUNNING, DONE, FAILED, CANCELLED = "queued", "running", "done", "failed", "cancelled"
+STATUS_LABELS = {QUEUED: "待機中", RUNNING: "実行中", DONE: "完了", FAILED: "失敗", CANCELLED: "キャンセル"}
+
+
+class JobCancelled(Exception):
+    """ジョブが中止された（ctx.check() や下位の処理が送る前に投げる）。"""
+
+
+@dataclass
+class Job:
+    job_id: str
+    kind: str
+    label: str = ""
+    meta: Dict[str, Any] = field(default_factory=dict)   # 投入時の設定など（結果の表示に使う）
+    status: str = QUEUED
+    progress: float = 0.0      # 0〜1
+    message: str = ""
+    partial: str = ""          # 途中経過のテキスト
+    result: Any = None
+    error: str = ""
+    created_at: float = field(default_factory=time.time)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    last_seen: float = field(default_factory=time.time)
+    cancel_event: threading.Event = field(default_factory=threading.Event, repr=False)
+    _future: Optional[Future] = field(default=None, repr=False)
+
+    @property
+    def active(self) -> bool:
+        return self.status in (QUEUED, RUNNING)
+
+    @property
+    def finished(self) -> bool:
+        return not self.active
+
+    @property
+    def elapsed(self) -> float:
+        if self.started_at is None:
+            return 0.0
+        return (self.finished_at or time.time()) - self.started_at
+
+
+class JobContext:
+    """fn に渡す窓口：進捗・途中経過の報告と中止の確認。"""
+
+    def __init__(self, job: Job):
+        self._job = job
+
+    @property
+    def cancel_event(self) -> threading.Event:
+        return self._job.cancel_event
+
+    @property
+    def cancelled(self) -> bool:
+        return self._job.cancel_event.is_set()
+
+    def check(self) -> None:
+        if self.cancelled:
+            raise JobCancelled()
+
+    def progress(self, done: float, total: float = 1.0, message: str = "") -> None:
+        self._job.progress = min(1.0, done / total) if total else 0.0
+        if message:
+            self._job.message = message
+
+    def partial(self, text: str) -> None:
+        self._job.partial = text
+
+
+class JobQueue:
+    def __init__(self, max_workers: int = JOB_QUEUE_WORKERS,
+                 keep_sec: float = JOB_KEEP_SEC, abandon_sec: float = JOB_ABANDON_SEC):
+        self._pool = ThreadPoolExecutor(max_workers=max(1, int(max_workers)), thread_name_prefix="job")
+        self._jobs: Dict[str, Job] = {}
+        self._lock = threading.Lock()
+        self.max_workers = max(1, int(max_workers))
+        self.keep_sec = float(keep_sec)
+        self.abandon_sec = float(abandon_sec)
+        threading.Thread(target=self._reaper, name="job-reaper", daemon=True).start()
+
+    # ---------- 投入・参照・中止 ----------
+    def submit(self, kind: str, fn: Callable[..., Any], *args, label: str = "",
+               meta: Optional[Dict[str, Any]] = None, **kwargs) -> str:
+        job = Job(uuid.uuid4().hex[:16], kind, label or kind, dict(meta or {}))
+        with self._lock:
+            self._jobs[job.job_id] = job
+        job._future = self._pool.submit(self._run, job, fn, args, kwargs)
+        return job.job_id
+
+    def get(self, job_id: Optional[str]) -> Optional[Job]:
+        if not job_id:
+            return None
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is not None:
+            job.last_seen = time.time()
+        return job
+
+    def cancel(self, job_id: str) -> bool:
+        job = self.get(job_id)
+        if job is None or job.finished:
+            return False
+        job.cancel_event.set()
+        if job._future is not None and job._future.cancel():  # まだ始まっていない
+            self._finish(job, CANCELLED)
+        return True
+
+    def jobs(self) -> List[Job]:
+        with self._lock:
+            return sorted(self._jobs.values(), key=lambda j: j.created_at)
+
+    # ---------- 実行 ----------
+    def _run(self, job: Job, fn, args, kwargs) -> None:
+        if job.cancel_event.is_set():
+            self._finish(job, CANCELLED)
+            return
+        job.status, job.started_at = RUNNING, time.time()
+        try:
+            job.result = fn(JobContext(job), *args, **kwargs)
+        except JobCancelled:
+            self._finish(job, CANCELLED)
+        except Exception as e:
+            job.error = f"{type(e).__name__}: {e}"
+            job.message = traceback.format_exc(limit=3)
+            self._finish(job, FAILED)
+        else:
+            # 中止を受けて途中で返した場合も CANCELLED（result には途中までの結果が残る）
+            self._finish(job, CANCELLED if job.cancel_event.is_set() else DONE)
+
+    def _finish(self, job: Job, status: str) -> None:
+        job.status, job.finished_at = status, time.time()
+        if status == DONE:
+            job.progress = 1.0
+
+    def _reaper(self) -> None:
+        """放置された実行中ジョブを中止し、古い終了済みジョブを消す。"""
+        while True:
+            time.sleep(min(30.0, max(1.0, self.abandon_sec / 4)))
+            now = time.time()
+            with self._lock:
+                jobs = list(self._jobs.values())
+            for job in jobs:
+                if job.active and now - job.last_seen > self.abandon_sec:
+                    self.cancel(job.job_id)
+                elif job.finished and now - (job.finished_at or now) > self.keep_sec:
+                    with self._lock:
+                        self._jobs.pop(job.job_id, None)
+
+    def stats(self) -> Dict[str, int]:
+        counts = {s: 0 for s in STATUS_LABELS}
+        for job in self.jobs():
+            counts[job.status] += 1
+        return counts
+
+
+@st.cache_resource
+def get_job_queue() -> JobQueue:
+    """プロセス内で共有する JobQueue（全セッション共通）。"""
+    return JobQueue()
@@ -0,0 +1,165 @@
+# lib/multipart_upload.py
+# ============================================================
+# ストリーミングの multipart/form-data（文字起こし API へのアップロード用）
+# ------------------------------------------------------------
+# requests に files=(name, bytes, mime) を渡すと、本文全体（フィールド＋ファイル）を
+# メモリ上で組み立ててから送るため、大きな音声は 1 リクエストで 2〜3 倍の量を抱えていた。
+# ここでは
+#   - Payload       : 送るファイル本体。bytes-like（UploadedFile.getbuffer()・mmap の memoryview）や
+#                     ファイルパスの断片を順に連ねたもの（WAV のコピー分割なら「ヘッダ＋data の範囲」）。
+#                     コピーを作らず、ブロック単位で読む
+#   - MultipartBody : requests の data= に渡す本文。__len__ があるので Content-Length 付きで送られ、
+#                     __iter__ で「フィールド → ファイル（UPLOAD_BLOCK_BYTES ずつ）→ 終端」を順に返す。
+#                     ブロックを送るたびに on_progress(送信済み, 全体) を呼ぶ（再送時は 0 から数え直す）
+#   - UploadMeter   : 並列に送信中のリクエストのアップロード量を合算する（ジョブの進捗表示用）
+# 1 リクエストあたりのメモリはファイルの大きさによらずブロック数個分（数 MB 以内）。
+# ============================================================
+from __future__ import annotations
+
+import hashlib
+import os
+import threading
+import uuid
+from pathlib import Path
+from typing import Callable, Dict, Iterator, Mapping, Optional, Tuple
+
+from lib.content_hash import HASH_BLOCK_BYTES
+
+UPLOAD_BLOCK_BYTES = 256 << 10  # 256 KiB ずつ送る
+
+ProgressFn = Callable[[int, int], None]  # (送信済みバイト, 全体バイト)
+
+
+class Payload:
+    """送信するファイル本体（bytes-like / パスの断片の連結）。全体をメモリにまとめない。"""
+
+    def __init__(self, *parts):
+        self._parts = []
+        for p in parts:
+            if isinstance(p, (str, os.PathLike)):
+                self._parts.append(Path(p))
+            else:
+                mv = memoryview(p).cast("B")
+                if len(mv):
+                    self._parts.append(mv)
+
+    def __len__(self) -> int:
+        return sum(p.stat().st_size if isinstance(p, Path) else len(p) for p in self._parts)
+
+    def blocks(self, block_size: int = UPLOAD_BLOCK_BYTES) -> Iterator:
+        """先頭から block_size 以下の bytes-like を順に返す（memoryview はコピーせずスライス）。"""
+        for p in self._parts:
+            if isinstance(p, Path):
+                with open(p, "rb") as f:
+                    while True:
+                        b = f.read(block_size)
+                        if not b:
+                            break
+                        yield b
+            else:
+                for pos in range(0, len(p), block_size):
+                    yield p[pos:pos + block_size]
+
+    def sha256(self) -> str:
+        """連結した内容の SHA-256（lib/content_hash.content_key と同じ値）。"""
+        h = hashlib.sha256()
+        for b in self.blocks(HASH_BLOCK_BYTES):
+            h.update(b)
+        return h.hexdigest()
+
+
+def as_payload(data) -> Payload:
+    return data if isinstance(data, Payload) else Payload(data)
+
+
+def _quote(value: str) -> str:
+    """Content-Disposition のパラメータ値（HTML5 形式：" と改行だけ % エスケープ、他は UTF-8 のまま）。"""
+    return value.replace("\\", "\\\\").replace('"', "%22").replace("\r", "%0D").replace("\n", "%0A")
+
+
+class MultipartBody:
+    """
+    fields（文字列のフォーム値）＋ file_field にファイル 1 つの multipart/form-data 本文。
+    requests.post(data=body, headers={"Content-Type": body.content_type}) で送る。何度でも先頭から送り直せる。
+    """
+
+    def __init__(
+        self,
+        fields: Mapping[str, object],
+        file_field: str,
+        filename: str,
+        payload,
+        file_content_type: str = "application/octet-stream",
+        on_progress: Optional[ProgressFn] = None,
+        block_size: int = UPLOAD_BLOCK_BYTES,
+    ):
+        self.boundary = uuid.uuid4().hex
+        self.payload = as_payload(payload)
+        self.on_progress = on_progress
+        self.block_size = int(block_size)
+        head = []
+        for k, v in fields.items():
+            head.append(
+                f'--{self.boundary}\r\nContent-Disposition: form-data; name="{_quote(str(k))}"\r\n\r\n{v}\r\n'
+            )
+        head.append(
+            f'--{self.boundary}\r\nContent-Disposition: form-data; name="{_quote(file_field)}"; '
+            f'filename="{_quote(filename)}"\r\nContent-Type: {file_content_type}\r\n\r\n'
+        )
+        self._head = "".join(head).encode("utf-8")
+        self._tail = f"\r\n--{self.boundary}--\r\n".encode("ascii")
+        self._len = len(self._head) + len(self.payload) + len(self._tail)
+
+    @property
+    def content_type(self) -> str:
+        return f"multipart/form-data; boundary={self.boundary}"
+
+    def __len__(self) -> int:
+        return self._len
+
+    def __iter__(self) -> Iterator:
+        # yield から戻った時点で、直前のブロックは送信済み（urllib3 が次を取りに来た）
+        sent = 0
+        self._report(sent)
+        for b in (self._head, *self.payload.blocks(self.block_size), self._tail):
+            yield b
+            sent += len(b)
+            self._report(sent)
+
+    def _report(self, sent: int) -> None:
+        if self.on_progress is not None:
+            self.on_progress(sent, self._len)
+
+
+class UploadMeter:
+    """並列に送信中のリクエストのアップロード量（キーはチャンクのファイル名など）。"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._inflight: Dict[str, Tuple[int, int]] = {}
+
+    def callback(self, key: str, on_change: Optional[Callable[[], None]] = None) -> ProgressFn:
+        def _update(sent: int, total: int) -> None:
+            with self._lock:
+                self._inflight[key] = (sent, total)
+            if on_change is not None:
+                on_change()
+        return _update
+
+    def finish(self, key: str) -> None:
+        with self._lock:
+            self._inflight.pop(key, None)
+
+    def summary(self) -> str:
+        """「アップロード中 n 件 x / y MB・応答待ち m 件」（何も送っていなければ空）。"""
+        with self._lock:
+            items = list(self._inflight.values())
+        uploading = [(s, t) for s, t in items if s < t]
+        waiting = len(items) - len(uploading)
+        parts = []
+        if uploading:
+            sent, total = sum(s for s, _ in uploading), sum(t for _, t in uploading)
+            parts.append(f"アップロード中 {len(uploading)} 件 {sent / 1e6:.1f} / {total / 1e6:.1f} MB")
+        if waiting:
+            parts.append(f"応答待ち {waiting} 件")
+        return "・".join(parts)
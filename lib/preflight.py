@@ -0,0 +1,229 @@
+# lib/preflight.py
+# ============================================================
+# フォルダ単位の「再生時間・文字起こし料金」見積り（プリフライト）
+# ------------------------------------------------------------
+# 大量の音声を文字起こしする前に、合計分数とモデル別の概算料金を出す。
+# - allowed_folder()   : 画面から指定されたフォルダを、許可したルート（PREFLIGHT_ALLOWED_ROOTS）の下に限る
+# - scan_audio_files() : フォルダ内の音声ファイルを列挙（拡張子で判定）
+# - run_preflight()    : スレッドプールで各ファイルをプローブ（lib/audio.probe_buffer_seconds）
+#                        ファイルは mmap で開き、ヘッダだけを読む（全体は読み込まない）
+# - cost_table()       : TRANSCRIBE_PRICES_USD_PER_MIN からモデル別の料金表
+#                        （TRANSCRIBE_SEC_PER_AUDIO_MIN を渡せば処理時間の目安も）
+# - preflight_csv()    : ファイルごとの結果の CSV
+#
+# 【キャッシュ】
+# - 結果は JSON（PREFLIGHT_CACHE_PATH）に「絶対パス → (mtime_ns, size, 秒)」で保存し、
+#   mtime とサイズが変わっていなければプローブしない（数千ファイルの再実行が一瞬）。
+# - 長さを取れなかったファイルも (mtime_ns, size, None, エラー) で保存し、変わるまで再プローブしない。
+#
+# pages/05_フォルダ見積り.py と tools/preflight.py（CLI）から使う。
+# ============================================================
+from __future__ import annotations
+
+import csv
+import io
+import json
+import mmap
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Sequence
+
+from lib.audio import probe_buffer_seconds
+
+AUDIO_SUFFIXES = frozenset({".mp3", ".wav", ".m4a", ".mp4", ".mpga", ".mpeg", ".webm", ".ogg", ".opus", ".flac"})
+DEFAULT_PROBE_WORKERS = min(32, (os.cpu_count() or 1) * 4)
+
+
+@dataclass
+class FileProbe:
+    path: str
+    size: int
+    seconds: Optional[float]
+    cached: bool = False
+    error: str = ""
+
+
+@dataclass
+class PreflightResult:
+    files: List[FileProbe] = field(default_factory=list)
+    wall_seconds: float = 0.0
+
+    @property
+    def total_seconds(self) -> float:
+        return sum(f.seconds or 0.0 for f in self.files)
+
+    @property
+    def total_minutes(self) -> float:
+        return self.total_seconds / 60
+
+    @property
+    def total_bytes(self) -> int:
+        return sum(f.size for f in self.files)
+
+    @property
+    def failed(self) -> List[FileProbe]:
+        return [f for f in self.files if f.seconds is None]
+
+    @property
+    def n_cached(self) -> int:
+        return sum(1 for f in self.files if f.cached)
+
+
+def within_roots(path, roots: Sequence[Path]) -> bool:
+    """path（シンボリックリンクは解決）が roots のどれかの下にあるか。"""
+    try:
+        p = Path(path).expanduser().resolve(strict=True)
+    except (OSError, RuntimeError):
+        return False
+    return any(p.is_relative_to(Path(r).expanduser().resolve()) for r in roots)
+
+
+def allowed_folder(folder, roots: Sequence[Path]) -> Optional[Path]:
+    """folder が roots の下にある実在のディレクトリなら解決したパス、そうでなければ None。"""
+    if not str(folder).strip() or not within_roots(folder, roots):
+        return None
+    p = Path(folder).expanduser().resolve()
+    return p if p.is_dir() else None
+
+
+def scan_audio_files(root, recursive: bool = True) -> List[Path]:
+    """root 以下の音声ファイル（AUDIO_SUFFIXES）をパス順で返す。"""
+    root = Path(root).expanduser()
+    it = root.rglob("*") if recursive else root.glob("*")
+    return sorted(p for p in it if p.suffix.lower() in AUDIO_SUFFIXES and p.is_file())
+
+
+def probe_file(path) -> Optional[float]:
+    """ファイルを mmap してプローブする（ヘッダ以外のページは読まれない）。"""
+    path = Path(path)
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return None
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            return probe_buffer_seconds(mm, path.name)
+
+
+# ---------- キャッシュ ----------
+def load_probe_cache(cache_path) -> Dict[str, list]:
+    try:
+        return json.loads(Path(cache_path).read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return {}
+
+
+def save_probe_cache(cache_path, cache: Dict[str, list]) -> None:
+    """一時ファイルに書いてから置き換える（途中で落ちても壊れたキャッシュを残さない）。"""
+    path = Path(cache_path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(cache, f, ensure_ascii=False)
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+        raise
+
+
+# ---------- 実行 ----------
+def run_preflight(
+    paths: List[Path],
+    workers: int = DEFAULT_PROBE_WORKERS,
+    cache_path=None,
+    on_progress: Callable[[int, int], None] | None = None,
+) -> PreflightResult:
+    """
+    paths をスレッドプールでプローブする。cache_path を渡すと (mtime_ns, size) が同じファイルは再利用。
+    on_progress(完了数, 総数) は呼び出し元スレッドで呼ばれる。
+    """
+    t0 = time.perf_counter()
+    cache = load_probe_cache(cache_path) if cache_path else {}
+    results: Dict[str, FileProbe] = {}
+    todo = []
+    for p in paths:
+        key = str(Path(p).resolve())
+        try:
+            st_ = os.stat(key)
+        except OSError as e:
+            results[key] = FileProbe(key, 0, None, error=str(e))
+            continue
+        hit = cache.get(key)
+        if hit and hit[0] == st_.st_mtime_ns and hit[1] == st_.st_size:
+            err = hit[3] if len(hit) > 3 else ""
+            results[key] = FileProbe(key, st_.st_size, hit[2], cached=True, error=err)
+        else:
+            todo.append((key, st_.st_mtime_ns, st_.st_size))
+
+    done = len(results)
+    if on_progress is not None:
+        on_progress(done, len(paths))
+
+    def _one(item):
+        key, mtime_ns, size = item
+        try:
+            return item, probe_file(key), ""
+        except Exception as e:
+            return item, None, f"{type(e).__name__}: {e}"
+
+    if todo:
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as ex:
+            for fut in as_completed([ex.submit(_one, item) for item in todo]):
+                (key, mtime_ns, size), sec, err = fut.result()
+                if sec is None and not err:
+                    err = "長さを取得できません"
+                results[key] = FileProbe(key, size, sec, error=err)
+                cache[key] = [mtime_ns, size, sec] + ([err] if sec is None else [])
+                done += 1
+                if on_progress is not None:
+                    on_progress(done, len(paths))
+        if cache_path:
+            save_probe_cache(cache_path, cache)
+
+    ordered = [results[str(Path(p).resolve())] for p in paths]
+    return PreflightResult(ordered, time.perf_counter() - t0)
+
+
+def cost_table(
+    total_minutes: float,
+    prices_usd_per_min: Dict[str, float],
+    usd_jpy: float,
+    sec_per_audio_min: Optional[Dict[str, float]] = None,
+    concurrency: int = 1,
+) -> List[dict]:
+    """
+    モデル別の概算料金（安い順）。sec_per_audio_min（音声 1 分あたりの処理秒数）を渡すと
+    「処理時間（秒）」も付ける（concurrency 本並列で送る前提。目安）。
+    """
+    rows = []
+    for model, price in sorted(prices_usd_per_min.items(), key=lambda kv: kv[1]):
+        usd = total_minutes * float(price)
+        row = {
+            "モデル": model,
+            "単価 (USD/分)": float(price),
+            "合計分数": round(total_minutes, 2),
+            "概算 (USD)": round(usd, 4),
+            "概算 (JPY)": round(usd * usd_jpy, 1),
+        }
+        if sec_per_audio_min is not None:
+            rate = sec_per_audio_min.get(model)
+            row["処理時間（秒）"] = (
+                round(total_minutes * float(rate) / max(1, int(concurrency)), 1) if rate is not None else None
+            )
+        rows.append(row)
+    return rows
+
+
+def preflight_csv(res: PreflightResult) -> str:
+    buf = io.StringIO()
+    w = csv.writer(buf)
+    w.writerow(["path", "bytes", "seconds", "cached", "error"])
+    for f in res.files:
+        w.writerow([f.path, f.size, "" if f.seconds is None else f"{f.seconds:.3f}", int(f.cached), f.error])
+    return buf.getvalue()
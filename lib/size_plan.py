@@ -0,0 +1,51 @@
+# lib/size_plan.py
+# ============================================================
+# アップロード上限サイズからチャンク長を決めるためのヘルパー
+# ------------------------------------------------------------
+# - estimate_output_bps() : 書き出し後のビットレート（実測 or 設定値からの見積り）
+# - chunk_ms_for_size()   : 1 チャンクが max_bytes に収まる最大のチャンク長（ms）
+# - oversized_parts()     : 書き出し結果のサイズ検証（エンコード結果の長さを使うので再エンコード不要）
+# ============================================================
+from __future__ import annotations
+
+from typing import List, Sequence
+
+DEFAULT_MP3_BPS = 128_000   # ビットレート未指定で再エンコードした場合（ffmpeg/libmp3lame の既定）
+SIZE_SAFETY = 0.92          # VBR の局所的な膨らみ・コンテナのオーバーヘッド分の余裕
+HEADER_BYTES = 4096         # WAV ヘッダ・ID3/Ogg ページ等の固定分（大きめに見積もる）
+
+
+def parse_bitrate(bitrate: str) -> int:
+    """"128k" → 128000"""
+    b = bitrate.strip().lower()
+    return int(float(b[:-1]) * 1000) if b.endswith("k") else int(b)
+
+
+def estimate_output_bps(copy_src=None, audio=None, profile=None, out_ext: str = "mp3", bitrate: str | None = None) -> float:
+    """
+    書き出しビットレート（bps）の見積り。
+      コピー分割 → 元ファイルの実測平均 / プロファイル → 設定値 /
+      WAV → サンプルレート×ch×bit深度 / MP3 → 指定値（なければ既定 128k）
+    """
+    if copy_src is not None:
+        return float(copy_src.bitrate_bps)
+    if profile is not None:
+        return float(profile.bitrate_bps)
+    if out_ext == "wav" and audio is not None:
+        return float(audio.frame_rate * audio.channels * audio.sample_width * 8)
+    if bitrate:
+        return float(parse_bitrate(bitrate))
+    return float(DEFAULT_MP3_BPS)
+
+
+def chunk_ms_for_size(max_bytes: int, bitrate_bps: float, safety: float = SIZE_SAFETY) -> int:
+    """max_bytes に収まるチャンク長（ms）。safety で余裕を持たせる。"""
+    if bitrate_bps <= 0:
+        raise ValueError("bitrate_bps must be > 0")
+    payload = max(0, max_bytes - HEADER_BYTES) * safety
+    return int(payload * 8 * 1000 / bitrate_bps)
+
+
+def oversized_parts(sizes: Sequence[int], max_bytes: int) -> List[int]:
+    """上限を超えたチャンクの番号。"""
+    return [i for i, n in enumerate(sizes) if n > max_bytes]
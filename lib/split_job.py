@@ -0,0 +1,263 @@
+# lib/split_job.py
+# ============================================================
+# 1 ファイル分の「分割 → 書き出し」ジョブと、複数ファイルの一括実行
+# ------------------------------------------------------------
+# - output_spec()        : サイドバーの書き出し設定 → OutputSpec
+# - choose_copy_source() : コピー分割（再エンコードなし）が使えるかの判定
+# - split_file()         : 1 ファイルを分割してチャンク・index CSV・エンベロープを out_dir に書く
+# - run_batch()          : 複数ファイルを ProcessPoolExecutor（上限付き）で並列に split_file
+#
+# ワーカーへはファイルパスと設定（picklable な dataclass）だけを渡す。
+# 進捗は Manager().Queue 経由で (ファイル番号, 完了チャンク数, 総チャンク数) を送る。
+# ============================================================
+from __future__ import annotations
+
+import mmap
+import multiprocessing as mp
+import os
+import traceback
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from dataclasses import dataclass, field
+from pathlib import Path
+from queue import Empty
+from typing import Callable, List, Optional
+
+from lib.audio_io import decode
+from lib.audio_split import (
+    build_index_csv,
+    chunk_filename,
+    plan_ranges,
+    plan_silence_ranges,
+    plans_from_ranges,
+    split_with_overlap,
+)
+from lib.encode_pool import encode_inline
+from lib.envelope import (
+    LOUDNESS_RES_MS,
+    envelope_from_segment,
+    envelope_to_npy_bytes,
+    loudness_envelope_streaming,
+)
+from lib.export_profiles import TRANSCRIPTION_PROFILES, ExportProfile
+from lib.size_plan import chunk_ms_for_size, estimate_output_bps, oversized_parts
+from lib.stream_copy import open_copy_source
+from lib.vad import speech_offset_map, trim_audio
+
+
+@dataclass(frozen=True)
+class OutputSpec:
+    ext: str
+    export_kwargs: dict = field(hash=False)
+    bitrate: Optional[str] = None
+    profile: Optional[ExportProfile] = None
+
+
+def output_spec(export_fmt: str, target_bitrate: str) -> OutputSpec:
+    """サイドバーの「書き出しフォーマット」「ビットレート」から書き出し設定を作る。"""
+    profile = TRANSCRIPTION_PROFILES.get(export_fmt)
+    if profile is not None:
+        return OutputSpec(profile.ext, profile.export_kwargs(), profile.bitrate, profile)
+    if export_fmt.startswith("wav"):
+        return OutputSpec("wav", {"format": "wav"})  # 既定で PCM_s16le
+    bitrate = None if "自動" in target_bitrate else target_bitrate
+    export_kwargs = {"format": "mp3"}
+    if bitrate:
+        export_kwargs["bitrate"] = bitrate
+    return OutputSpec("mp3", export_kwargs, bitrate)
+
+
+def choose_copy_source(buf, load_fmt: str, spec: OutputSpec, fade_ms: int):
+    """
+    コピー分割（デコード・再エンコードなし）が使えるならその索引を、使えなければ None を返す。
+      - 入出力の形式が同じ / ビットレート指定なし の場合のみ
+      - WAV → WAV (PCM16) は元が PCM16 のときだけコピー（フェードは端だけ NumPy で掛ける）
+      - MP3 はフェードなしのときだけ
+      - 文字起こし用プロファイルは、元が既に mono/16kHz/低ビットレートならコピー
+    """
+    if spec.ext != load_fmt or (fade_ms > 0 and load_fmt != "wav"):
+        return None
+    if spec.profile is None and spec.bitrate is not None:
+        return None
+    copy_src = open_copy_source(buf, load_fmt)
+    if copy_src is None:
+        return None
+    if spec.profile is not None:
+        return copy_src if spec.profile.accepts_source(copy_src) else None
+    if load_fmt == "wav" and not copy_src.is_pcm16:
+        return None
+    return copy_src
+
+
+@dataclass(frozen=True)
+class SplitSettings:
+    spec: OutputSpec
+    chunk_ms: int
+    overlap_ms: int
+    snap_tolerance_ms: int = 0
+    fade_ms: int = 0
+    absorb_tiny_tail: bool = True
+    max_chunk_bytes: Optional[int] = None
+    with_envelope: bool = True
+    vad_min_gap_ms: int = 0     # > 0 なら無音区間を除去してから分割（lib/vad）
+
+
+def split_file(src_path: str, out_dir: str, settings: SplitSettings, progress: Callable[[int, int], None] | None = None) -> dict:
+    """
+    src_path（.mp3 / .wav）を分割し、out_dir にチャンク・<base>_index.csv・エンベロープを書き出す。
+    戻り値: {"base", "total_ms", "chunk_ms", "copy", "removed_ms", "files", "sizes", "oversized"}
+    """
+    src = Path(src_path)
+    out = Path(out_dir)
+    out.mkdir(parents=True, exist_ok=True)
+
+    with open(src, "rb") as f:
+        buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if os.path.getsize(src) else b""
+    try:
+        return _split_buffer(buf, src, out, settings, progress)
+    finally:
+        # コピー分割の索引（memoryview）は _split_buffer から戻った時点で解放済み
+        if isinstance(buf, mmap.mmap):
+            try:
+                buf.close()
+            except BufferError:
+                pass  # 例外のトレースバックがまだビューを持っている → 参照が消えたときに閉じられる
+
+
+def _split_buffer(buf, src: Path, out: Path, settings: SplitSettings, progress) -> dict:
+    """split_file の本体（buf は src の中身。mmap の後始末は呼び出し側）。"""
+    load_fmt = src.suffix.lower().lstrip(".")
+    base_name = (src.stem or "audio").replace(" ", "_")
+    spec = settings.spec
+
+    # 無音除去する場合は PCM 上で連結するので常にデコードする
+    copy_src = None if settings.vad_min_gap_ms > 0 else choose_copy_source(buf, load_fmt, spec, settings.fade_ms)
+    offset_map = None
+
+    if copy_src is not None:
+        audio = None
+        total_ms = copy_src.duration_ms
+        decode_fn = lambda a, b: decode(copy_src.chunk_bytes(a, b), format=load_fmt)
+    else:
+        audio = decode(str(src), format=load_fmt)
+        if spec.profile is not None:
+            audio = spec.profile.prepare(audio)
+        if settings.vad_min_gap_ms > 0:
+            offset_map = speech_offset_map(lambda a, b: audio[a:b], len(audio), min_gap_ms=settings.vad_min_gap_ms)
+            audio = trim_audio(audio, offset_map.spans)
+        total_ms = len(audio)
+        decode_fn = lambda a, b: audio[a:b]
+
+    chunk_ms = settings.chunk_ms
+    if settings.max_chunk_bytes:
+        out_bps = estimate_output_bps(copy_src, audio, spec.profile, spec.ext, spec.bitrate)
+        chunk_ms = chunk_ms_for_size(settings.max_chunk_bytes, out_bps)
+
+    if settings.overlap_ms + settings.snap_tolerance_ms >= chunk_ms:
+        raise ValueError(f"オーバーラップ（＋探索幅）がチャンク長 {chunk_ms} ms 以上です。")
+
+    if copy_src is None:
+        parts = split_with_overlap(
+            audio, chunk_ms, settings.overlap_ms, settings.fade_ms,
+            settings.absorb_tiny_tail, snap_tolerance_ms=settings.snap_tolerance_ms,
+            strict_max=bool(settings.max_chunk_bytes),
+        )
+    elif settings.snap_tolerance_ms > 0:
+        # 探索窓の範囲だけをデコードして包絡を計算（全体はデコードしない）
+        parts = plan_silence_ranges(
+            total_ms, chunk_ms, settings.overlap_ms, settings.snap_tolerance_ms,
+            envelope_fn=lambda a, b: envelope_from_segment(decode_fn(a, b)),
+            absorb_tiny_tail=settings.absorb_tiny_tail,
+            fade_ms=settings.fade_ms,
+            strict_max=bool(settings.max_chunk_bytes),  # サイズ上限があるときは尻尾の吸収で上限を超えない
+        )
+    else:
+        parts = plans_from_ranges(
+            plan_ranges(total_ms, chunk_ms, settings.overlap_ms, settings.absorb_tiny_tail), settings.fade_ms
+        )
+
+    encoded = encode_inline(audio, parts, spec.export_kwargs) if copy_src is None else None
+
+    files: List[str] = []
+    sizes: List[int] = []
+    for i, p in enumerate(parts):
+        name = chunk_filename(base_name, i, p, spec.ext)
+        with open(out / name, "wb") as fp:
+            if copy_src is not None:
+                sizes.append(copy_src.write_chunk(p.start_ms, p.end_ms, fp, p.fade_ms))
+            else:
+                data = next(encoded)
+                fp.write(data)
+                sizes.append(len(data))
+        files.append(name)
+        if progress is not None:
+            progress(i + 1, len(parts))
+
+    index_name = f"{base_name}_index.csv"
+    (out / index_name).write_text(build_index_csv(parts, sizes=sizes, offset_map=offset_map), encoding="utf-8")
+    files.append(index_name)
+
+    if offset_map is not None:
+        map_name = f"{base_name}_offset_map.json"
+        (out / map_name).write_text(offset_map.to_json(), encoding="utf-8")
+        files.append(map_name)
+
+    if settings.with_envelope:
+        env_name = f"{base_name}_envelope_{LOUDNESS_RES_MS}ms.npy"
+        (out / env_name).write_bytes(envelope_to_npy_bytes(loudness_envelope_streaming(decode_fn, total_ms)))
+        files.append(env_name)
+
+    return {
+        "base": base_name,
+        "total_ms": total_ms,
+        "chunk_ms": chunk_ms,
+        "copy": copy_src is not None,
+        "removed_ms": offset_map.removed_ms if offset_map is not None else 0,
+        "files": files,
+        "sizes": sizes,
+        "oversized": oversized_parts(sizes, settings.max_chunk_bytes) if settings.max_chunk_bytes else [],
+    }
+
+
+def _run_one(idx: int, src_path: str, out_dir: str, settings: SplitSettings, queue) -> dict:
+    """ワーカー側のエントリ。例外は握って結果 dict の error に入れる（他ファイルは続行）。"""
+    try:
+        return split_file(src_path, out_dir, settings, progress=lambda done, total: queue.put((idx, done, total)))
+    except Exception as e:
+        return {"base": Path(src_path).stem, "error": f"{e}", "traceback": traceback.format_exc()}
+
+
+def run_batch(
+    src_paths: List[str],
+    out_dirs: List[str],
+    settings: SplitSettings,
+    workers: int,
+    on_progress: Callable[[int, int, int], None] | None = None,
+) -> List[dict]:
+    """
+    複数ファイルを最大 workers プロセスで並列に split_file する。
+    on_progress(ファイル番号, 完了チャンク数, 総チャンク数) はメインプロセス側で呼ばれる。
+    戻り値は src_paths と同じ順序。
+    """
+    ctx = mp.get_context("spawn")
+
+    def _drain(q) -> None:
+        while True:
+            try:
+                idx, done, total = q.get_nowait()
+            except Empty:
+                return
+            if on_progress is not None:
+                on_progress(idx, done, total)
+
+    with ctx.Manager() as mgr, ProcessPoolExecutor(max_workers=max(1, workers), mp_context=ctx) as ex:
+        q = mgr.Queue()
+        futures = [
+            ex.submit(_run_one, i, path, out_dir, settings, q)
+            for i, (path, out_dir) in enumerate(zip(src_paths, out_dirs))
+        ]
+        pending = set(futures)
+        while pending:
+            _, pending = wait(pending, timeout=0.25, return_when=FIRST_COMPLETED)
+            _drain(q)
+        _drain(q)
+        return [f.result() for f in futures]
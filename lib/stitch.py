@@ -0,0 +1,229 @@
+# lib/stitch.py
+# ============================================================
+# 重なり付きで分割した音声の文字起こしを、重複なくつなぐ（継ぎ目の整列）
+# ------------------------------------------------------------
+# 分割ページ・lib/transcribe_chunks は境界の言葉が切れないようにチャンクを重ねるため、
+# 重なり部分は前後のチャンクで 2 回書き起こされる。単純に連結すると境界ごとに文が重複する。
+#
+# 【方法】
+# - セグメント（タイムスタンプ付き）がある場合: 重なりの中点で切る。
+#   中点より前に中心があるセグメントは前のチャンク、以降は次のチャンクから採る。
+#   切れ目をまたいだ同じ発話が両側に残った場合（時刻が重なり、文字列がほぼ同じ）は次チャンク側を捨てる。
+#   信頼度 = 重なり区間の「前チャンクの文字列」と「次チャンクの文字列」の一致度。
+# - テキストだけの場合: 前チャンクの末尾窓と次チャンクの先頭窓（どちらも重なりの長さから
+#   見積もった文字数 × 数倍、上限 STITCH_MAX_WINDOW_CHARS）の中で最長一致を探し、
+#   一致の終わりで前を切り、次は一致の後ろから続ける（窓の外は比較しない）。
+#   信頼度 = 一致の長さ ÷ 重なりの見込み文字数（上限 1）。一致が短すぎればつながずに改行で連結。
+# 空白・句読点は比較のときだけ無視する（切る位置は元の文字列の位置に戻す）。
+# 間のチャンクが抜けた（失敗して除いた：Piece.index が飛ぶ）・時刻に隙間がある継ぎ目は
+# method="gap"・信頼度 0（その間の発言は結果に無い）。
+#
+# 比較は継ぎ目ごとに窓の大きさで頭打ちなので、継ぎ目が数百あっても全体は本文の長さに比例。
+#
+# - stitch_texts()    : テキストのみ（Piece.text）
+# - stitch_segments() : セグメント（絶対時刻 ms）
+# - stitch_pieces()   : 全 piece にセグメントがあれば stitch_segments()、無ければ stitch_texts()
+# - Seam              : 継ぎ目ごとの方法・信頼度・削った文字数
+# ============================================================
+from __future__ import annotations
+
+import unicodedata
+from dataclasses import dataclass, field
+from difflib import SequenceMatcher
+from typing import List, Optional, Sequence, Tuple
+
+STITCH_MIN_WINDOW_CHARS = 48
+STITCH_MAX_WINDOW_CHARS = 600
+STITCH_WINDOW_FACTOR = 3.0     # 見込み文字数の何倍の窓を比較するか（話速のばらつき分）
+STITCH_MIN_MATCH_CHARS = 4     # これより短い一致は偶然とみなす
+STITCH_DUP_SEGMENT_RATIO = 0.8 # 中点の両側に残った同じ発話（時刻が重なり文字列がほぼ同じ）は次チャンク側を捨てる
+
+
+@dataclass(frozen=True)
+class Segment:
+    start_ms: int
+    end_ms: int
+    text: str
+
+    @property
+    def mid_ms(self) -> float:
+        return (self.start_ms + self.end_ms) / 2
+
+
+@dataclass
+class Piece:
+    """1 チャンク分の文字起こし。segments は絶対時刻（元の音声の先頭から）。index はチャンク番号（表示用）。"""
+    start_ms: int
+    end_ms: int
+    text: str = ""
+    segments: Optional[List[Segment]] = None
+    index: int = 0
+
+
+@dataclass(frozen=True)
+class Seam:
+    index: int            # この番号のチャンクと次のチャンクの間（Piece.index、未指定なら 1 始まりの順番）
+    method: str           # "segments" / "text" / "none"（重なりなしで連結）/ "gap"（間が抜けている）
+    confidence: float     # 0〜1
+    dropped_chars: int    # 重複として捨てた文字数（前後の合計）
+
+
+@dataclass
+class StitchResult:
+    text: str
+    seams: List[Seam] = field(default_factory=list)
+    segments: Optional[List[Segment]] = None
+
+    @property
+    def min_confidence(self) -> Optional[float]:
+        return min((s.confidence for s in self.seams), default=None)
+
+
+# ---------- 比較用の正規化 ----------
+def _normalize(s: str) -> Tuple[str, List[int]]:
+    """空白・句読点・記号を除いて NFKC・小文字化し、各文字の元の位置を返す。"""
+    chars, pos = [], []
+    for i, ch in enumerate(s):
+        if ch.isspace() or unicodedata.category(ch)[0] in "PSZ":
+            continue
+        chars.append(unicodedata.normalize("NFKC", ch).lower())
+        pos.append(i)
+    return "".join(chars), pos
+
+
+def _chars_per_ms(text: str, duration_ms: int) -> float:
+    return len(_normalize(text)[0]) / duration_ms if duration_ms > 0 else 0.0
+
+
+def _window(expected_chars: float) -> int:
+    return int(min(STITCH_MAX_WINDOW_CHARS, max(STITCH_MIN_WINDOW_CHARS, expected_chars * STITCH_WINDOW_FACTOR)))
+
+
+def align_overlap(prev_text: str, next_text: str, expected_chars: float) -> Tuple[int, int, float]:
+    """
+    prev_text の末尾窓と next_text の先頭窓を比べ、(前を切る位置, 次を始める位置, 信頼度) を返す。
+    一致が見つからなければ (len(prev_text), 0, 0.0)。
+    """
+    w = _window(expected_chars)
+    tail_off = max(0, len(prev_text) - w)
+    tail, tail_pos = _normalize(prev_text[tail_off:])
+    head, head_pos = _normalize(next_text[:w])
+    if not tail or not head:
+        return len(prev_text), 0, 0.0
+
+    m = SequenceMatcher(None, tail, head, autojunk=False).find_longest_match(0, len(tail), 0, len(head))
+    if m.size < STITCH_MIN_MATCH_CHARS:
+        return len(prev_text), 0, 0.0
+
+    cut_prev = tail_off + tail_pos[m.a + m.size - 1] + 1
+    start_next = head_pos[m.b + m.size - 1] + 1
+    confidence = min(1.0, m.size / expected_chars) if expected_chars > 0 else 0.5
+    return cut_prev, start_next, round(confidence, 3)
+
+
+def _is_gap(prev: Piece, p: Piece) -> bool:
+    """prev と p の間が抜けている（チャンク番号が飛ぶ・時刻に隙間がある）。"""
+    return bool(prev.index and p.index and p.index != prev.index + 1) or p.start_ms > prev.end_ms
+
+
+# ---------- テキストのみ ----------
+def stitch_texts(pieces: Sequence[Piece], sep: str = "\n") -> StitchResult:
+    """チャンク順の pieces をつなぐ。つなげなかった継ぎ目は sep で連結する。"""
+    out: List[str] = []
+    seams: List[Seam] = []
+    prev: Optional[Piece] = None
+    gap = False  # prev 以降（本文の無い piece を飛ばした分も含め）に抜けがあるか
+    for i, p in enumerate(pieces, start=1):
+        if i > 1 and _is_gap(pieces[i - 2], p):
+            gap = True
+        text = p.text.strip()
+        if not text:
+            continue
+        if prev is None:
+            out.append(text)
+            prev, prev_i, gap = p, i, False
+            continue
+
+        seam_index = prev.index or prev_i
+        if gap:
+            seams.append(Seam(seam_index, "gap", 0.0, 0))
+            out.append(sep + text)
+            prev, prev_i, gap = p, i, False
+            continue
+        overlap_ms = max(0, prev.end_ms - p.start_ms)
+        rate = _chars_per_ms(prev.text, prev.end_ms - prev.start_ms) or _chars_per_ms(text, p.end_ms - p.start_ms)
+        cut_prev, start_next, conf = (
+            align_overlap(out[-1], text, rate * overlap_ms) if overlap_ms > 0 else (len(out[-1]), 0, 0.0)
+        )
+        if conf > 0:
+            seams.append(Seam(seam_index, "text", conf, (len(out[-1]) - cut_prev) + start_next))
+            out[-1] = out[-1][:cut_prev]
+            out.append(text[start_next:])
+        else:
+            # 重なりなし（1.0）／一致が見つからない（0.0）：そのまま連結
+            seams.append(Seam(seam_index, "none", 1.0 if overlap_ms == 0 else 0.0, 0))
+            out.append(sep + text)
+        prev, prev_i = p, i
+    return StitchResult("".join(out), seams)
+
+
+# ---------- セグメント ----------
+def _overlap_text(segs: Sequence[Segment], lo: int, hi: int) -> str:
+    return "".join(s.text for s in segs if s.end_ms > lo and s.start_ms < hi)
+
+
+def stitch_segments(pieces: Sequence[Piece]) -> StitchResult:
+    """
+    各 piece.segments（絶対時刻）を重なりの中点で切り替えてつなぐ。
+    segments が無い piece が混ざる場合は stitch_texts() を使うこと。
+    """
+    merged: List[Segment] = []
+    seams: List[Seam] = []
+    for i, p in enumerate(pieces):
+        segs = p.segments or []
+        if i == 0:
+            merged.extend(segs)
+            continue
+        prev = pieces[i - 1]
+        seam_index = prev.index or i
+        lo, hi = p.start_ms, prev.end_ms
+        if _is_gap(prev, p):
+            merged.extend(segs)
+            seams.append(Seam(seam_index, "gap", 0.0, 0))
+            continue
+        if hi <= lo:
+            merged.extend(segs)
+            seams.append(Seam(seam_index, "none", 1.0, 0))
+            continue
+
+        cut = (lo + hi) / 2
+        # 前チャンクの分は merged の末尾にしか無い（重なりは 1 つ前のチャンクとだけ）
+        k = len(merged)
+        while k > 0 and merged[k - 1].mid_ms >= cut:
+            k -= 1
+        dropped_prev = merged[k:]
+        del merged[k:]
+        keep_next = [s for s in segs if s.mid_ms >= cut]
+        if merged and keep_next and keep_next[0].start_ms < merged[-1].end_ms:
+            x, _ = _normalize(merged[-1].text)
+            y, _ = _normalize(keep_next[0].text)
+            if x and y and SequenceMatcher(None, x, y, autojunk=False).ratio() >= STITCH_DUP_SEGMENT_RATIO:
+                dropped_prev = dropped_prev + [keep_next.pop(0)]
+
+        a, _ = _normalize(_overlap_text(prev.segments or [], lo, hi))
+        b, _ = _normalize(_overlap_text(segs, lo, hi))
+        w = STITCH_MAX_WINDOW_CHARS
+        conf = 1.0 if not a and not b else SequenceMatcher(None, a[-w:], b[:w], autojunk=False).ratio()
+        dropped = sum(len(s.text) for s in dropped_prev) + sum(len(s.text) for s in segs if s.mid_ms < cut)
+        merged.extend(keep_next)
+        seams.append(Seam(seam_index, "segments", round(conf, 3), dropped))
+
+    text = "".join(s.text for s in merged)
+    return StitchResult(text, seams, merged)
+
+
+def stitch_pieces(pieces: Sequence[Piece], sep: str = "\n") -> StitchResult:
+    """全 piece にセグメントがあれば stitch_segments()、無ければ stitch_texts()。"""
+    if pieces and all(p.segments is not None for p in pieces):
+        return stitch_segments(pieces)
+    return stitch_texts(pieces, sep)
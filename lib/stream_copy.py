@@ -0,0 +1,327 @@
+# lib/stream_copy.py
+# ============================================================
+# 再エンコードなしの「コピー分割」エンジン
+# ------------------------------------------------------------
+# AudioSegment.from_file() は音声全体を PCM に展開するため、長時間録音では
+# 数 GB のメモリを消費する。ここではデコードせず、
+#   - MP3 : フレームヘッダを走査してフレーム境界のバイト位置を索引化
+#   - WAV : fmt / data チャンクを読み、サンプルブロック境界のバイト位置を計算
+# し、指定 ms 範囲に対応するバイト列をそのまま書き出す。
+#
+# 【特徴】
+# - 入力は bytes-like（UploadedFile.getbuffer() や mmap）を memoryview で参照するだけ。
+# - 索引は MP3 でもフレーム数 × 8 byte 程度（3時間で数 MB）。
+# - 書き出しはブロック単位のコピーなので、チャンク長に関わらずメモリは一定。
+#   chunk_parts() は書き出さずに元バッファの範囲（memoryview）を返す（lib/multipart_upload で直接送信）。
+# - 解析できない形式（フリーフォーマット MP3 等）は None を返し、呼び出し側で
+#   pydub（デコード）経路にフォールバックする。
+# - PCM16 WAV のフェードは、先頭・末尾の fade_ms 分だけ NumPy でゲインを掛けて
+#   書き出す（中間はそのままコピー）。MP3 はフレーム単位のコピーなのでフェード不可。
+# ============================================================
+from __future__ import annotations
+
+import io
+import struct
+from array import array
+from typing import Optional
+
+import numpy as np
+
+COPY_BLOCK_BYTES = 1 << 20  # 1 MiB ずつコピー
+
+# ---- MP3（MPEG Audio Layer III）ヘッダ用テーブル ----
+_MP3_BITRATES_V1 = (0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320)
+_MP3_BITRATES_V2 = (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160)
+_MP3_SAMPLE_RATES = {
+    3: (44100, 48000, 32000),  # MPEG-1
+    2: (22050, 24000, 16000),  # MPEG-2
+    0: (11025, 12000, 8000),   # MPEG-2.5
+}
+_VBR_TAGS = (b"Xing", b"Info", b"VBRI")
+
+
+def _parse_mp3_header(buf, pos: int):
+    """pos の 4 byte を Layer III フレームヘッダとして解釈。(version, sr, frame_len, samples) or None。"""
+    if pos + 4 > len(buf):
+        return None
+    b0, b1, b2 = buf[pos], buf[pos + 1], buf[pos + 2]
+    if b0 != 0xFF or (b1 & 0xE0) != 0xE0:
+        return None
+    version = (b1 >> 3) & 0x03
+    layer = (b1 >> 1) & 0x03
+    bitrate_idx = (b2 >> 4) & 0x0F
+    sr_idx = (b2 >> 2) & 0x03
+    padding = (b2 >> 1) & 0x01
+    if version == 1 or layer != 1 or bitrate_idx in (0, 15) or sr_idx == 3:
+        return None  # 予約値 / Layer III 以外 / フリーフォーマット
+
+    sr = _MP3_SAMPLE_RATES[version][sr_idx]
+    if version == 3:
+        kbps = _MP3_BITRATES_V1[bitrate_idx]
+        frame_len = 144000 * kbps // sr + padding
+        samples = 1152
+    else:
+        kbps = _MP3_BITRATES_V2[bitrate_idx]
+        frame_len = 72000 * kbps // sr + padding
+        samples = 576
+    return version, sr, frame_len, samples
+
+
+def _skip_id3v2(buf) -> int:
+    """先頭の ID3v2 タグを飛ばした位置を返す。"""
+    if len(buf) >= 10 and bytes(buf[0:3]) == b"ID3":
+        size = (buf[6] & 0x7F) << 21 | (buf[7] & 0x7F) << 14 | (buf[8] & 0x7F) << 7 | (buf[9] & 0x7F)
+        footer = 10 if buf[5] & 0x10 else 0
+        return 10 + size + footer
+    return 0
+
+
+class Mp3FrameIndex:
+    """MP3 のフレーム境界索引。ms 範囲 → フレーム境界に揃ったバイト範囲を返す。"""
+
+    fmt = "mp3"
+
+    def __init__(self, buf, offsets: array, sample_rate: int, samples_per_frame: int, channels: int = 2):
+        self.buf = buf
+        self.offsets = offsets  # 各フレーム先頭のバイト位置 + 末尾（len = フレーム数 + 1）
+        self.sample_rate = sample_rate
+        self.samples_per_frame = samples_per_frame
+        self.channels = channels
+
+    @property
+    def n_frames(self) -> int:
+        return len(self.offsets) - 1
+
+    @property
+    def duration_ms(self) -> int:
+        return self.n_frames * self.samples_per_frame * 1000 // self.sample_rate
+
+    @property
+    def bitrate_bps(self) -> float:
+        """実測の平均ビットレート（VBR でも可）。"""
+        sec = self.n_frames * self.samples_per_frame / self.sample_rate
+        return (self.offsets[-1] - self.offsets[0]) * 8 / sec if sec > 0 else 0.0
+
+    def _frame_at(self, ms: int) -> int:
+        idx = round(ms * self.sample_rate / (1000 * self.samples_per_frame))
+        return max(0, min(self.n_frames, idx))
+
+    def byte_range(self, start_ms: int, end_ms: int) -> tuple[int, int]:
+        return self.offsets[self._frame_at(start_ms)], self.offsets[self._frame_at(end_ms)]
+
+    def write_chunk(self, start_ms: int, end_ms: int, out, fade_ms: int = 0) -> int:
+        """start_ms〜end_ms のフレーム列を out（書き込み可能ファイル）へコピー。書いたバイト数を返す。"""
+        if fade_ms:
+            raise ValueError("MP3 のコピー分割ではフェードを掛けられません")
+        a, b = self.byte_range(start_ms, end_ms)
+        return _copy_range(self.buf, a, b, out)
+
+    def chunk_parts(self, start_ms: int, end_ms: int) -> list:
+        """start_ms〜end_ms の MP3 を元バッファの memoryview（コピーなし）で返す（送信用）。"""
+        a, b = self.byte_range(start_ms, end_ms)
+        return [memoryview(self.buf)[a:b]]
+
+    def chunk_bytes(self, start_ms: int, end_ms: int) -> bytes:
+        """短い範囲（無音探索の窓など）を単体の MP3 として取り出す。"""
+        out = io.BytesIO()
+        self.write_chunk(start_ms, end_ms, out)
+        return out.getvalue()
+
+
+def _find_sync(arr: np.ndarray, start: int, end: int) -> int:
+    """arr[start:end] の最初の 0xFF の位置（無ければ -1）。近くから窓を広げて探し、コピーは作らない。"""
+    win = 4096
+    while start < end:
+        stop = min(end, start + win)
+        hits = np.flatnonzero(arr[start:stop] == 0xFF)
+        if len(hits):
+            return start + int(hits[0])
+        start, win = stop, min(win * 2, COPY_BLOCK_BYTES)
+    return -1
+
+
+def index_mp3(buf) -> Optional[Mp3FrameIndex]:
+    """MP3 のフレームを走査して索引を作る。解析できなければ None。"""
+    mv = memoryview(buf)
+    end = len(mv)
+    if end >= 128 and bytes(mv[end - 128:end - 125]) == b"TAG":
+        end -= 128  # ID3v1
+
+    pos = _skip_id3v2(mv)
+    arr = np.frombuffer(mv, dtype=np.uint8)  # 同期の探索用（元バッファのビュー）
+    offsets = array("q")
+    ref = None  # (version, sr, samples, channels) — 最初の正しいフレームに揃える
+
+    while pos + 4 <= end:
+        hdr = _parse_mp3_header(mv, pos)
+        if hdr is not None and ref is not None and (hdr[0], hdr[1]) != ref[:2]:
+            hdr = None
+        if hdr is not None and ref is None:
+            # 誤同期を避けるため、最初のフレームは次のフレームも正しいことを確認
+            nxt = pos + hdr[2]
+            nxt_hdr = _parse_mp3_header(mv, nxt)
+            if nxt < end and (nxt_hdr is None or nxt_hdr[:2] != hdr[:2]):
+                hdr = None
+        if hdr is None:
+            # 同期が外れた → 次の 0xFF を探す（末尾のタグ等もここで読み飛ばす）
+            nxt = _find_sync(arr, pos + 1, end)
+            if nxt < 0:
+                break
+            pos = nxt
+            continue
+
+        version, sr, frame_len, samples = hdr
+        if pos + frame_len > end:
+            break
+        if ref is None:
+            ref = (version, sr, samples, 1 if (mv[pos + 3] >> 6) == 3 else 2)  # channel mode 3 = mono
+            # 先頭の Xing/Info/VBRI フレームはメタ情報なので索引に含めない
+            head = bytes(mv[pos:pos + min(frame_len, 64)])
+            if any(tag in head for tag in _VBR_TAGS):
+                pos += frame_len
+                continue
+        offsets.append(pos)
+        pos += frame_len
+
+    if ref is None or not offsets:
+        return None
+    offsets.append(pos)
+    return Mp3FrameIndex(mv, offsets, sample_rate=ref[1], samples_per_frame=ref[2], channels=ref[3])
+
+
+class WavLayout:
+    """PCM WAV の fmt / data チャンク配置。ms 範囲 → サンプルブロック境界のバイト範囲を返す。"""
+
+    fmt = "wav"
+
+    def __init__(self, buf, fmt_body: bytes, data_offset: int, data_size: int):
+        self.buf = buf
+        self.fmt_body = fmt_body
+        self.data_offset = data_offset
+        self.data_size = data_size
+        (self.format_tag, self.channels, self.sample_rate,
+         self.byte_rate, self.block_align, self.bits_per_sample) = struct.unpack("<HHIIHH", fmt_body[:16])
+
+    @property
+    def n_frames(self) -> int:
+        return self.data_size // self.block_align
+
+    @property
+    def duration_ms(self) -> int:
+        return self.n_frames * 1000 // self.sample_rate
+
+    @property
+    def bitrate_bps(self) -> float:
+        return float(self.byte_rate * 8)
+
+    @property
+    def is_pcm16(self) -> bool:
+        # 1 = WAVE_FORMAT_PCM, 0xFFFE = EXTENSIBLE（サブフォーマットは PCM 前提で bit 深度のみ確認）
+        return self.format_tag in (1, 0xFFFE) and self.bits_per_sample == 16
+
+    def byte_range(self, start_ms: int, end_ms: int) -> tuple[int, int]:
+        def _at(ms: int) -> int:
+            frame = min(self.n_frames, max(0, ms * self.sample_rate // 1000))
+            return self.data_offset + frame * self.block_align
+        return _at(start_ms), _at(end_ms)
+
+    def header_for(self, data_len: int) -> bytes:
+        """data_len バイトの PCM を持つ WAV ヘッダ（元の fmt チャンクをそのまま使用）。"""
+        fmt_chunk = b"fmt " + struct.pack("<I", len(self.fmt_body)) + self.fmt_body
+        if len(self.fmt_body) % 2:
+            fmt_chunk += b"\x00"
+        riff_size = 4 + len(fmt_chunk) + 8 + data_len + (data_len % 2)
+        return b"RIFF" + struct.pack("<I", riff_size) + b"WAVE" + fmt_chunk + b"data" + struct.pack("<I", data_len)
+
+    def write_chunk(self, start_ms: int, end_ms: int, out, fade_ms: int = 0) -> int:
+        """
+        ヘッダ＋ data の該当範囲をそのまま書き出す。fade_ms > 0（PCM16 のみ）なら
+        先頭・末尾の fade_ms 分だけフェードイン／アウトを掛ける（チャンクが短すぎれば掛けない）。
+        """
+        a, b = self.byte_range(start_ms, end_ms)
+        header = self.header_for(b - a)
+        out.write(header)
+        fade_bytes = self.sample_rate * fade_ms // 1000 * self.block_align if fade_ms > 0 else 0
+        if fade_bytes and not self.is_pcm16:
+            raise ValueError("フェードは PCM16 の WAV のみ対応です")
+        if fade_bytes and b - a > fade_bytes * 2:
+            mv = memoryview(self.buf)
+            out.write(_fade_pcm16(mv[a:a + fade_bytes], self.channels, rising=True))
+            _copy_range(self.buf, a + fade_bytes, b - fade_bytes, out)
+            out.write(_fade_pcm16(mv[b - fade_bytes:b], self.channels, rising=False))
+        else:
+            _copy_range(self.buf, a, b, out)
+        written = len(header) + (b - a)
+        if (b - a) % 2:
+            out.write(b"\x00")  # RIFF チャンクは偶数長
+            written += 1
+        return written
+
+    def chunk_parts(self, start_ms: int, end_ms: int) -> list:
+        """ヘッダ＋ data の該当範囲（元バッファの memoryview、コピーなし）を順に並べて返す（送信用・フェードなし）。"""
+        a, b = self.byte_range(start_ms, end_ms)
+        parts = [self.header_for(b - a), memoryview(self.buf)[a:b]]
+        if (b - a) % 2:
+            parts.append(b"\x00")
+        return parts
+
+    def chunk_bytes(self, start_ms: int, end_ms: int) -> bytes:
+        """短い範囲（無音探索の窓など）を単体の WAV として取り出す。"""
+        out = io.BytesIO()
+        self.write_chunk(start_ms, end_ms, out)
+        return out.getvalue()
+
+
+def parse_wav(buf) -> Optional[WavLayout]:
+    """RIFF/WAVE を走査して fmt と data の位置を得る。解析できなければ None。"""
+    mv = memoryview(buf)
+    if len(mv) < 12 or bytes(mv[0:4]) != b"RIFF" or bytes(mv[8:12]) != b"WAVE":
+        return None
+
+    pos = 12
+    fmt_body = None
+    while pos + 8 <= len(mv):
+        cid = bytes(mv[pos:pos + 4])
+        (size,) = struct.unpack("<I", mv[pos + 4:pos + 8])
+        body = pos + 8
+        if cid == b"fmt ":
+            fmt_body = bytes(mv[body:body + size])
+        elif cid == b"data":
+            if fmt_body is None or len(fmt_body) < 16:
+                return None
+            # ストリーミング書き出しの WAV は size が 0 / 0xFFFFFFFF のことがある → 実長に丸める
+            data_size = min(size, len(mv) - body) if size else len(mv) - body
+            layout = WavLayout(mv, fmt_body, body, data_size)
+            if layout.block_align <= 0 or layout.sample_rate <= 0:
+                return None
+            return layout
+        pos = body + size + (size % 2)
+    return None
+
+
+def open_copy_source(buf, fmt: str):
+    """fmt（"mp3" / "wav"）に応じてコピー分割用の索引を作る。非対応なら None。"""
+    if fmt == "mp3":
+        return index_mp3(buf)
+    if fmt == "wav":
+        return parse_wav(buf)
+    return None
+
+
+def _fade_pcm16(pcm, channels: int, rising: bool) -> bytes:
+    """インターリーブ PCM16（短い区間）に線形のフェードイン／アウトを掛ける。"""
+    x = np.frombuffer(pcm, dtype="<i2").reshape(-1, channels).astype(np.float32)
+    ramp = np.arange(len(x), dtype=np.float32) / max(1, len(x))
+    if not rising:
+        ramp = ramp[::-1]
+    return np.round(x * ramp[:, None]).astype("<i2").tobytes()
+
+
+def _copy_range(buf, a: int, b: int, out) -> int:
+    mv = memoryview(buf)
+    pos = a
+    while pos < b:
+        nxt = min(b, pos + COPY_BLOCK_BYTES)
+        out.write(mv[pos:nxt])
+        pos = nxt
+    return b - a
@@ -0,0 +1,344 @@
+# lib/transcribe_chunks.py
+# ============================================================
+# 長い音声の「チャンク分割 → 並列文字起こし → 順番どおりに連結」
+# ------------------------------------------------------------
+# 1 リクエストで送ると、2 時間の会議でも API の処理時間をまるごと直列に待つうえ、
+# アップロード上限（TRANSCRIBE_MAX_UPLOAD_BYTES）を超えるファイルは送れない。ここでは
+#   1) 分割計画（lib/audio_split.plan_ranges、短い重なり付き）を作り
+#   2) 各チャンクの切り出し（コピー or エンコード）と送信をスレッドプールで並列に行い
+#   3) 完了したものから on_result() で呼び出し元へ返し（途中経過の表示用）
+#   4) 最後にチャンク番号順に連結する（重なりの重複は lib/stitch で除去。
+#      セグメントがあればチャンクの開始時刻だけずらしたセグメントとして継ぎ目を決める）
+# 全体の待ち時間は「チャンク数 ÷ 並列数」回分のチャンク処理時間に近づく。
+#
+# - plan_chunks()         : 分割計画（chunk_ms と上限サイズから決めた長さ）
+# - jobs_by_copy()        : MP3/WAV をデコードせずにフレーム単位で切り出すジョブ（lib/stream_copy。
+#                           切り出しは元バッファの範囲を指すだけで、コピーは作らない）
+# - jobs_by_encode()      : デコード済み音声を mono/16kHz・MP3 32k で書き出すジョブ
+# - transcribe_chunks()   : 並列実行（post は呼び出し側が渡す。HTTP の詳細・流量制御はここでは持たない。
+#                           pages/02 は lib/api_client 経由で送るので、並列数を上げても rpm を超えない）
+#                           cache（lib/transcript_cache）を渡すと、送信バイト列＋パラメータが同じチャンクは送らない
+#                           done（lib/transcribe_jobs の完了済みチャンク）を渡すと、そのチャンクは切り出しもしない
+#                           post には lib/multipart_upload.Payload を渡す（ブロック単位でストリーミング送信できる）
+# - request_format()      : モデルごとに頼む応答形式（whisper-1 は verbose_json＝タイムスタンプ付きセグメント）
+# - request_fields()      : 送信するフォーム値（カスケード時の gpt-4o 系は json に include[]=logprobs を付ける）
+# - parse_response()      : 応答本文 → (本文, セグメント)。キャッシュ・チェックポイントには応答本文をそのまま残す
+# - stitch() / partial()  : 連結結果（StitchResult：本文＋セグメント＋継ぎ目ごとの信頼度）/ 途中経過のテキスト
+# - render_transcript()   : 連結結果を text / srt / vtt に書き出す（手元で作るので形式の切り替えに API は不要）
+# ============================================================
+from __future__ import annotations
+
+import json
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from lib.audio_io import export_bytes
+from lib.audio_split import ChunkPlan, plan_ranges, plans_from_ranges
+from lib.export_profiles import TRANSCRIPTION_PROFILES, ExportProfile
+from lib.multipart_upload import Payload, as_payload
+from lib.size_plan import chunk_ms_for_size
+from lib.stitch import Piece, Segment, StitchResult, stitch_pieces
+from lib.transcript_cache import TranscriptCache, transcript_key
+
+DEFAULT_CHUNK_SEC = 600         # 1 チャンクの長さ（秒）の既定
+DEFAULT_OVERLAP_MS = 1_500      # 境界の言葉が切れないよう前チャンクと重ねる長さ
+DEFAULT_CONCURRENCY = 4
+CHUNK_EXPORT_PROFILE = TRANSCRIPTION_PROFILES["文字起こし用（mono/16kHz・MP3 32k）"]
+
+CANCELLED_ERROR = "キャンセルされました（未送信）"
+
+# post(name, payload, mime) -> (text, request_id)
+PostFn = Callable[[str, Payload, str], Tuple[str, Optional[str]]]
+
+
+class TranscribeAPIError(RuntimeError):
+    """API が 2xx 以外を返した。request_id は問い合わせ用、headers は Retry-After などの判断用に保持する。"""
+
+    def __init__(self, status: int, body: str, request_id: Optional[str] = None, headers=None):
+        super().__init__(f"{status}: {body[:500]}")
+        self.status = status
+        self.body = body
+        self.request_id = request_id
+        self.headers = headers
+
+
+@dataclass(frozen=True)
+class ChunkJob:
+    index: int
+    start_ms: int
+    end_ms: int
+    load: Callable[[], Tuple[str, object, str]]  # () -> (送信ファイル名, bytes-like / Payload, MIME)。ワーカー側で呼ぶ
+
+
+@dataclass
+class ChunkResult:
+    index: int
+    start_ms: int
+    end_ms: int
+    text: str = ""         # API の応答本文そのまま（verbose_json なら JSON。parse_response() で解釈）
+    request_id: Optional[str] = None
+    elapsed: float = 0.0
+    n_bytes: int = 0
+    error: str = ""
+    cached: bool = False   # キャッシュから取得（課金なし。request_id は元のリクエストのもの）
+    resumed: bool = False  # 中断したジョブで完了済み（lib/transcribe_jobs。今回は送信・課金なし）
+
+    @property
+    def ok(self) -> bool:
+        return not self.error
+
+
+# ---------- 分割計画 ----------
+def plan_chunks(
+    total_ms: int,
+    chunk_ms: int,
+    overlap_ms: int = DEFAULT_OVERLAP_MS,
+    bitrate_bps: float | None = None,
+    max_bytes: int | None = None,
+) -> List[ChunkPlan]:
+    """chunk_ms（上限サイズから決まる長さの方が短ければそちら）で重なり付きの分割計画を作る。"""
+    if bitrate_bps and max_bytes:
+        chunk_ms = min(chunk_ms, chunk_ms_for_size(max_bytes, bitrate_bps))
+    if total_ms <= chunk_ms:
+        return [ChunkPlan(0, total_ms)]
+    return plans_from_ranges(plan_ranges(total_ms, chunk_ms, min(overlap_ms, chunk_ms // 2), absorb_tiny_tail=True))
+
+
+def jobs_by_copy(copy_src, parts: Sequence[ChunkPlan], base_name: str, ext: str, mime: str) -> List[ChunkJob]:
+    """コピー分割用の索引（Mp3FrameIndex / WavLayout）からフレーム境界で切り出すジョブ。"""
+    return [
+        ChunkJob(i, p.start_ms, p.end_ms,
+                 lambda p=p, i=i: (f"{base_name}_part{i:03d}.{ext}", Payload(*copy_src.chunk_parts(p.start_ms, p.end_ms)), mime))
+        for i, p in enumerate(parts, start=1)
+    ]
+
+
+def jobs_by_encode(audio, parts: Sequence[ChunkPlan], base_name: str, profile: ExportProfile = CHUNK_EXPORT_PROFILE) -> List[ChunkJob]:
+    """デコード済みの AudioSegment から切り出し、profile で書き出すジョブ。"""
+    kwargs = profile.export_kwargs()
+    mime = "audio/mpeg" if profile.format == "mp3" else f"audio/{profile.format}"
+    return [
+        ChunkJob(i, p.start_ms, p.end_ms,
+                 lambda p=p, i=i: (f"{base_name}_part{i:03d}.{profile.ext}",
+                                   export_bytes(profile.prepare(p.materialize(audio)), kwargs), mime))
+        for i, p in enumerate(parts, start=1)
+    ]
+
+
+# ---------- 並列実行 ----------
+def _run_job(
+    job: ChunkJob,
+    post: PostFn,
+    cache: Optional[TranscriptCache] = None,
+    cache_params: Optional[dict] = None,
+    use_cached: bool = True,
+    cancel: Optional[threading.Event] = None,
+) -> ChunkResult:
+    res = ChunkResult(job.index, job.start_ms, job.end_ms)
+    if cancel is not None and cancel.is_set():
+        res.error = CANCELLED_ERROR
+        return res
+    t0 = time.perf_counter()
+    try:
+        name, data, mime = job.load()
+        payload = as_payload(data)
+        res.n_bytes = len(payload)
+        if cache is not None:
+            audio_sha = payload.sha256()
+            key = transcript_key(audio_sha, cache_params or {})
+            hit = cache.get(key) if use_cached else None
+            if hit is not None:
+                res.text, res.request_id, res.cached = hit.text, hit.request_id, True
+                res.elapsed = time.perf_counter() - t0
+                return res
+        res.text, res.request_id = post(name, payload, mime)
+        if cache is not None:
+            cache.put(key, audio_sha, cache_params or {}, res.text, res.request_id)
+    except TranscribeAPIError as e:
+        res.error, res.request_id = str(e), e.request_id
+    except Exception as e:
+        res.error = f"{type(e).__name__}: {e}"
+    res.elapsed = time.perf_counter() - t0
+    return res
+
+
+def transcribe_chunks(
+    jobs: Sequence[ChunkJob],
+    post: PostFn,
+    concurrency: int = DEFAULT_CONCURRENCY,
+    on_result: Callable[[ChunkResult, Dict[int, ChunkResult]], None] | None = None,
+    cache: Optional[TranscriptCache] = None,
+    cache_params: Optional[dict] = None,
+    use_cached: bool = True,
+    done: Optional[Dict[int, ChunkResult]] = None,
+    cancel: Optional[threading.Event] = None,
+) -> List[ChunkResult]:
+    """
+    jobs を最大 concurrency 並列で送信し、チャンク番号順の結果を返す。
+    done（{index: 完了済みの結果}、再開時）に含まれるチャンクは切り出しも送信もせず、その結果を使う。
+    on_result(今回の結果, これまでの結果 {index: result}) は呼び出し元スレッドで完了順に呼ばれる
+    （Streamlit の描画はこの中で行ってよい）。失敗したチャンクは error 付きで返し、他は続行する。
+    cache を渡すと cache_params（model / response_format / language / prompt）と送信バイト列で引き、
+    成功した結果は保存する。use_cached=False なら引かずに送信し、結果で上書きする。
+    cancel（lib/job_queue のジョブの中止）が立つと、まだ始まっていないチャンクは送らず
+    error=CANCELLED_ERROR で返す（送信中のものは終わるまで待つ）。
+    """
+    done = dict(done or {})
+    todo = [job for job in jobs if job.index not in done]
+    if not todo:
+        return [done[job.index] for job in jobs]
+    with ThreadPoolExecutor(max_workers=max(1, min(concurrency, len(todo)))) as ex:
+        futures = [ex.submit(_run_job, job, post, cache, cache_params, use_cached, cancel) for job in todo]
+        for fut in as_completed(futures):
+            if fut.cancelled():
+                continue
+            res = fut.result()
+            if res.error == CANCELLED_ERROR:
+                continue
+            done[res.index] = res
+            if on_result is not None:
+                on_result(res, done)
+            if cancel is not None and cancel.is_set():
+                for f in futures:
+                    f.cancel()
+    return [done.get(job.index) or ChunkResult(job.index, job.start_ms, job.end_ms, error=CANCELLED_ERROR)
+            for job in jobs]
+
+
+# ---------- 応答の解釈 ----------
+# 各モデルに頼む「いちばん情報の多い形式」。タイムスタンプ付きのセグメントを返すのは whisper-1 の verbose_json のみ。
+# 応答本文はそのまま ChunkResult.text・キャッシュ・チェックポイントに残し、表示形式（text / srt / vtt）は手元で作る。
+REQUEST_FORMAT_BY_MODEL = {"whisper-1": "verbose_json"}
+# json でトークンごとの logprob を返せるモデル（include[]=logprobs。lib/cascade の信頼度に使う）
+LOGPROBS_MODELS = ("gpt-4o-transcribe", "gpt-4o-mini-transcribe")
+OUTPUT_FORMATS = ("text", "srt", "vtt")
+
+
+def request_format(model: str) -> str:
+    return REQUEST_FORMAT_BY_MODEL.get(model, "json")
+
+
+def request_fields(model: str, response_format: Optional[str] = None, logprobs: bool = False) -> dict:
+    """
+    model / response_format のフォーム値。logprobs=True（カスケードの 1 回目）で、
+    logprobs を返せるモデルなら include[]=logprobs も付ける（使わないときは頼まない）。
+    """
+    fmt = response_format or request_format(model)
+    fields = {"model": model, "response_format": fmt}
+    if logprobs and fmt == "json" and model in LOGPROBS_MODELS:
+        fields["include[]"] = "logprobs"
+    return fields
+
+
+# SRT（00:00:01,000）/ VTT（00:00:01.000）のタイムスタンプ
+_TS_RE = re.compile(r"(\d{2,}):(\d{2}):(\d{2})([,.])(\d{3})")
+
+
+def _ts_ms(m: re.Match) -> int:
+    h, mi, sec, _, ms = m.groups()
+    return (int(h) * 3600 + int(mi) * 60 + int(sec)) * 1000 + int(ms)
+
+
+def _fmt_ts(t: int, sep: str) -> str:
+    return f"{t // 3_600_000:02d}:{t // 60_000 % 60:02d}:{t // 1000 % 60:02d}{sep}{t % 1000:03d}"
+
+
+def _cue_segments(text: str, offset_ms: int) -> List[Segment]:
+    """SRT / VTT のキューを絶対時刻のセグメントにする（番号行・WEBVTT ヘッダは捨てる）。"""
+    segs = []
+    for block in re.split(r"\n\s*\n", text.replace("\r\n", "\n").strip()):
+        lines = block.strip().split("\n")
+        if lines and lines[0].strip().isdigit() and len(lines) > 1:
+            lines = lines[1:]
+        if not lines or "-->" not in lines[0]:
+            continue
+        ts = list(_TS_RE.finditer(lines[0]))
+        if len(ts) < 2:
+            continue
+        segs.append(Segment(_ts_ms(ts[0]) + offset_ms, _ts_ms(ts[1]) + offset_ms, "\n".join(lines[1:])))
+    return segs
+
+
+def parse_response(body: str) -> Tuple[str, Optional[List[Segment]]]:
+    """
+    応答本文を (本文, セグメント) に。verbose_json は segments（チャンク先頭からの ms）、json は text のみ（None）。
+    以前の設定で保存した srt / vtt / text の本文もそのまま読める。
+    """
+    s = (body or "").strip()
+    if s.startswith("{"):
+        try:
+            d = json.loads(s)
+        except ValueError:
+            d = None
+        if isinstance(d, dict):
+            segs = d.get("segments")
+            if segs is not None:
+                segs = [Segment(int(round(float(x["start"]) * 1000)), int(round(float(x["end"]) * 1000)), str(x.get("text", "")))
+                        for x in segs]
+            return str(d.get("text", "")), segs
+    if "-->" in s:
+        segs = _cue_segments(s, 0)
+        if segs:
+            return "\n".join(x.text for x in segs), segs
+    return body or "", None
+
+
+# ---------- 連結・書き出し ----------
+def render_cues(segs: Sequence[Segment], fmt: str) -> str:
+    """セグメントを SRT / VTT として書き出す（番号は通し）。"""
+    if fmt == "vtt":
+        body = "\n\n".join(f"{_fmt_ts(s.start_ms, '.')} --> {_fmt_ts(s.end_ms, '.')}\n{s.text.strip()}" for s in segs)
+        return "WEBVTT\n\n" + body + "\n"
+    return "\n\n".join(
+        f"{n}\n{_fmt_ts(s.start_ms, ',')} --> {_fmt_ts(s.end_ms, ',')}\n{s.text.strip()}" for n, s in enumerate(segs, start=1)
+    ) + "\n"
+
+
+def stitch(results: Sequence[ChunkResult]) -> StitchResult:
+    """
+    チャンク番号順に連結し、重なり部分の重複を除く（lib/stitch）。失敗したチャンクは飛ばす。
+    全チャンクにセグメントがあれば、チャンクの開始時刻だけずらしてセグメントとしてつなぐ（StitchResult.segments）。
+    """
+    ok = [r for r in results if r.ok]
+    pieces = []
+    for r in ok:
+        text, segs = parse_response(r.text)
+        if segs is not None:
+            segs = [Segment(s.start_ms + r.start_ms, s.end_ms + r.start_ms, s.text) for s in segs]
+        pieces.append(Piece(r.start_ms, r.end_ms, text, segments=segs, index=r.index))
+    if len(pieces) == 1 and pieces[0].start_ms == 0:
+        return StitchResult(pieces[0].text, segments=pieces[0].segments)  # 分割なし：API の応答そのまま
+    return stitch_pieces(pieces)
+
+
+def render_transcript(res: StitchResult, fmt: str, offset_map=None) -> str:
+    """
+    連結結果を text / srt / vtt で書き出す（API は呼ばない。形式の切り替えは何度でも無料）。
+    srt / vtt はセグメントが無ければ作れない（text を返す）。offset_map（lib/vad、無音除去）があれば
+    キューの時刻を元の録音の時刻に戻す。
+    """
+    if fmt not in ("srt", "vtt") or res.segments is None:
+        return res.text
+    segs = res.segments
+    if offset_map is not None:
+        segs = [Segment(int(round(offset_map.to_original(s.start_ms))), int(round(offset_map.to_original(s.end_ms, end=True))), s.text)
+                for s in segs]
+    return render_cues(segs, fmt)
+
+
+def partial(done: Dict[int, ChunkResult], n_chunks: int) -> str:
+    """途中経過：完了したチャンクは本文、未完了は「…処理中」の行で埋めて番号順に並べる。"""
+    lines = []
+    for i in range(1, n_chunks + 1):
+        r = done.get(i)
+        if r is None:
+            lines.append(f"…（チャンク {i}/{n_chunks} 処理中）")
+        elif r.ok:
+            lines.append(parse_response(r.text)[0].strip())
+        else:
+            lines.append(f"⚠️（チャンク {i}/{n_chunks} 失敗: {r.error[:120]}）")
+    return "\n".join(lines)
@@ -0,0 +1,309 @@
+# lib/transcribe_jobs.py
+# ============================================================
+# 文字起こしジョブのチェックポイント（中断しても、残りのチャンクだけ送り直す）
+# ------------------------------------------------------------
+# 長い音声の途中で API が失敗したり、ブラウザのタブを閉じたりすると、
+# 完了済みのチャンクも含めて最初からやり直し（＝再課金）になっていた。
+#
+# 1 ジョブ = <TRANSCRIBE_JOBS_DIR> の下の
+#   <job_id>.json         : 見出し（作成時に 1 回だけ書く）
+#     job_id   : SHA-256( 入力ファイルの SHA-256, 設定, 分割計画 )
+#                同じファイル・同じ設定・同じ計画なら同じジョブ（＝続きから）
+#     settings : model / response_format / language / prompt / vad_min_gap_ms / chunk_ms
+#                （再開時はページの入力ではなくこちらを使う）
+#     plan     : [[start_ms, end_ms], ...]（チャンク番号は 1 始まりの並び順）
+#   <job_id>.chunks.jsonl : チャンクが終わるたびに 1 行追記（ChunkResult。状態・本文・request-id・エラー）。
+#                           同じ番号は後の行が優先。無い番号は未送信
+#   inputs/<入力の SHA-256>.json : その入力のジョブの要約（完了数・設定・更新時刻）。再開ボタンの判定はこれだけ読む
+# チャンクごとの書き込みは追記 1 行と小さな要約だけ（ジョブ全体を書き直さない）。
+# 本文を読むのはジョブを開いたとき（open）だけで、再実行のたびには読まない。
+#
+# すべて成功したジョブは finish() で削除する（本文は lib/transcript_cache に残る）。
+# 失敗したチャンクが残ったジョブはページに「再開」ボタンとして出る。
+# TRANSCRIBE_JOB_MAX_AGE_DAYS より古いジョブはジョブを開くとき・一覧を作るときに消す。
+# ============================================================
+from __future__ import annotations
+
+import dataclasses
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import streamlit as st
+
+from config.config import TRANSCRIBE_JOB_MAX_AGE_DAYS, TRANSCRIBE_JOBS_DIR
+from lib.transcribe_chunks import ChunkResult
+
+_FORMAT_VERSION = 2
+
+
+def job_id_for(input_sha256: str, settings: dict, plan: Sequence[Tuple[int, int]]) -> str:
+    blob = json.dumps(
+        {"input": input_sha256, "settings": settings, "plan": [list(p) for p in plan]},
+        sort_keys=True, ensure_ascii=False,
+    )
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()[:32]
+
+
+@dataclass
+class TranscribeJob:
+    job_id: str
+    file_name: str
+    input_sha256: str
+    settings: dict
+    plan: List[Tuple[int, int]]
+    chunks: Dict[int, ChunkResult] = field(default_factory=dict)
+    created_at: float = 0.0
+    updated_at: float = 0.0
+
+    @property
+    def n_chunks(self) -> int:
+        return len(self.plan)
+
+    @property
+    def n_done(self) -> int:
+        return sum(1 for r in self.chunks.values() if r.ok)
+
+    @property
+    def is_complete(self) -> bool:
+        return self.n_done == self.n_chunks
+
+    def status(self, index: int) -> str:
+        """"done" / "failed" / "pending" """
+        r = self.chunks.get(index)
+        return "pending" if r is None else ("done" if r.ok else "failed")
+
+    def completed(self) -> Dict[int, ChunkResult]:
+        """成功済みのチャンク（resumed=True を付けた写し。今回は送らない・課金しない）。"""
+        return {i: dataclasses.replace(r, resumed=True) for i, r in self.chunks.items() if r.ok}
+
+    def summary(self) -> "JobSummary":
+        return JobSummary(self.job_id, self.file_name, self.settings, self.n_chunks, self.n_done, self.updated_at)
+
+    # ---------- JSON（見出しだけ。チャンクは .chunks.jsonl） ----------
+    def to_dict(self) -> dict:
+        return {
+            "version": _FORMAT_VERSION,
+            "job_id": self.job_id,
+            "file_name": self.file_name,
+            "input_sha256": self.input_sha256,
+            "settings": self.settings,
+            "plan": [list(p) for p in self.plan],
+            "created_at": self.created_at,
+        }
+
+    @classmethod
+    def from_dict(cls, d: dict) -> "TranscribeJob":
+        return cls(
+            job_id=d["job_id"],
+            file_name=d.get("file_name", ""),
+            input_sha256=d["input_sha256"],
+            settings=d.get("settings", {}),
+            plan=[(int(a), int(b)) for a, b in d["plan"]],
+            created_at=float(d.get("created_at", 0.0)),
+            updated_at=float(d.get("created_at", 0.0)),
+        )
+
+
+@dataclass
+class JobSummary:
+    """再開ボタン用のジョブの要約（本文を含まない。inputs/<入力>.json の 1 件）。"""
+    job_id: str
+    file_name: str
+    settings: dict
+    n_chunks: int
+    n_done: int
+    updated_at: float
+
+    @property
+    def is_complete(self) -> bool:
+        return self.n_done == self.n_chunks
+
+
+class JobStore:
+    def __init__(self, root: Path, max_age_days: float = TRANSCRIBE_JOB_MAX_AGE_DAYS):
+        self.root = Path(root)
+        self.max_age_sec = float(max_age_days) * 86400
+        (self.root / "inputs").mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+
+    def _path(self, job_id: str) -> Path:
+        return self.root / f"{job_id}.json"
+
+    def _chunks_path(self, job_id: str) -> Path:
+        return self.root / f"{job_id}.chunks.jsonl"
+
+    def _index_path(self, input_sha256: str) -> Path:
+        return self.root / "inputs" / f"{input_sha256}.json"
+
+    def _write_atomic(self, path: Path, obj) -> None:
+        data = json.dumps(obj, ensure_ascii=False).encode("utf-8")
+        fd, tmp = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp, path)
+        except BaseException:
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+            raise
+
+    # ---------- 入力ごとの要約 ----------
+    def _read_index(self, input_sha256: str) -> Dict[str, dict]:
+        try:
+            d = json.loads(self._index_path(input_sha256).read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return {}
+        return d if isinstance(d, dict) else {}
+
+    def _write_index(self, input_sha256: str, index: Dict[str, dict]) -> None:
+        path = self._index_path(input_sha256)
+        if index:
+            self._write_atomic(path, index)
+        else:
+            try:
+                path.unlink()
+            except OSError:
+                pass
+
+    def _update_index(self, job: TranscribeJob) -> None:
+        index = self._read_index(job.input_sha256)
+        index[job.job_id] = dataclasses.asdict(job.summary())
+        self._write_index(job.input_sha256, index)
+
+    # ---------- 読み込み ----------
+    def load(self, job_id: str) -> Optional[TranscribeJob]:
+        """見出し＋チャンクの記録（本文を含む）。ジョブを開くときだけ使う。"""
+        try:
+            d = json.loads(self._path(job_id).read_text(encoding="utf-8"))
+            if d.get("version") != _FORMAT_VERSION:
+                return None
+            job = TranscribeJob.from_dict(d)
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+        names = {f.name for f in dataclasses.fields(ChunkResult)}
+        try:
+            with open(self._chunks_path(job_id), encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        r = ChunkResult(**{k: v for k, v in json.loads(line).items() if k in names})
+                    except (ValueError, TypeError):
+                        continue  # 書きかけの行（追記中に落ちた）
+                    prev = job.chunks.get(r.index)
+                    if prev is None or r.ok or not prev.ok:
+                        job.chunks[r.index] = r
+            job.updated_at = os.path.getmtime(self._chunks_path(job_id))
+        except OSError:
+            pass
+        return job
+
+    # ---------- ジョブの開始・記録・終了 ----------
+    def open(
+        self,
+        input_sha256: str,
+        file_name: str,
+        settings: dict,
+        plan: Sequence[Tuple[int, int]],
+        fresh: bool = False,
+    ) -> TranscribeJob:
+        """同じ入力・設定・計画のジョブがあれば続きから（fresh=True なら作り直す）。"""
+        self.purge_expired()
+        job_id = job_id_for(input_sha256, settings, plan)
+        with self._lock:
+            job = None if fresh else self.load(job_id)
+            if job is None:
+                now = time.time()
+                job = TranscribeJob(job_id, file_name, input_sha256, dict(settings), [tuple(p) for p in plan],
+                                    created_at=now, updated_at=now)
+                try:
+                    self._chunks_path(job_id).unlink()
+                except OSError:
+                    pass
+                self._write_atomic(self._path(job_id), job.to_dict())
+                self._update_index(job)
+        return job
+
+    def record(self, job: TranscribeJob, res: ChunkResult) -> None:
+        """チャンクの結果を 1 行追記する（前回の成功を失敗で上書きはしない）。"""
+        if res.resumed:
+            return
+        with self._lock:
+            prev = job.chunks.get(res.index)
+            if prev is not None and prev.ok and not res.ok:
+                return
+            job.chunks[res.index] = res
+            job.updated_at = time.time()
+            with open(self._chunks_path(job.job_id), "a", encoding="utf-8") as f:
+                f.write(json.dumps(dataclasses.asdict(res), ensure_ascii=False) + "\n")
+            self._update_index(job)
+
+    def finish(self, job: TranscribeJob) -> bool:
+        """全チャンク成功なら記録を消して True。失敗が残っていれば残す（再開できる）。"""
+        if not job.is_complete:
+            return False
+        self.delete(job.job_id, job.input_sha256)
+        return True
+
+    def delete(self, job_id: str, input_sha256: Optional[str] = None) -> None:
+        with self._lock:
+            for path in (self._path(job_id), self._chunks_path(job_id)):
+                try:
+                    path.unlink()
+                except OSError:
+                    pass
+            if input_sha256 is not None:
+                index = self._read_index(input_sha256)
+                if index.pop(job_id, None) is not None:
+                    self._write_index(input_sha256, index)
+
+    def purge_expired(self) -> None:
+        """TRANSCRIBE_JOB_MAX_AGE_DAYS より前から更新の無い記録を消す（ファイルの stat だけ。本文は読まない）。"""
+        cutoff = time.time() - self.max_age_sec
+
+        def mtime(path: Path) -> float:
+            try:
+                return path.stat().st_mtime
+            except OSError:
+                return 0.0
+
+        for path in self.root.glob("*.json"):
+            job_id = path.stem
+            if max(mtime(path), mtime(self._chunks_path(job_id))) < cutoff:
+                self.delete(job_id)
+        for path in list(self.root.glob("*.chunks.jsonl")) + list((self.root / "inputs").glob("*.json")):
+            if mtime(path) < cutoff:
+                try:
+                    path.unlink()
+                except OSError:
+                    pass
+
+    # ---------- 一覧 ----------
+    def incomplete_for(self, input_sha256: str) -> List[JobSummary]:
+        """このファイルの未完了ジョブの要約（新しい順）。入力ごとの要約ファイルだけを読む。"""
+        cutoff = time.time() - self.max_age_sec
+        jobs = []
+        for d in self._read_index(input_sha256).values():
+            try:
+                job = JobSummary(**d)
+            except TypeError:
+                continue
+            if job.updated_at < cutoff:
+                self.delete(job.job_id, input_sha256)
+                continue
+            if not job.is_complete and self._path(job.job_id).exists():
+                jobs.append(job)
+        return sorted(jobs, key=lambda j: j.updated_at, reverse=True)
+
+
+@st.cache_resource
+def get_job_store() -> JobStore:
+    """プロセス内で共有する JobStore（全セッション共通）。"""
+    return JobStore(TRANSCRIBE_JOBS_DIR)
@@ -0,0 +1,176 @@
+# lib/transcript_cache.py
+# ============================================================
+# 文字起こし結果の永続キャッシュ（内容アドレス・全セッション共通）
+# ------------------------------------------------------------
+# 「文字起こしを実行」を押すたびに同じ音声を再アップロードし、再課金していた。
+# ブラウザの再読み込みや Streamlit の再実行でよく起きるため、送信の手前に置く。
+#
+# - キー : SHA-256( 送信する音声バイト列の SHA-256, model, response_format, language, prompt )
+#          チャンク分割時はチャンクごと（同じ録音の一部だけ変わっても他は再利用される）
+# - 本文 : <root>/blobs/<先頭2文字>/<key>.z（zlib 圧縮、一時ファイル → 置き換え）
+# - 索引 : <root>/index.sqlite3（request-id・モデル・サイズ・最終アクセス時刻）
+#
+# 【容量管理】
+# - 圧縮後の合計サイズが max_bytes を超えたら、最終アクセスが古いものから削除する（LRU）。
+#   合計は索引の SUM(size) で求める（ディレクトリは走査しない）。
+# - 索引は操作ごとに接続を開く（スレッド間で共有しない）。書き込みはロックで直列化。
+# ============================================================
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+import zlib
+from contextlib import contextmanager
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional
+
+import streamlit as st
+
+from config.config import TRANSCRIPT_CACHE_DIR, TRANSCRIPT_CACHE_MAX_BYTES
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS transcripts (
+    key             TEXT PRIMARY KEY,
+    audio_sha256    TEXT NOT NULL,
+    model           TEXT NOT NULL,
+    response_format TEXT NOT NULL,
+    request_id      TEXT,
+    size            INTEGER NOT NULL,
+    created_at      REAL NOT NULL,
+    last_access     REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS transcripts_last_access ON transcripts(last_access);
+"""
+
+
+@dataclass(frozen=True)
+class CachedTranscript:
+    text: str
+    request_id: Optional[str]
+    created_at: float
+
+
+def transcript_key(audio_sha256: str, params: dict) -> str:
+    """
+    音声の SHA-256 と送信パラメータ（model / response_format / language / prompt）からキーを作る。
+    include[]（logprobs など応答に足す項目）は指定があるときだけキーに含める（以前のキーを変えないため）。
+    """
+    fields = {k: params.get(k) or "" for k in ("model", "response_format", "language", "prompt")}
+    if params.get("include[]"):
+        fields["include"] = params["include[]"]
+    blob = json.dumps({"audio": audio_sha256, **fields}, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+
+class TranscriptCache:
+    def __init__(self, root: Path, max_bytes: int):
+        self.root = Path(root)
+        self.max_bytes = int(max_bytes)
+        (self.root / "blobs").mkdir(parents=True, exist_ok=True)
+        self._db_path = self.root / "index.sqlite3"
+        self._lock = threading.Lock()
+        with self._connect() as db:
+            db.execute("PRAGMA journal_mode=WAL")
+            db.executescript(_SCHEMA)
+
+    # ---------- 内部ユーティリティ ----------
+    @contextmanager
+    def _connect(self):
+        """接続を開き、ブロックを抜けたらコミットして閉じる。"""
+        db = sqlite3.connect(self._db_path, timeout=30)
+        try:
+            with db:
+                yield db
+        finally:
+            db.close()
+
+    def _blob_path(self, key: str) -> Path:
+        return self.root / "blobs" / key[:2] / f"{key}.z"
+
+    def _write_atomic(self, path: Path, data: bytes) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp, path)
+        except BaseException:
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+            raise
+
+    # ---------- 取得・保存 ----------
+    def get(self, key: str) -> Optional[CachedTranscript]:
+        with self._connect() as db:
+            row = db.execute("SELECT request_id, created_at FROM transcripts WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        try:
+            text = zlib.decompress(self._blob_path(key).read_bytes()).decode("utf-8")
+        except (OSError, zlib.error, UnicodeDecodeError):
+            self.delete(key)
+            return None
+        with self._lock, self._connect() as db:
+            db.execute("UPDATE transcripts SET last_access = ? WHERE key = ?", (time.time(), key))
+        return CachedTranscript(text, row[0], row[1])
+
+    def put(self, key: str, audio_sha256: str, params: dict, text: str, request_id: Optional[str]) -> None:
+        data = zlib.compress(text.encode("utf-8"), 6)
+        now = time.time()
+        with self._lock:
+            self._write_atomic(self._blob_path(key), data)
+            with self._connect() as db:
+                db.execute(
+                    "INSERT OR REPLACE INTO transcripts VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (key, audio_sha256, params.get("model", ""), params.get("response_format", ""),
+                     request_id, len(data), now, now),
+                )
+            self._evict()
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            with self._connect() as db:
+                db.execute("DELETE FROM transcripts WHERE key = ?", (key,))
+            try:
+                self._blob_path(key).unlink()
+            except OSError:
+                pass
+
+    # ---------- LRU 追い出し ----------
+    def stats(self) -> tuple[int, int]:
+        """(件数, 圧縮後の合計バイト数)"""
+        with self._connect() as db:
+            n, total = db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM transcripts").fetchone()
+        return int(n), int(total)
+
+    def _evict(self) -> None:
+        with self._connect() as db:
+            (total,) = db.execute("SELECT COALESCE(SUM(size), 0) FROM transcripts").fetchone()
+            if total <= self.max_bytes:
+                return
+            victims = []
+            for key, size in db.execute("SELECT key, size FROM transcripts ORDER BY last_access"):
+                victims.append(key)
+                total -= size
+                if total <= self.max_bytes:
+                    break
+            db.executemany("DELETE FROM transcripts WHERE key = ?", [(k,) for k in victims])
+        for key in victims:
+            try:
+                self._blob_path(key).unlink()
+            except OSError:
+                pass
+
+
+@st.cache_resource
+def get_transcript_cache() -> TranscriptCache:
+    """プロセス内で共有する TranscriptCache（全セッション共通）。"""
+    return TranscriptCache(TRANSCRIPT_CACHE_DIR, TRANSCRIPT_CACHE_MAX_BYTES)
@@ -0,0 +1,201 @@
+# lib/vad.py
+# ============================================================
+# 発話区間検出（VAD）による無音カットと、元の時刻への対応表（オフセットマップ）
+# ------------------------------------------------------------
+# 会議録音には開始前の待ち時間・休憩・長い沈黙が多く含まれ、文字起こしは
+# 音声の分数で課金される。ここではネットワークモデルを使わず、NumPy だけで
+#   - フレーム（30ms）ごとの短時間エネルギー（dBFS）とゼロ交差率（ZCR）
+#   - ノイズフロア（エネルギーの下位パーセンタイル）からの相対しきい値
+#   - 無声子音（低エネルギー・高 ZCR）の救済、前後のパディング（ハングオーバー）
+# で発話フレームを判定し、min_gap_ms 以上続く非発話区間だけを取り除く。
+#
+# - frame_features_streaming() : window_ms ずつデコードしながら特徴量を計算（メモリ一定）
+# - speech_spans()             : 残す区間 [(start_ms, end_ms), ...]（元の時刻）
+# - speech_offset_map()        : 上 2 つをまとめて OffsetMap を返す
+# - OffsetMap                  : カット後の時刻 → 元の時刻 の対応表（JSON で保存可能）
+# - trim_audio()               : 残す区間だけを連結した AudioSegment
+# ============================================================
+from __future__ import annotations
+
+import bisect
+import json
+from dataclasses import dataclass, field
+from typing import Callable, List, Sequence, Tuple
+
+import numpy as np
+
+from lib.envelope import LOUDNESS_WINDOW_MS, samples_from_segment
+
+VAD_FRAME_MS = 30
+VAD_MIN_GAP_MS = 2_000      # これ以上続く非発話だけを除去（短い間は残す）
+VAD_PAD_MS = 300            # 発話の前後に残す余白
+VAD_MARGIN_DB = 10.0        # ノイズフロアからの相対しきい値
+VAD_ABS_FLOOR_DBFS = -55.0  # これ未満は常に非発話
+VAD_NOISE_PERCENTILE = 10
+VAD_UNVOICED_ZCR = 0.25     # 無声子音（サ行など）とみなす ZCR（1 サンプルあたり）
+VAD_UNVOICED_DB = 6.0       # 無声子音はしきい値からこの dB 下まで発話扱い
+
+
+def frame_features(samples: np.ndarray, sample_rate: int, frame_ms: int = VAD_FRAME_MS) -> Tuple[np.ndarray, np.ndarray]:
+    """frame_ms ごとの (エネルギー dBFS, ZCR)。末尾の端数は 0 埋め。"""
+    win = max(1, sample_rate * frame_ms // 1000)
+    n = -(-len(samples) // win)
+    if n == 0:
+        return np.zeros(0, dtype=np.float32), np.zeros(0, dtype=np.float32)
+    padded = np.zeros(n * win, dtype=np.float32)
+    padded[: len(samples)] = samples
+    frames = padded.reshape(n, win)
+    rms = np.sqrt(np.einsum("ij,ij->i", frames, frames) / win)
+    db = (20 * np.log10(np.maximum(rms, 1e-6))).astype(np.float32)
+    signs = np.signbit(frames)
+    zcr = (np.count_nonzero(signs[:, 1:] != signs[:, :-1], axis=1) / win).astype(np.float32)
+    return db, zcr
+
+
+def frame_features_streaming(
+    decode_fn: Callable[[int, int], object],
+    total_ms: int,
+    frame_ms: int = VAD_FRAME_MS,
+    window_ms: int = LOUDNESS_WINDOW_MS,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """decode_fn(a_ms, b_ms) → AudioSegment を window_ms ずつ呼んで特徴量を作る（全体は展開しない）。"""
+    window_ms = max(frame_ms, window_ms // frame_ms * frame_ms)
+    n_total = -(-total_ms // frame_ms)
+    db = np.full(n_total, -120.0, dtype=np.float32)
+    zcr = np.zeros(n_total, dtype=np.float32)
+    for a in range(0, total_ms, window_ms):
+        b = min(total_ms, a + window_ms)
+        samples, sr = samples_from_segment(decode_fn(a, b))
+        d, z = frame_features(samples, sr, frame_ms)
+        row0 = a // frame_ms
+        rows = min(len(d), n_total - row0, -(-(b - a) // frame_ms))
+        db[row0:row0 + rows] = d[:rows]
+        zcr[row0:row0 + rows] = z[:rows]
+    return db, zcr
+
+
+def speech_mask(db: np.ndarray, zcr: np.ndarray) -> np.ndarray:
+    """フレームごとの発話判定（パディング前）。"""
+    if len(db) == 0:
+        return np.zeros(0, dtype=bool)
+    floor = float(np.percentile(db, VAD_NOISE_PERCENTILE))
+    thr = max(floor + VAD_MARGIN_DB, VAD_ABS_FLOOR_DBFS)
+    voiced = db >= thr
+    unvoiced = (db >= thr - VAD_UNVOICED_DB) & (zcr >= VAD_UNVOICED_ZCR) & (db >= VAD_ABS_FLOOR_DBFS)
+    return voiced | unvoiced
+
+
+def speech_spans(
+    db: np.ndarray,
+    zcr: np.ndarray,
+    total_ms: int,
+    frame_ms: int = VAD_FRAME_MS,
+    min_gap_ms: int = VAD_MIN_GAP_MS,
+    pad_ms: int = VAD_PAD_MS,
+) -> List[Tuple[int, int]]:
+    """
+    残す区間（元の時刻, ms）。発話フレームを pad_ms だけ前後に広げ、
+    min_gap_ms 未満の非発話は残す（＝ min_gap_ms 以上の非発話だけを除去）。
+    発話が 1 つも無ければ空リスト。
+    """
+    mask = speech_mask(db, zcr)
+    if not mask.any():
+        return []
+    pad = pad_ms // frame_ms
+    if pad > 0:
+        mask = np.convolve(mask.astype(np.int32), np.ones(2 * pad + 1, dtype=np.int32), mode="same") > 0
+
+    edges = np.flatnonzero(np.diff(np.concatenate(([0], mask.astype(np.int8), [0]))))
+    starts, ends = edges[0::2] * frame_ms, np.minimum(edges[1::2] * frame_ms, total_ms)
+
+    spans: List[Tuple[int, int]] = []
+    for s, e in zip(starts.tolist(), ends.tolist()):
+        if spans and s - spans[-1][1] < min_gap_ms:
+            spans[-1] = (spans[-1][0], e)
+        else:
+            spans.append((s, e))
+    # 先頭・末尾の短い非発話も残す（切っても節約にならず、冒頭の語が欠けやすい）
+    if spans[0][0] < min_gap_ms:
+        spans[0] = (0, spans[0][1])
+    if total_ms - spans[-1][1] < min_gap_ms:
+        spans[-1] = (spans[-1][0], total_ms)
+    return spans
+
+
+@dataclass
+class OffsetMap:
+    """カット後の音声の時刻 → 元の録音の時刻。spans は残した区間（元の時刻）。"""
+    spans: List[Tuple[int, int]]
+    total_ms: int
+    _starts: List[int] = field(init=False, repr=False)
+
+    def __post_init__(self) -> None:
+        self.spans = [(int(s), int(e)) for s, e in self.spans]
+        self._starts = []
+        t = 0
+        for s, e in self.spans:
+            self._starts.append(t)
+            t += e - s
+
+    @classmethod
+    def identity(cls, total_ms: int) -> "OffsetMap":
+        return cls([(0, total_ms)] if total_ms > 0 else [], total_ms)
+
+    @property
+    def kept_ms(self) -> int:
+        return sum(e - s for s, e in self.spans)
+
+    @property
+    def removed_ms(self) -> int:
+        return self.total_ms - self.kept_ms
+
+    def to_original(self, t_ms: float, end: bool = False) -> float:
+        """
+        カット後の t_ms を元の時刻へ。区間の継ぎ目ちょうどは、既定では後ろの区間の先頭、
+        end=True（区間の終端として使う場合）では前の区間の末尾に対応させる。
+        """
+        if not self.spans:
+            return t_ms
+        i = max(0, (bisect.bisect_left if end else bisect.bisect_right)(self._starts, t_ms) - 1)
+        return self.spans[i][0] + (t_ms - self._starts[i])
+
+    def to_json(self) -> str:
+        return json.dumps({"version": 1, "total_ms": self.total_ms, "spans": self.spans}, ensure_ascii=False)
+
+    @classmethod
+    def from_json(cls, text: str) -> "OffsetMap":
+        d = json.loads(text)
+        return cls([tuple(x) for x in d["spans"]], int(d["total_ms"]))
+
+
+def speech_offset_map(
+    decode_fn: Callable[[int, int], object],
+    total_ms: int,
+    min_gap_ms: int = VAD_MIN_GAP_MS,
+    pad_ms: int = VAD_PAD_MS,
+) -> OffsetMap:
+    """decode_fn から発話区間を検出して OffsetMap を作る。発話が見つからなければ何も削らない。"""
+    db, zcr = frame_features_streaming(decode_fn, total_ms)
+    spans = speech_spans(db, zcr, total_ms, min_gap_ms=min_gap_ms, pad_ms=pad_ms)
+    return OffsetMap(spans, total_ms) if spans else OffsetMap.identity(total_ms)
+
+
+def trim_audio(audio, spans: Sequence[Tuple[int, int]]):
+    """残す区間だけを連結した AudioSegment（生 PCM を 1 回だけ連結する）。"""
+    if len(spans) == 1 and spans[0] == (0, len(audio)):
+        return audio
+    from pydub import AudioSegment
+
+    raw = memoryview(audio.raw_data)
+    fb = audio.frame_width
+
+    def _off(ms: int) -> int:
+        return ms * audio.frame_rate // 1000 * fb
+
+    return AudioSegment(
+        data=b"".join(raw[_off(s):_off(e)] for s, e in spans),
+        sample_width=audio.sample_width,
+        frame_rate=audio.frame_rate,
+        channels=audio.channels,
+    )
+
@@ -0,0 +1,142 @@
+# lib/zip_output.py
+# ============================================================
+# 分割結果の ZIP を「スプール一時ファイル」に書き出すヘルパー
+# ------------------------------------------------------------
+# - 閾値（SPLIT_ZIP_SPOOL_MAX_BYTES）までは
+#   メモリ、超えたら名前付きの一時ファイル（ディスク）へ退避する（SpillFile）。
+# - MP3 などもともと圧縮済みの音声は ZIP_STORED（再圧縮しない）、
+#   CSV などのテキストは ZIP_DEFLATED。
+# - チャンクごとの BytesIO → mem_zip への二重コピーをやめ、エントリへ直接書き込む。
+# - st.download_button へはメモリ上なら bytes、ディスク上なら一時ファイルを読み取り専用で開いて渡す。
+#   ※ Streamlit（1.37）は渡されたデータをメディアストア（メモリ）へ一度コピーするので、
+#     ダウンロード自体はディスクから直接配信されない。退避で抑えられるのは ZIP を作る間のメモリ。
+# ============================================================
+from __future__ import annotations
+
+import io
+import os
+import shutil
+import tempfile
+import time
+import zipfile
+from pathlib import PurePosixPath
+from typing import Optional
+
+from config.config import SPLIT_ZIP_SPOOL_MAX_BYTES
+
+COPY_BLOCK_BYTES = 1 << 20
+
+# 再圧縮しても縮まない（圧縮済み）拡張子
+STORED_SUFFIXES = frozenset({".mp3", ".m4a", ".aac", ".ogg", ".opus", ".webm", ".flac", ".zip"})
+
+
+def compress_type_for(name: str) -> int:
+    return zipfile.ZIP_STORED if PurePosixPath(name).suffix.lower() in STORED_SUFFIXES else zipfile.ZIP_DEFLATED
+
+
+class SpillFile:
+    """
+    書き込み用のファイル。max_size まではメモリ（BytesIO）、超えたら名前付き一時ファイルへ移して続きを書く。
+    ZipFile が使う write / seek / tell / flush だけを持つ。
+    """
+
+    def __init__(self, max_size: int):
+        self.max_size = int(max_size)
+        self._f = io.BytesIO()
+        self.path: Optional[str] = None  # ディスクへ移した後の一時ファイル
+
+    @property
+    def on_disk(self) -> bool:
+        return self.path is not None
+
+    def _spill(self) -> None:
+        fd, path = tempfile.mkstemp(suffix=".zip")
+        f = os.fdopen(fd, "w+b")
+        pos = self._f.tell()
+        with self._f.getbuffer() as mv:
+            f.write(mv)
+        f.seek(pos)
+        self._f, self.path = f, path
+
+    def write(self, b) -> int:
+        if self.path is None and self._f.tell() + len(b) > self.max_size:
+            self._spill()
+        return self._f.write(b)
+
+    def seek(self, offset: int, whence: int = os.SEEK_SET) -> int:
+        return self._f.seek(offset, whence)
+
+    def tell(self) -> int:
+        return self._f.tell()
+
+    def flush(self) -> None:
+        self._f.flush()
+
+    def getvalue(self) -> bytes:
+        """メモリ上にあるときの内容。"""
+        return self._f.getvalue()
+
+    def close(self) -> None:
+        self._f.close()
+        if self.path is not None:
+            try:
+                os.remove(self.path)
+            except OSError:
+                pass
+
+
+class SpooledZip:
+    """SpillFile 上の ZIP。with で使うと抜けた時点で ZIP を閉じる（ファイルは close() まで残る）。"""
+
+    def __init__(self, max_size: int = SPLIT_ZIP_SPOOL_MAX_BYTES):
+        self.file = SpillFile(max_size)
+        self.zf = zipfile.ZipFile(self.file, "w", compression=zipfile.ZIP_DEFLATED)
+        self._reader = None
+
+    def __enter__(self) -> "SpooledZip":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.zf.close()
+
+    def _info(self, name: str) -> zipfile.ZipInfo:
+        info = zipfile.ZipInfo(name, date_time=time.localtime()[:6])
+        info.compress_type = compress_type_for(name)
+        return info
+
+    def writestr(self, name: str, data: bytes) -> None:
+        self.zf.writestr(self._info(name), data)
+
+    def open(self, name: str):
+        """エントリへ直接ストリーム書き込みするためのファイルオブジェクト。"""
+        return self.zf.open(self._info(name), "w", force_zip64=True)
+
+    def write_file(self, path, name: str) -> None:
+        """ディスク上のファイルをブロック単位でエントリへコピーする（全体をメモリに読まない）。"""
+        with open(path, "rb") as src, self.open(name) as entry:
+            shutil.copyfileobj(src, entry, COPY_BLOCK_BYTES)
+
+    @property
+    def on_disk(self) -> bool:
+        return self.file.on_disk
+
+    @property
+    def size(self) -> int:
+        pos = self.file.tell()
+        self.file.seek(0, os.SEEK_END)
+        n = self.file.tell()
+        self.file.seek(pos)
+        return n
+
+    def download_data(self):
+        """st.download_button(data=...) に渡せる形で返す（ZIP を閉じた後に呼ぶこと）。"""
+        self.file.flush()
+        if not self.on_disk:
+            return self.file.getvalue()
+        self._reader = open(self.file.path, "rb")
+        return self._reader
+
+    def close(self) -> None:
+        if self._reader is not None:
+            self._reader.close()
+        self.file.close()
@@ -1,13 +1,42 @@
-import io
-import math
-import zipfile
-from datetime import timedelta
+import os
+import tempfile
 from pathlib import Path
 
 import streamlit as st
-from pydub import AudioSegment
+
+from config.config import TRANSCRIBE_MAX_UPLOAD_BYTES
+from lib.audio_io import backend_name, decode
+from lib.audio_split import (
+    billed_minutes,
+    build_index_csv,
+    chunk_filename,
+    hhmmss,
+    plan_ranges,
+    plan_silence_ranges,
+    plans_from_ranges,
+    split_with_overlap,
+)
+from lib.content_hash import upload_content_key
+from lib.decode_cache import get_decode_cache
+from lib.encode_pool import DEFAULT_ENCODE_WORKERS, encode_chunks, encode_inline, spool_pcm
+from lib.envelope import (
+    LOUDNESS_RES_MS,
+    envelope_from_segment,
+    envelope_to_npy_bytes,
+    loudness_envelope_streaming,
+)
+from lib.export_profiles import TRANSCRIPTION_PROFILES, upload_seconds
+from lib.size_plan import chunk_ms_for_size, estimate_output_bps, oversized_parts
+from lib.split_job import SplitSettings, choose_copy_source, output_spec, run_batch
+from lib.vad import VAD_MIN_GAP_MS, OffsetMap, speech_offset_map, trim_audio
+from lib.zip_output import SpooledZip
+from ui.job_panel import keep_session_jobs_alive
 
 st.set_page_config(page_title="音声分割ツール（MP3/WAV・オーバーラップ）", page_icon="🎧", layout="centered")
+
+with st.sidebar:
+    keep_session_jobs_alive()  # ほかのページで投入した実行中ジョブの生存確認
+
 st.title("🎧 音声分割ツール（MP3/WAV・オーバーラップ付き）")
 
 st.write(
@@ -17,67 +46,188 @@ st.write(
 
 with st.sidebar:
     st.header("設定")
-    chunk_min = st.selectbox("チャンク長（分）", [3, 5, 10, 15, 20, 30], index=4)
+    size_mode = st.checkbox(
+        "アップロード上限サイズからチャンク長を決める",
+        value=False,
+        help="書き出し後のビットレート（実測または設定値）から、1チャンクが上限に収まる長さを自動で決めます。",
+    )
+    max_chunk_mb = st.number_input(
+        "1チャンクの上限（MB）",
+        min_value=1.0,
+        max_value=500.0,
+        value=round(TRANSCRIBE_MAX_UPLOAD_BYTES / 1e6 - 1, 1),
+        step=1.0,
+        disabled=not size_mode,
+        help=f"文字起こし API の上限は {TRANSCRIBE_MAX_UPLOAD_BYTES / 1e6:.0f} MB です。",
+    )
+    chunk_min = st.selectbox("チャンク長（分）", [3, 5, 10, 15, 20, 30], index=4, disabled=size_mode)
     overlap_min = st.number_input("オーバーラップ（分）", min_value=0.0, max_value=10.0, value=1.0, step=0.5)
-    export_fmt = st.selectbox("書き出しフォーマット", ["mp3", "wav (PCM16)"], index=0)
+    export_fmt = st.selectbox(
+        "書き出しフォーマット",
+        ["mp3", "wav (PCM16)", *TRANSCRIPTION_PROFILES.keys()],
+        index=0,
+        help="「文字起こし用」は mono / 16kHz / 低ビットレートに変換し、アップロード量を大きく減らします。",
+    )
+    transcription_profile = TRANSCRIPTION_PROFILES.get(export_fmt)
     target_bitrate = st.selectbox(
         "（MP3時のみ）ビットレート",
         ["原則そのまま/自動", "128k", "160k", "192k", "256k", "320k"],
         index=2,
-        help="WAV出力では無効です。"
+        help="WAV出力・文字起こし用プロファイルでは無効です。",
+        disabled=transcription_profile is not None,
+    )
+    upload_mbps = st.number_input(
+        "想定アップロード速度（Mbps）", min_value=0.5, max_value=1000.0, value=10.0, step=0.5,
+        help="プレビュー表のアップロード時間の目安に使います。",
     )
     fade_ms = st.number_input("フェード（クリックノイズ低減, ms）", min_value=0, max_value=2000, value=0, step=100)
+    encode_workers = st.number_input(
+        "エンコード並列数（プロセス）",
+        min_value=1,
+        max_value=max(1, os.cpu_count() or 1),
+        value=DEFAULT_ENCODE_WORKERS,
+        step=1,
+        help="再エンコードが必要な場合に、チャンクを複数プロセスで同時にエンコードします。1 で逐次実行。",
+    )
     min_tail_keep = st.checkbox("最後の“短すぎる尻尾”は前チャンクに吸収（重複を増やさない）", value=True)
+    with_envelope = st.checkbox(
+        f"波形エンベロープ（{LOUDNESS_RES_MS}ms 間隔の min/max/RMS）を ZIP に同梱",
+        value=True,
+        help="_envelope.npy（int16, 形状 N×3）。波形表示・無音検出・再分割の計画を、再デコードなしで行えます。",
+    )
+
+    vad_trim = st.checkbox(
+        "無音区間を除去してから分割（VAD・課金分数を削減）",
+        value=False,
+        help="長い無音（開始前・休憩など）を除いてから分割します。元の録音の時刻は index CSV の orig_* 列と"
+             " _offset_map.json で対応付けられます。再エンコードが必要になります。",
+    )
+    vad_min_gap_sec = st.number_input(
+        "（無音除去時）除去する無音の最短長（秒）",
+        min_value=0.5, max_value=60.0, value=VAD_MIN_GAP_MS / 1000, step=0.5, disabled=not vad_trim,
+    )
 
-uploaded = st.file_uploader("音声ファイルをアップロード（MP3/WAV）", type=["mp3", "wav"])
+    snap_silence = st.checkbox(
+        "境界を無音位置に寄せる（オーバーラップを秒単位に削減）",
+        value=False,
+        help="チャンク長の手前・探索幅の範囲で最も静かな位置で切ります。発話途中で切れにくくなるため、重なりを短くできます。",
+    )
+    snap_overlap_sec = st.number_input(
+        "（無音寄せ時）オーバーラップ（秒）", min_value=0, max_value=60, value=2, step=1, disabled=not snap_silence
+    )
+    snap_tolerance_sec = st.number_input(
+        "（無音寄せ時）探索幅（秒）", min_value=5, max_value=300, value=30, step=5, disabled=not snap_silence
+    )
 
-def hhmmss(ms: int) -> str:
-    return str(timedelta(milliseconds=ms)).split(".")[0]
+    st.caption(
+        "音声の読み書き: "
+        + ("PyAV（プロセス内）" if backend_name() == "pyav" else "pydub（ffmpeg を都度起動）")
+    )
 
-def split_with_overlap(audio: AudioSegment, chunk_ms: int, overlap_ms: int, fade_ms: int, absorb_tiny_tail: bool):
-    """
-    overlap を含めて分割。最後の短すぎる尻尾は吸収（オプション）。
-    戻り値: list[dict] with keys {start_ms, end_ms, segment(AudioSegment)}
-    """
-    results = []
-    n = len(audio)
+uploaded_files = st.file_uploader(
+    "音声ファイルをアップロード（MP3/WAV・複数可）",
+    type=["mp3", "wav"],
+    accept_multiple_files=True,
+    help="複数ファイルを選ぶと、ファイル単位で並列に分割し、ファイルごとのフォルダにまとめた 1 つの ZIP を作ります。",
+) or []
+uploaded = uploaded_files[0] if len(uploaded_files) == 1 else None
 
-    if chunk_ms <= 0:
-        raise ValueError("chunk_ms must be > 0")
-    if overlap_ms < 0:
-        raise ValueError("overlap_ms must be >= 0")
-    if overlap_ms >= chunk_ms:
-        raise ValueError("overlap_ms must be < chunk_ms")
+if len(uploaded_files) > 1:
+    # ===== 一括分割：ファイル単位でプロセスプールに投げる（並列数はエンコード並列数と共通） =====
+    spec = output_spec(export_fmt, target_bitrate)
+    grid_overlap_ms = int(overlap_min * 60_000)
+    overlap_ms = int(snap_overlap_sec * 1000) if snap_silence else grid_overlap_ms
+    settings = SplitSettings(
+        spec=spec,
+        chunk_ms=int(chunk_min * 60_000),
+        overlap_ms=overlap_ms,
+        snap_tolerance_ms=int(snap_tolerance_sec * 1000) if snap_silence else 0,
+        fade_ms=int(fade_ms),
+        absorb_tiny_tail=min_tail_keep,
+        max_chunk_bytes=int(max_chunk_mb * 1e6) if size_mode else None,
+        with_envelope=with_envelope,
+        vad_min_gap_ms=int(vad_min_gap_sec * 1000) if vad_trim else 0,
+    )
 
-    step = max(1, chunk_ms - overlap_ms)  # 次の開始位置
+    st.subheader(f"一括分割（{len(uploaded_files)} ファイル）")
+    st.caption(
+        f"最大 {int(encode_workers)} ファイルを同時に処理します（各ファイル内のエンコードは逐次）。"
+        "チャンク・index CSV・エンベロープはファイルごとのフォルダに入ります。"
+    )
 
-    start = 0
-    while start < n:
-        end = min(start + chunk_ms, n)
-        seg = audio[start:end]
+    if not size_mode and grid_overlap_ms >= settings.chunk_ms:
+        st.error("オーバーラップはチャンク長未満にしてください。")
+    elif st.button("▶️ 一括分割を実行", type="primary"):
+        out_zip = None
+        try:
+            with tempfile.TemporaryDirectory(prefix="split_batch_") as tmp:
+                # 1) アップロードをディスクへ（ワーカーにはパスだけ渡す）。同名ファイルはフォルダ名を連番で区別
+                src_paths, out_dirs, folders = [], [], []
+                for i, f in enumerate(uploaded_files):
+                    stem = (Path(f.name).stem or "audio").replace(" ", "_")
+                    folder, n = stem, 2
+                    while folder in folders:
+                        folder, n = f"{stem}_{n}", n + 1
+                    folders.append(folder)
+                    src = Path(tmp) / "src" / f"{i:03d}" / f"{stem}{Path(f.name).suffix.lower()}"
+                    src.parent.mkdir(parents=True)
+                    src.write_bytes(f.getbuffer())
+                    src_paths.append(str(src))
+                    out_dirs.append(str(Path(tmp) / "out" / f"{i:03d}"))
 
-        # 短すぎる最後の尻尾（例： overlap 以下）を、前チャンクに吸収して重複を増やさない
-        if absorb_tiny_tail and start > 0 and end == n:
-            tail_len = end - start
-            if tail_len < overlap_ms:
-                prev = results[-1]
-                prev["end_ms"] = n
-                prev["segment"] = audio[prev["start_ms"]:n]
-                break
+                # 2) 並列実行（ファイルごとの進捗バー）
+                bars = [st.progress(0.0, text=f"{f.name}: 待機中") for f in uploaded_files]
 
-        # フェード（任意）
-        if fade_ms > 0 and len(seg) > fade_ms * 2:
-            seg = seg.fade_in(fade_ms).fade_out(fade_ms)
+                def on_progress(i: int, done: int, total: int) -> None:
+                    bars[i].progress(done / max(1, total), text=f"{uploaded_files[i].name}: {done} / {total} チャンク")
 
-        results.append({"start_ms": start, "end_ms": end, "segment": seg})
+                results = run_batch(src_paths, out_dirs, settings, workers=int(encode_workers), on_progress=on_progress)
 
-        if end == n:
-            break
-        start += step
+                # 3) 1 つの ZIP にまとめる（<フォルダ>/<チャンク> をディスクからブロックコピー）
+                rows = []
+                out_zip = SpooledZip()
+                with out_zip:
+                    for f, folder, out_dir, res, bar in zip(uploaded_files, folders, out_dirs, results, bars):
+                        if "error" in res:
+                            bar.progress(1.0, text=f"{f.name}: ❌ エラー")
+                            rows.append({"ファイル": f.name, "フォルダ": folder, "チャンク数": 0, "再生時間": "—",
+                                         "モード": "—", "無音除去(分)": 0.0, "結果": f"エラー: {res['error']}"})
+                            continue
+                        bar.progress(1.0, text=f"{f.name}: ✅ 完了")
+                        for name in res["files"]:
+                            out_zip.write_file(Path(out_dir) / name, f"{folder}/{name}")
+                        over = res["oversized"]
+                        rows.append({
+                            "ファイル": f.name,
+                            "フォルダ": folder,
+                            "チャンク数": len(res["sizes"]),
+                            "再生時間": hhmmss(res["total_ms"]),
+                            "モード": "コピー" if res["copy"] else "再エンコード",
+                            "無音除去(分)": round(res["removed_ms"] / 60_000, 2),
+                            "結果": f"上限超過: Part {', '.join(map(str, over))}" if over else "OK",
+                        })
 
-    return results
+            st.dataframe(rows, hide_index=True, use_container_width=True)
+            zip_size, zip_on_disk = out_zip.size, out_zip.on_disk
+            st.download_button(
+                "📦 分割済み音声（全ファイル）をZIPでダウンロード",
+                data=out_zip.download_data(),
+                file_name="split_overlap_batch.zip",
+                mime="application/zip",
+            )
+            st.caption(f"ZIP サイズ: {zip_size / 1e6:.1f} MB（{'一時ファイル' if zip_on_disk else 'メモリ'}上で作成）")
+            n_err = sum(1 for r in results if "error" in r)
+            if n_err:
+                st.warning(f"{n_err} ファイルでエラーが発生しました（他のファイルは ZIP に含まれています）。")
+            else:
+                st.success(f"{len(results)} ファイルを分割しました。")
+        except Exception as e:
+            st.error(f"処理中にエラーが発生しました: {e}")
+        finally:
+            if out_zip is not None:
+                out_zip.close()  # 一時ファイルに退避していれば削除
 
-if uploaded is not None:
+elif uploaded is not None:
     try:
         # 1) 読み込み
         suffix = Path(uploaded.name).suffix.lower()
@@ -86,23 +236,116 @@ if uploaded is not None:
             st.stop()
 
         load_fmt = "mp3" if suffix == ".mp3" else "wav"
-        audio = AudioSegment.from_file(uploaded, format=load_fmt)
+
+        # 出力設定
+        spec = output_spec(export_fmt, target_bitrate)
+        out_ext, export_kwargs, bitrate_arg = spec.ext, spec.export_kwargs, spec.bitrate
+
+        # コピー分割（デコード・再エンコードなし）が使えるか判定（条件は lib/split_job.choose_copy_source）
+        # 無音除去する場合は PCM 上で連結するので常にデコードする
+        copy_src = None if vad_trim else choose_copy_source(uploaded.getbuffer(), load_fmt, spec, fade_ms)
+
+        cache = get_decode_cache()
+        upload_key = upload_content_key(uploaded)
+
+        offset_map = None
+        if copy_src is not None:
+            audio = None
+            total_ms = copy_src.duration_ms
+            decode_variant = f"copy_{load_fmt}"
+            st.caption(
+                "⚡ コピー分割モード：デコード・再エンコードせずにフレーム単位で切り出します。"
+                + ("（フェードはチャンク両端の数 ms だけ計算）" if fade_ms > 0 else "")
+            )
+        else:
+            # デコード結果は内容ハッシュでキャッシュ（再実行・他セッションでは mmap で即再利用）
+            decode_variant = load_fmt
+            if transcription_profile is not None:
+                decode_variant += f"_{transcription_profile.channels}ch_{transcription_profile.frame_rate}"
+            audio = cache.get_audio(upload_key, decode_variant)
+            if audio is None:
+                audio = decode(uploaded, format=load_fmt)
+                if transcription_profile is not None:
+                    # 分割前に一度だけ mono/16kHz 化（以降のスライス・スプールも小さくなる）
+                    audio = transcription_profile.prepare(audio)
+                audio = cache.put_audio(upload_key, decode_variant, audio)
+
+            # 無音除去（VAD）：オフセットマップとカット後の PCM もキャッシュする
+            if vad_trim:
+                vad_params = {"vad_min_gap_ms": int(vad_min_gap_sec * 1000), "variant": decode_variant}
+                map_json = cache.get_blob(upload_key, vad_params)
+                if map_json is None:
+                    with st.spinner("発話区間を検出中…"):
+                        offset_map = speech_offset_map(
+                            lambda a, b: audio[a:b], len(audio), min_gap_ms=vad_params["vad_min_gap_ms"]
+                        )
+                    cache.put_blob(upload_key, vad_params, offset_map.to_json().encode("utf-8"))
+                else:
+                    offset_map = OffsetMap.from_json(map_json.decode("utf-8"))
+                decode_variant += f"_vad{vad_params['vad_min_gap_ms']}"
+                trimmed = cache.get_audio(upload_key, decode_variant)
+                if trimmed is None:
+                    trimmed = cache.put_audio(upload_key, decode_variant, trim_audio(audio, offset_map.spans))
+                audio = trimmed
+                st.caption(
+                    f"🔇 無音除去: {offset_map.removed_ms / 60_000:.1f} 分を除去"
+                    f"（{hhmmss(offset_map.total_ms)} → {hhmmss(offset_map.kept_ms)}）"
+                )
+            total_ms = len(audio)
 
         # 2) パラメータ（ms）
-        chunk_ms = int(chunk_min * 60_000)
-        overlap_ms = int(overlap_min * 60_000)
+        max_chunk_bytes = int(max_chunk_mb * 1e6) if size_mode else None
+        if size_mode:
+            out_bps = estimate_output_bps(copy_src, audio, transcription_profile, out_ext, bitrate_arg)
+            chunk_ms = chunk_ms_for_size(max_chunk_bytes, out_bps)
+            st.caption(
+                f"📏 書き出しビットレート 約 {out_bps / 1000:.0f} kbps → チャンク長 {hhmmss(chunk_ms)}"
+                f"（上限 {max_chunk_mb:.1f} MB）"
+            )
+        else:
+            chunk_ms = int(chunk_min * 60_000)
+        grid_overlap_ms = int(overlap_min * 60_000)
+        overlap_ms = int(snap_overlap_sec * 1000) if snap_silence else grid_overlap_ms
+        snap_tolerance_ms = int(snap_tolerance_sec * 1000) if snap_silence else 0
 
-        if overlap_ms >= chunk_ms:
+        if grid_overlap_ms >= chunk_ms:
             st.error("オーバーラップはチャンク長未満にしてください。")
+        elif overlap_ms + snap_tolerance_ms >= chunk_ms:
+            st.error("（無音寄せ）オーバーラップ＋探索幅はチャンク長未満にしてください。")
         else:
             # 3) 分割
-            parts = split_with_overlap(
-                audio=audio,
-                chunk_ms=chunk_ms,
-                overlap_ms=overlap_ms,
-                fade_ms=fade_ms,
-                absorb_tiny_tail=min_tail_keep,
-            )
+            if copy_src is not None and snap_silence:
+                # 探索窓の範囲だけをデコードして包絡を計算（全体はデコードしない）
+                parts = plan_silence_ranges(
+                    total_ms, chunk_ms, overlap_ms, snap_tolerance_ms,
+                    envelope_fn=lambda a, b: envelope_from_segment(decode(copy_src.chunk_bytes(a, b), format=load_fmt)),
+                    absorb_tiny_tail=min_tail_keep,
+                    fade_ms=fade_ms,
+                    strict_max=size_mode,  # サイズ上限があるときは尻尾の吸収で上限を超えない
+                )
+            elif copy_src is not None:
+                parts = plans_from_ranges(plan_ranges(total_ms, chunk_ms, overlap_ms, min_tail_keep), fade_ms)
+            else:
+                # 計画だけ作る（スライスはエンコード直前に 1 チャンクずつ切り出す）
+                parts = split_with_overlap(
+                    audio=audio,
+                    chunk_ms=chunk_ms,
+                    overlap_ms=overlap_ms,
+                    fade_ms=fade_ms,
+                    absorb_tiny_tail=min_tail_keep,
+                    snap_tolerance_ms=snap_tolerance_ms,
+                    strict_max=size_mode,
+                )
+
+            if snap_silence:
+                # 固定長＋従来オーバーラップで切った場合との課金分数の比較
+                grid_parts = plans_from_ranges(plan_ranges(total_ms, chunk_ms, grid_overlap_ms, min_tail_keep))
+                grid_min = billed_minutes(grid_parts)
+                snap_min = billed_minutes(parts)
+                c1, c2, c3 = st.columns(3)
+                c1.metric("固定長での課金分数", f"{grid_min:.1f} 分")
+                c2.metric("無音寄せでの課金分数", f"{snap_min:.1f} 分")
+                c3.metric("削減", f"{grid_min - snap_min:.1f} 分")
 
             # 4) プレビュー（一覧）
             st.subheader("分割プレビュー")
@@ -111,57 +354,131 @@ if uploaded is not None:
                 rows.append(
                     {
                         "Part": i,
-                        "Start": hhmmss(p["start_ms"]),
-                        "End": hhmmss(p["end_ms"]),
-                        "Duration": hhmmss(p["end_ms"] - p["start_ms"]),
+                        "Start": hhmmss(p.start_ms),
+                        "End": hhmmss(p.end_ms),
+                        "Duration": hhmmss(p.duration_ms),
+                        "Nominal End": hhmmss(p.nominal_end_ms),
                     }
                 )
+            if transcription_profile is not None:
+                # 元ファイルの平均ビットレートと比べたサイズ削減・アップロード時間短縮の目安
+                src_bps = len(uploaded.getbuffer()) * 8 * 1000 / max(1, total_ms)
+                for row, p in zip(rows, parts):
+                    src_bytes = src_bps * p.duration_ms / 8000
+                    out_bytes = src_bytes if copy_src is not None else transcription_profile.estimated_bytes(p.duration_ms)
+                    row["元サイズ(MB)"] = round(src_bytes / 1e6, 2)
+                    row["推定サイズ(MB)"] = round(out_bytes / 1e6, 2)
+                    row["削減率"] = f"{(1 - out_bytes / src_bytes) * 100:.0f}%" if src_bytes else "—"
+                    row["短縮(秒)"] = round(
+                        upload_seconds(src_bytes, upload_mbps) - upload_seconds(out_bytes, upload_mbps), 1
+                    )
             st.dataframe(rows, hide_index=True, use_container_width=True)
 
-            # 5) ZIP 作成（メモリ）
+            # 5) ZIP 作成（スプール一時ファイル：閾値を超えたらディスクへ）
             base_name = (uploaded.name.rsplit(".", 1)[0] or "audio").replace(" ", "_")
-            mem_zip = io.BytesIO()
 
-            # 出力設定
-            if export_fmt.startswith("wav"):
-                out_ext = "wav"
-                export_kwargs = {"format": "wav"}  # 既定で PCM_s16le
-                bitrate_arg = None
-            else:
-                out_ext = "mp3"
-                bitrate_arg = None if "自動" in target_bitrate else target_bitrate
-                export_kwargs = {"format": "mp3"}
-                if bitrate_arg:
-                    export_kwargs["bitrate"] = bitrate_arg
-
-            with zipfile.ZipFile(mem_zip, "w", compression=zipfile.ZIP_DEFLATED) as zf:
-                for i, p in enumerate(parts):
-                    start_tag = hhmmss(p["start_ms"]).replace(":", "")
-                    end_tag = hhmmss(p["end_ms"]).replace(":", "")
-                    filename = f"{base_name}_part{i:03d}_{start_tag}-{end_tag}.{out_ext}"
-
-                    buf = io.BytesIO()
-                    p["segment"].export(buf, **export_kwargs)
-                    zf.writestr(filename, buf.getvalue())
-
-                # 透過用のインデックス（CSV）も同梱
-                import csv
-                index_csv = io.StringIO()
-                writer = csv.writer(index_csv)
-                writer.writerow(["part", "start_ms", "end_ms", "start_hhmmss", "end_hhmmss"])
-                for i, p in enumerate(parts):
-                    writer.writerow([i, p["start_ms"], p["end_ms"], hhmmss(p["start_ms"]), hhmmss(p["end_ms"])])
-                zf.writestr(f"{base_name}_index.csv", index_csv.getvalue().encode("utf-8"))
-
-            mem_zip.seek(0)
-            st.download_button(
-                "📦 分割済み音声をZIPでダウンロード",
-                data=mem_zip,
-                file_name=f"{base_name}_split_overlap.zip",
-                mime="application/zip",
-            )
+            # 再エンコードが必要な場合のチャンク供給元
+            #   - キャッシュ済み（同じ音声・同じ範囲・同じ書き出し設定）のチャンクは再利用
+            #   - 並列: キャッシュの PCM ファイル（無ければ一時ファイル）から各ワーカーが範囲読み
+            #   - 逐次: 1 チャンクずつ切り出してエンコード
+            spool = None
+            encoded = None
+            if copy_src is None:
+                def chunk_params(p):
+                    return {
+                        "variant": decode_variant, "start_ms": p.start_ms, "end_ms": p.end_ms,
+                        "fade_ms": p.fade_ms, "export": export_kwargs,
+                    }
+
+                pending = [i for i, p in enumerate(parts) if not cache.has_blob(upload_key, chunk_params(p))]
+                pending_parts = [parts[i] for i in pending]
+                if len(pending_parts) > 1 and int(encode_workers) > 1:
+                    spool = cache.pcm_spool(upload_key, decode_variant) or spool_pcm(audio)
+                    fresh = encode_chunks(spool, pending_parts, export_kwargs, workers=int(encode_workers))
+                else:
+                    fresh = encode_inline(audio, pending_parts, export_kwargs)
+
+                def cached_or_encoded():
+                    pending_set = set(pending)
+                    for i, p in enumerate(parts):
+                        prm = chunk_params(p)
+                        data = None if i in pending_set else cache.get_blob(upload_key, prm)
+                        if data is None:
+                            # 未キャッシュ（または直前に追い出された）チャンクだけエンコード
+                            data = next(fresh) if i in pending_set else next(encode_inline(audio, [p], export_kwargs))
+                            cache.put_blob(upload_key, prm, data)
+                        yield data
+
+                encoded = cached_or_encoded()
+                if len(pending) < len(parts):
+                    st.caption(f"♻️ キャッシュ済みチャンク {len(parts) - len(pending)} / {len(parts)} を再利用します。")
+
+            chunk_sizes = []  # 書き出し後の実サイズ（上限チェック用。再エンコードはしない）
+            out_zip = SpooledZip()
+            try:
+                with out_zip:
+                    for i, p in enumerate(parts):
+                        filename = chunk_filename(base_name, i, p, out_ext)
+
+                        if copy_src is not None:
+                            # バイト範囲をそのまま ZIP エントリへストリーム書き込み
+                            with out_zip.open(filename) as entry:
+                                chunk_sizes.append(copy_src.write_chunk(p.start_ms, p.end_ms, entry, p.fade_ms))
+                        else:
+                            # encoded は parts と同じ順序で返る（ZIP の並びは常に part 順）
+                            data = next(encoded)
+                            chunk_sizes.append(len(data))
+                            out_zip.writestr(filename, data)
+
+                    # 透過用のインデックス（CSV）も同梱
+                    out_zip.writestr(
+                        f"{base_name}_index.csv",
+                        build_index_csv(parts, sizes=chunk_sizes, offset_map=offset_map).encode("utf-8"),
+                    )
+                    if offset_map is not None:
+                        out_zip.writestr(f"{base_name}_offset_map.json", offset_map.to_json().encode("utf-8"))
+
+                    # ラウドネス索引（min/max/RMS, int16 N×3）。一度計算したらキャッシュから再利用
+                    if with_envelope:
+                        env_params = {"loudness_res_ms": LOUDNESS_RES_MS, "variant": decode_variant}
+                        env_npy = cache.get_blob(upload_key, env_params)
+                        if env_npy is None:
+                            if copy_src is not None:
+                                # 5分ずつ範囲デコード（全体は展開しない）
+                                decode_fn = lambda a, b: decode(copy_src.chunk_bytes(a, b), format=load_fmt)
+                            else:
+                                decode_fn = lambda a, b: audio[a:b]
+                            env_npy = envelope_to_npy_bytes(loudness_envelope_streaming(decode_fn, total_ms))
+                            cache.put_blob(upload_key, env_params, env_npy)
+                        out_zip.writestr(f"{base_name}_envelope_{LOUDNESS_RES_MS}ms.npy", env_npy)
+
+                zip_size, zip_on_disk = out_zip.size, out_zip.on_disk
+                st.download_button(
+                    "📦 分割済み音声をZIPでダウンロード",
+                    data=out_zip.download_data(),
+                    file_name=f"{base_name}_split_overlap.zip",
+                    mime="application/zip",
+                )
+            finally:
+                if spool is not None:
+                    spool.remove()
+                    if not spool.owned:
+                        cache.unpin(upload_key)  # pcm_spool() の pin を外す（以後は追い出しの対象）
+                out_zip.close()  # 一時ファイルに退避していれば削除
+            st.caption(f"ZIP サイズ: {zip_size / 1e6:.1f} MB（{'一時ファイル' if zip_on_disk else 'メモリ'}上で作成）")
+
+            if max_chunk_bytes is not None:
+                over = oversized_parts(chunk_sizes, max_chunk_bytes)
+                if over:
+                    st.error(
+                        "上限を超えたチャンクがあります: "
+                        + ", ".join(f"Part {i}（{chunk_sizes[i] / 1e6:.2f} MB）" for i in over)
+                        + "。上限を下げて再実行してください。"
+                    )
+                else:
+                    st.info(f"✅ 全チャンクが上限 {max_chunk_mb:.1f} MB 以内です（最大 {max(chunk_sizes) / 1e6:.2f} MB）。")
 
-            st.success(f"作成チャンク数: {len(parts)}  | 総再生時間: {hhmmss(len(audio))}")
+            st.success(f"作成チャンク数: {len(parts)}  | 総再生時間: {hhmmss(total_ms)}")
 
     except Exception as e:
         st.error(f"処理中にエラーが発生しました: {e}")
@@ -15,16 +15,36 @@
 #   7) Transcribe API 呼び出し（リトライ付き）
 #   8) 結果表示＋料金サマリー表
 #   9) 🔽 追加：整形結果テキストの「.txt ダウンロード」「ワンクリックコピー」機能
+#  10) 🔽 追加：送信前の無音除去（VAD）。除去した分数・削減額を料金表に表示し、
+#      SRT/VTT のタイムスタンプはオフセットマップで元の録音の時刻に戻す
+#  11) 🔽 追加：長い音声は内部でチャンク（短い重なり付き）に分けて並列に送信し、
+#      完了したチャンクから途中経過を表示、最後に順番どおり連結（lib/transcribe_chunks）
+#  12) 🔽 追加：同じ音声・モデル・形式・言語・プロンプトの結果はキャッシュから返す
+#      （lib/transcript_cache、全セッション共通）。キャッシュ分は $0・元の request-id で表示
+#  13) 🔽 変更：HTTP セッションは lib/http_clients の共有プール（キープアライブ）を使う。
+#      サイドバーに接続の再利用率（デバッグ）
+#  14) 🔽 変更：送信は lib/api_client 経由（rpm/tpm のトークンバケット・同時実行数の上限・
+#      Retry-After とレート制限ヘッダに従った待ち合わせ・ジッター付きバックオフで再送）
+#  15) 🔽 追加：ジョブのチェックポイント（lib/transcribe_jobs）。チャンクが終わるたびにディスクへ記録し、
+#      失敗・中断したジョブは「⏯ 再開」で残りのチャンクだけ送る（完了済みは再課金しない）
+#  16) 🔽 変更：送信は lib/job_queue のバックグラウンドジョブ。ページは進捗・途中経過をポーリングで表示し、
+#      キャンセルできる。ウィジェット操作・再読み込み・同じタブでのページ移動でも処理は止まらず
+#      （各ページのサイドバーが生存確認する。ui/job_panel.keep_session_jobs_alive）、結果はジョブから表示する
+#  17) 🔽 変更：アップロードは uploaded.read() のコピーをやめ、getbuffer() の memoryview を参照するだけにした。
+#      送信は lib/multipart_upload のストリーミング multipart（ブロック単位・Content-Length 付き）で、
+#      ジョブの進捗にアップロード量を表示する（1 リクエストのメモリはファイルサイズによらず数 MB）
+#  18) 🔽 変更：返却形式の選択をやめ、モデルが返せるいちばん詳しい形式（whisper-1 はタイムスタンプ付きの
+#      verbose_json）で 1 回だけ取得して保存。text / SRT / VTT は結果の「表示形式」で手元から作る
+#      （チャンク・無音除去の時刻補正込み。切り替えは即時・追加課金なし）
+#  19) 🔽 追加：カスケード（lib/cascade）。選んだモデルで全体を文字起こしし、信頼度の低い区間だけ
+#      高精度モデルで送り直して差し替える。料金表に「全区間を高精度モデルで送った場合」との比較
 # ============================================================
 
 from __future__ import annotations
 
-import io
 import re
 import time
 import json
-import requests
-from requests.adapters import HTTPAdapter, Retry
 import pandas as pd
 import streamlit as st
 
@@ -34,12 +54,50 @@ from config.config import (
     WHISPER_PRICE_PER_MIN,
     TRANSCRIBE_PRICES_USD_PER_MIN,
     DEFAULT_USDJPY,
+    TRANSCRIBE_MAX_UPLOAD_BYTES,
+    TRANSCRIBE_MAX_CONCURRENCY,
 )
 from lib.audio import get_audio_duration_seconds
+from lib.audio_io import decode
+from lib.api_client import get_api_client
+from lib.audio_split import ChunkPlan, hhmmss
+from lib.cascade import find_low_confidence, stitch_cascade
+from lib.content_hash import upload_content_key
+from lib.export_profiles import TRANSCRIPTION_PROFILES
+from lib.job_queue import DONE
+from lib.multipart_upload import MultipartBody, Payload, UploadMeter
+from lib.http_clients import endpoint_timeout, get_http_session
+from lib.size_plan import chunk_ms_for_size
+from lib.stream_copy import open_copy_source
+from lib.transcribe_chunks import (
+    DEFAULT_CHUNK_SEC,
+    OUTPUT_FORMATS,
+    ChunkJob,
+    TranscribeAPIError,
+    jobs_by_copy,
+    jobs_by_encode,
+    parse_response,
+    partial,
+    plan_chunks,
+    render_transcript,
+    request_fields,
+    request_format,
+    stitch,
+    transcribe_chunks,
+)
+from lib.transcribe_jobs import get_job_store
+from lib.transcript_cache import get_transcript_cache
+from lib.vad import VAD_MIN_GAP_MS, speech_offset_map, trim_audio
+from ui.http_debug import render_http_debug_panel
+from ui.job_panel import current_job, keep_session_jobs_alive, render_job_failure, render_job_panel, start_job
 from ui.sidebarOld import init_metrics_state  # render_sidebar は使わない
 
 # ================= ページ設定 =================
 st.set_page_config(page_title="01 文字起こし — Transcribe", layout="wide")
+
+with st.sidebar:
+    keep_session_jobs_alive()  # ほかのページで投入した実行中ジョブの生存確認
+
 st.title("① 文字起こし（GPT-4o Transcribe / Whisper）")
 
 # ================= 初期化 =================
@@ -61,6 +119,9 @@ def strip_bracket_tags(text: str) -> str:
         return text
     return BRACKET_TAG_PATTERN.sub("", text)
 
+# 無音除去後の送信形式（再エンコードが必要なので、文字起こしに十分な mono/16kHz・MP3 32k にする）
+VAD_EXPORT_PROFILE = TRANSCRIPTION_PROFILES["文字起こし用（mono/16kHz・MP3 32k）"]
+
 PROMPT_OPTIONS = [
     "",  # デフォルト: 空（未指定）
     "出力に話者名や【】などのラベルを入れない。音声に無い単語は書かない。",
@@ -68,6 +129,11 @@ PROMPT_OPTIONS = [
     "句読点を正しく付与し、自然な文章にしてください。",
 ]
 
+
+# 実行中・直近の文字起こしジョブ（lib/job_queue）。ID は session_state と URL の ?tx_job= に残す
+JOB_KEY = "tx_job"
+tx_job = current_job(JOB_KEY)
+
 # ================= UI（左／右カラム） =================
 col_left, col_right = st.columns([1, 1], gap="large")
 
@@ -79,6 +145,17 @@ with col_left:
         index=0,
         help="コスト/速度重視なら mini、精度重視なら 4o-transcribe、互換重視なら whisper-1。",
     )
+    do_cascade = st.checkbox(
+        "カスケード：このモデルで全体を文字起こしし、信頼度の低い区間だけ高精度モデルで送り直す",
+        value=False,
+        help="whisper-1 はセグメントごとの信頼度（avg_logprob・no_speech_prob・圧縮率）、"
+             "それ以外のモデルはチャンク本文の繰り返し（圧縮率）で判定します。"
+             "料金表に、全区間を高精度モデルで送った場合との比較を表示します。",
+    )
+    cascade_to = st.selectbox(
+        "送り直しに使うモデル", ["gpt-4o-transcribe", "gpt-4o-mini-transcribe"], disabled=not do_cascade
+    )
+    cascade_model = cascade_to if do_cascade and cascade_to != model else None
 
     uploaded = st.file_uploader(
         "音声ファイル（.wav / .mp3 / .m4a / .webm / .ogg 等）",
@@ -86,7 +163,6 @@ with col_left:
         accept_multiple_files=False,
     )
 
-    fmt = st.selectbox("返却形式（response_format）", ["json", "text", "srt", "vtt"], index=0)
     language = st.text_input("言語コード（未指定なら自動判定）", value="ja")
 
     prompt_hint = st.selectbox(
@@ -98,6 +174,43 @@ with col_left:
 
     do_strip_brackets = st.checkbox("書き起こし後に【…】を除去する", value=True)
 
+    do_vad = st.checkbox(
+        "送信前に無音区間を除去する（VAD・課金分数を削減）",
+        value=False,
+        help="エネルギーとゼロ交差率で発話区間を検出し、長い無音（開始前・休憩など）を除いてから送信します。"
+             "SRT/VTT のタイムスタンプは元の録音の時刻に戻して表示します。",
+    )
+    vad_min_gap_sec = st.number_input(
+        "除去する無音の最短長（秒）",
+        min_value=0.5,
+        max_value=60.0,
+        value=VAD_MIN_GAP_MS / 1000,
+        step=0.5,
+        disabled=not do_vad,
+    )
+
+    do_chunk = st.checkbox(
+        "長い音声はチャンクに分けて並列に送信する",
+        value=True,
+        help="チャンク長を超える音声・アップロード上限を超えるファイルを内部で分割し、同時に文字起こしして順番どおりに連結します。"
+             "重なり（約1.5秒）の分だけ課金分数がわずかに増えます。",
+    )
+    cc1, cc2 = st.columns(2)
+    chunk_min = cc1.number_input(
+        "チャンク長（分）", min_value=1.0, max_value=60.0, value=DEFAULT_CHUNK_SEC / 60, step=1.0, disabled=not do_chunk
+    )
+    concurrency = cc2.number_input(
+        "同時リクエスト数", min_value=1, max_value=max(1, TRANSCRIBE_MAX_CONCURRENCY),
+        value=max(1, TRANSCRIBE_MAX_CONCURRENCY), step=1, disabled=not do_chunk,
+    )
+
+    use_cache = st.checkbox(
+        "同じ音声・設定の結果を再利用する（キャッシュ・課金なし）",
+        value=True,
+        help="音声の内容・モデル・言語・プロンプトが同じなら、API に送らず保存済みの結果を返します。"
+             "オフにすると送り直し、結果でキャッシュを更新します。",
+    )
+
     st.subheader("通貨換算（任意）")
     usd_jpy = st.number_input(
         "USD/JPY",
@@ -110,38 +223,130 @@ with col_left:
 
     go = st.button("文字起こしを実行", type="primary", use_container_width=True)
 
+    # ---- 中断したジョブ（同じファイル）があれば再開ボタン ----
+    resume_job = None
+    if uploaded is not None and not (tx_job is not None and tx_job.active):
+        pending_jobs = get_job_store().incomplete_for(upload_content_key(uploaded))
+        if pending_jobs:
+            pj = pending_jobs[0]
+            st.info(
+                f"このファイルの中断したジョブがあります：{pj.n_done} / {pj.n_chunks} チャンク完了"
+                f"（{pj.settings.get('model')}・{pj.settings.get('response_format')}・"
+                f"{time.strftime('%Y-%m-%d %H:%M', time.localtime(pj.updated_at))}）"
+            )
+            if st.button("⏯ 中断したジョブを再開（残りのチャンクだけ送信）", use_container_width=True):
+                resume_job = pj
+
 with col_right:
     st.caption("結果")
+    out_fmt = st.radio(
+        "表示形式",
+        OUTPUT_FORMATS,
+        horizontal=True,
+        key="tx_out_fmt",
+        help="結果はタイムスタンプ付きで保存しているので、形式の切り替えに再送信・追加課金はありません。"
+             "SRT/VTT はタイムスタンプを返すモデル（whisper-1）のみ。",
+    )
     out_area = st.empty()
 
 # ================= 実行ハンドラ =================
-if go:
+if go or resume_job is not None:
     if not uploaded:
         st.warning("先に音声ファイルをアップロードしてください。")
         st.stop()
 
-    file_bytes = uploaded.read()
-    if not file_bytes:
+    # コピーせず UploadedFile のバッファを参照する（切り出し・送信も memoryview のまま）
+    file_buf = uploaded.getbuffer()
+    if not len(file_buf):
         st.error("アップロードファイルが空です。もう一度アップロードしてください。")
         st.stop()
 
     try:
-        # get_audio_duration_seconds は BytesIO/一時ファイル経由で複数ライブラリで推定
-        audio_sec = get_audio_duration_seconds(io.BytesIO(file_bytes))
+        # ヘッダのみのプローブ → mutagen → PyAV → audioread（結果は内容ハッシュでメモ化）
+        audio_sec = get_audio_duration_seconds(uploaded)
         audio_min = audio_sec / 60.0 if audio_sec else None
     except Exception:
         audio_sec = None
         audio_min = None
         st.info("音声長の推定に失敗しました。`pip install mutagen audioread` を推奨。")
 
+    # モデルが返せるいちばん詳しい形式で頼む（表示形式は結果から手元で作る）
+    req_fmt = request_format(model)
+
+    # 再開時は、ページの入力ではなくジョブに記録した設定で同じ分割計画を作り直す
+    if resume_job is not None:
+        rs = resume_job.settings
+        model, req_fmt = rs["model"], rs["response_format"]
+        cascade_model = rs.get("cascade_model")
+        language, prompt_hint = rs.get("language") or "", rs.get("prompt") or ""
+        do_vad = rs.get("vad_min_gap_ms") is not None
+        vad_min_gap_sec = (rs.get("vad_min_gap_ms") or VAD_MIN_GAP_MS) / 1000
+        do_chunk = rs.get("chunk_ms") is not None
+        chunk_min = (rs.get("chunk_ms") or DEFAULT_CHUNK_SEC * 1000) / 60_000
+
     mime = uploaded.type or "application/octet-stream"
-    files = {"file": (uploaded.name, file_bytes, mime)}
+    ext = uploaded.name.rsplit(".", 1)[-1].lower()
+    base_filename = uploaded.name.rsplit(".", 1)[0].replace(" ", "_")
+    chunk_ms = int(chunk_min * 60_000) if do_chunk else None
+
+    # ---- 無音除去（VAD）：残した区間だけを連結（送信時に再エンコード） ----
+    offset_map = None
+    speech_audio = None
+    if do_vad:
+        try:
+            with st.spinner("発話区間を検出中…"):
+                audio = decode(file_buf, format=ext)
+                offset_map = speech_offset_map(
+                    lambda a, b: audio[a:b], len(audio), min_gap_ms=int(vad_min_gap_sec * 1000)
+                )
+                if offset_map.removed_ms > 0:
+                    speech_audio = VAD_EXPORT_PROFILE.prepare(trim_audio(audio, offset_map.spans))
+                del audio
+            audio_sec = offset_map.total_ms / 1000  # デコード結果の方が正確
+            audio_min = audio_sec / 60.0
+        except Exception as e:
+            offset_map = None
+            st.warning(f"無音除去に失敗したため、元の音声をそのまま送信します: {e}")
+
+    # ---- 送信ジョブ（1 件 or チャンク分割） ----
+    # 無音除去した音声は再エンコードが必要なので、そのままチャンク計画に載せる。
+    # 元ファイルは「チャンク長 or アップロード上限」を超える場合だけ分割する：
+    #   MP3/WAV でビットレートが十分低ければフレーム単位のコピー、そうでなければデコード → mono/16kHz・MP3 32k。
+    total_ms = int(audio_sec * 1000) if audio_sec else 0
+    jobs: list[ChunkJob]
+    parts = None
+    refine_src = None  # カスケードで区間を切り出す元（("copy", 索引) / ("encode", AudioSegment)）
+    try:
+        if speech_audio is not None:
+            parts = plan_chunks(len(speech_audio), chunk_ms or len(speech_audio),
+                                bitrate_bps=VAD_EXPORT_PROFILE.bitrate_bps, max_bytes=TRANSCRIBE_MAX_UPLOAD_BYTES)
+            jobs = jobs_by_encode(speech_audio, parts, f"{base_filename}_speech", VAD_EXPORT_PROFILE)
+            refine_src = ("encode", speech_audio)
+        elif do_chunk and (total_ms > chunk_ms or len(file_buf) > TRANSCRIBE_MAX_UPLOAD_BYTES):
+            with st.spinner("チャンク分割の準備中…"):
+                copy_src = open_copy_source(file_buf, ext)
+                if copy_src is not None and getattr(copy_src, "is_pcm16", True) \
+                        and chunk_ms_for_size(TRANSCRIBE_MAX_UPLOAD_BYTES, copy_src.bitrate_bps) >= chunk_ms:
+                    parts = plan_chunks(copy_src.duration_ms, chunk_ms)
+                    jobs = jobs_by_copy(copy_src, parts, base_filename, ext, mime)
+                    refine_src = ("copy", copy_src)
+                else:
+                    audio = VAD_EXPORT_PROFILE.prepare(decode(file_buf, format=ext))
+                    parts = plan_chunks(len(audio), chunk_ms,
+                                        bitrate_bps=VAD_EXPORT_PROFILE.bitrate_bps, max_bytes=TRANSCRIBE_MAX_UPLOAD_BYTES)
+                    jobs = jobs_by_encode(audio, parts, base_filename, VAD_EXPORT_PROFILE)
+                    refine_src = ("encode", audio)
+        else:
+            jobs = [ChunkJob(1, 0, total_ms, lambda: (uploaded.name, Payload(file_buf), mime))]
+    except Exception as e:
+        st.warning(f"チャンク分割に失敗したため、1 リクエストで送信します: {e}")
+        parts = None
+        refine_src = None
+        jobs = [ChunkJob(1, 0, total_ms, lambda: (uploaded.name, Payload(file_buf), mime))]
 
     # ---- ここを変更：空文字は送らない（prompt/language を条件付きで付与） ----
-    data: dict = {
-        "model": model,               # ラジオ選択値をそのまま利用
-        "response_format": fmt,
-    }
+    # model / response_format（＋ カスケード時の gpt-4o 系は信頼度の判定用に include[]=logprobs）
+    data: dict = request_fields(model, req_fmt, logprobs=bool(cascade_model))
     if prompt_hint and prompt_hint.strip():
         data["prompt"] = prompt_hint.strip()
     if language and language.strip():
@@ -149,39 +354,177 @@ if go:
 
     headers = {"Authorization": f"Bearer {OPENAI_API_KEY}"}
 
-    sess = requests.Session()
-    # ---- ここを変更：allowed_methods を frozenset({"POST"}) に ----
-    retries = Retry(
-        total=3,
-        backoff_factor=1.2,
-        status_forcelist=[429, 500, 502, 503, 504],
-        allowed_methods=frozenset({"POST"}),
+    n_workers = int(concurrency) if do_chunk else 1
+    # 共有プール（全セッション共通・キープアライブ）。チャンクの並列送信も同じプールの接続を再利用する
+    sess = get_http_session()
+    # 流量制御（全セッション共通の rpm・同時実行数。429 は Retry-After だけ全体で待って再送）
+    api = get_api_client("transcribe")
+
+    def post_transcription(name: str, payload: Payload, content_type: str, cancel=None, on_progress=None, fields=None):
+        """
+        1 チャンク分を送信し (text, request-id) を返す（ワーカースレッドで実行）。cancel が立っていれば送らない。
+        本文はブロック単位でストリーミングし、on_progress(送信済み, 全体) でアップロード量を知らせる。
+        fields を渡すと data（model など）の代わりに使う（カスケードの送り直し）。
+        """
+        body = MultipartBody(fields or data, "file", name, payload, content_type, on_progress=on_progress)
+
+        def send_once():
+            r = sess.post(
+                OPENAI_TRANSCRIBE_URL,
+                headers={**headers, "Content-Type": body.content_type},
+                data=body,
+                timeout=endpoint_timeout("transcribe"),
+            )
+            if not r.ok:
+                raise TranscribeAPIError(r.status_code, r.text, r.headers.get("x-request-id"), r.headers)
+            return r
+
+        # 応答本文はそのまま返す（キャッシュ・チェックポイントにも本文のまま残し、表示時に parse_response で解釈）
+        resp = api.call_sync(send_once, cancel=cancel)
+        return resp.text, resp.headers.get("x-request-id")
+
+    n_chunks = len(jobs)
+
+    # ---- カスケード：低信頼の区間だけ高精度モデルで送り直す（lib/cascade） ----
+    refine_data = None
+    if cascade_model:
+        refine_data = {k: v for k, v in data.items() if k != "include[]"}
+        refine_data.update(request_fields(cascade_model))
+
+    def refine_jobs(ranges) -> list[ChunkJob]:
+        """送り直す区間の切り出し（チャンク分割で作った索引・デコード結果があれば流用。ワーカースレッドで実行）。"""
+        src = refine_src
+        if src is None:
+            cs = open_copy_source(file_buf, ext)
+            src = ("copy", cs) if cs is not None and getattr(cs, "is_pcm16", True) else \
+                ("encode", VAD_EXPORT_PROFILE.prepare(decode(file_buf, format=ext)))
+        plans = [ChunkPlan(r.start_ms, r.end_ms) for r in ranges]
+        if src[0] == "copy":
+            return jobs_by_copy(src[1], plans, f"{base_filename}_refine", ext, mime)
+        return jobs_by_encode(src[1], plans, f"{base_filename}_refine", VAD_EXPORT_PROFILE)
+
+    # ---- ジョブのチェックポイント：同じファイル・設定・計画のジョブがあれば完了済みチャンクは送らない ----
+    # キャッシュを使わない実行（送り直し）は記録も作り直す。再開ボタンからは常に続きから。
+    job_store = get_job_store()
+    ckpt = job_store.open(
+        upload_content_key(uploaded),
+        uploaded.name,
+        dict(model=model, response_format=req_fmt, language=language.strip(), prompt=prompt_hint.strip(),
+             vad_min_gap_ms=int(vad_min_gap_sec * 1000) if do_vad else None, chunk_ms=chunk_ms,
+             **({"cascade_model": cascade_model} if cascade_model else {})),
+        [(j.start_ms, j.end_ms) for j in jobs],
+        fresh=not use_cache and resume_job is None,
     )
-    sess.mount("https://", HTTPAdapter(max_retries=retries))
-
-    t0 = time.perf_counter()
-    with st.spinner("Transcribe API に送信中…"):
-        resp = sess.post(
-            OPENAI_TRANSCRIBE_URL,
-            headers=headers,
-            files=files,
-            data=data,
-            timeout=600,
-        )
-    elapsed = time.perf_counter() - t0
-
-    req_id = resp.headers.get("x-request-id")
-    if not resp.ok:
-        st.error(f"APIエラー: {resp.status_code}\n{resp.text}\nrequest-id: {req_id}")
+    if resume_job is not None and ckpt.job_id != resume_job.job_id:
+        st.warning("分割計画が前回と一致しないため、新しいジョブとして最初から実行します。")
+    prior = ckpt.completed()
+    if prior:
+        st.info(f"前回のジョブから {len(prior)} / {n_chunks} チャンクを再利用します（送信は残り {n_chunks - len(prior)} 件）。")
+
+    cache_kw = dict(cache=get_transcript_cache(), cache_params=data, use_cached=use_cache, done=prior)
+
+    def run_transcription(ctx) -> dict:
+        """バックグラウンドのジョブ本体（lib/job_queue のワーカーで実行）。"""
+        meter = UploadMeter()
+        n_done = [len(prior)]
+
+        def report() -> None:
+            uploading = meter.summary()
+            ctx.progress(n_done[0], n_chunks, f"{n_done[0]} / {n_chunks} チャンク" + (f"（{uploading}）" if uploading else ""))
+
+        def on_result(res, done) -> None:
+            # 完了したチャンクから記録し、途中経過をジョブに載せる（ページ側がポーリングで表示）
+            job_store.record(ckpt, res)
+            n_done[0] = len(done)
+            report()
+            if n_chunks > 1:
+                ctx.partial(partial(done, n_chunks))
+
+        def post(name, payload, content_type):
+            try:
+                return post_transcription(name, payload, content_type, cancel=ctx.cancel_event,
+                                          on_progress=meter.callback(name, report))
+            finally:
+                meter.finish(name)
+
+        report()
+        t0 = time.perf_counter()
+        results = transcribe_chunks(jobs, post, concurrency=n_workers, on_result=on_result,
+                                    cancel=ctx.cancel_event, **cache_kw)
+        job_done = job_store.finish(ckpt)
+
+        cascade = None
+        if cascade_model and not ctx.cancelled:
+            ranges = find_low_confidence(results)
+            refined = []
+            if ranges:
+                def on_refined(res, done) -> None:
+                    ctx.progress(len(done), len(ranges), f"カスケード：{len(done)} / {len(ranges)} 区間を {cascade_model} で送り直し")
+
+                def post_refine(name, payload, content_type):
+                    return post_transcription(name, payload, content_type, cancel=ctx.cancel_event, fields=refine_data)
+
+                ctx.progress(0, len(ranges), f"カスケード：0 / {len(ranges)} 区間を {cascade_model} で送り直し")
+                refined = transcribe_chunks(refine_jobs(ranges), post_refine, concurrency=max(1, int(concurrency)),
+                                            on_result=on_refined, cancel=ctx.cancel_event, cache=cache_kw["cache"],
+                                            cache_params=refine_data, use_cached=use_cache)
+            cascade = dict(model=cascade_model, ranges=ranges, refined=refined)
+        return dict(results=results, elapsed=time.perf_counter() - t0, job_done=job_done, cascade=cascade)
+
+    # 結果の表示に使う値はジョブに持たせる（再実行・再読み込みのあとでも同じ表示になる）
+    start_job(
+        JOB_KEY, "transcribe", run_transcription, label="文字起こし",
+        meta=dict(model=model, n_chunks=n_chunks, n_workers=n_workers, audio_sec=audio_sec,
+                  total_ms=total_ms, parts=parts, offset_map=offset_map, base_filename=base_filename,
+                  do_strip_brackets=do_strip_brackets),
+    )
+    tx_job = current_job(JOB_KEY)
+
+# ================= 実行状況・結果（ジョブから読む） =================
+if tx_job is not None and tx_job.active:
+    with out_area.container():
+        render_job_panel(tx_job, JOB_KEY, partial_height=350)
+elif tx_job is not None and (tx_job.status != DONE or tx_job.result is None):
+    render_job_failure(tx_job)
+
+if tx_job is not None and tx_job.finished and tx_job.result is not None:
+    m = tx_job.meta
+    model, n_chunks, n_workers = m["model"], m["n_chunks"], m["n_workers"]
+    audio_sec, total_ms, parts, offset_map = m["audio_sec"], m["total_ms"], m["parts"], m["offset_map"]
+    base_filename, do_strip_brackets = m["base_filename"], m["do_strip_brackets"]
+    audio_min = audio_sec / 60.0 if audio_sec else None
+    results, elapsed, job_done = tx_job.result["results"], tx_job.result["elapsed"], tx_job.result["job_done"]
+    cascade = tx_job.result.get("cascade")
+
+    failed = [r for r in results if not r.ok]
+    n_cached = sum(1 for r in results if r.cached)
+    n_resumed = sum(1 for r in results if r.resumed)
+    req_id = results[0].request_id if n_chunks == 1 else (
+        f"{results[0].request_id or '—'} ほか {n_chunks - 1} 件"
+    )
+    if len(failed) == n_chunks:
+        r = failed[0]
+        st.error(f"APIエラー: {r.error}\nrequest-id: {r.request_id}")
+        if n_chunks > 1:
+            st.info("「⏯ 中断したジョブを再開」で、失敗したチャンクだけを送り直せます。")
         st.stop()
+    if failed:
+        st.error(
+            f"{len(failed)} / {n_chunks} チャンクの文字起こしに失敗しました（結果から除いています）:\n"
+            + "\n".join(f"- チャンク {r.index}（{hhmmss(r.start_ms)}〜）: {r.error[:200]} request-id: {r.request_id}" for r in failed)
+            + ("" if job_done else "\n\n「⏯ 中断したジョブを再開」で、失敗したチャンクだけを送り直せます（成功分は再課金しません）。")
+        )
 
-    if fmt == "json":
-        try:
-            text = resp.json().get("text", "")
-        except Exception:
-            text = resp.text
-    else:
-        text = resp.text
+    # 保存した応答（タイムスタンプ付き）から表示形式を作る。無音除去した場合は字幕の時刻を元の録音に戻す
+    # カスケードで送り直した区間は高精度モデルの本文に差し替える（失敗した区間は元のまま）
+    stitched = stitch_cascade(results, cascade["ranges"], cascade["refined"]) if cascade else stitch(results)
+    seam_conf = {sm.index: sm.confidence for sm in stitched.seams}
+    shown_fmt = out_fmt if stitched.segments is not None else "text"
+    if shown_fmt != out_fmt:
+        st.info(f"{model} はタイムスタンプを返さないため、{out_fmt.upper()} は作れません（テキストで表示しています）。")
+    text = render_transcript(
+        stitched, shown_fmt, offset_map if offset_map is not None and offset_map.removed_ms > 0 else None
+    )
 
     if do_strip_brackets and text:
         text = strip_bracket_tags(text)
@@ -191,16 +534,16 @@ if go:
     st.session_state["transcribed_text"] = text
 
     # ====== 追加：テキストのダウンロード & クリップボードコピー ======
-    base_filename = (uploaded.name.rsplit(".", 1)[0] if uploaded else "transcript").replace(" ", "_")
     txt_bytes = (text or "").encode("utf-8")
+    dl_ext, dl_mime = {"srt": ("srt", "application/x-subrip"), "vtt": ("vtt", "text/vtt")}.get(shown_fmt, ("txt", "text/plain"))
 
     cols_dl, cols_cp = st.columns([1, 1], gap="small")
     with cols_dl:
         st.download_button(
-            "📝 テキスト（.txt）をダウンロード",
+            f"📝 {'テキスト' if dl_ext == 'txt' else dl_ext.upper()}（.{dl_ext}）をダウンロード",
             data=txt_bytes,
-            file_name=f"{base_filename}.txt",
-            mime="text/plain",
+            file_name=f"{base_filename}.{dl_ext}",
+            mime=dl_mime,
             use_container_width=True,
         )
 
@@ -233,10 +576,25 @@ if go:
 
     # ====== 料金サマリー表 ======
     # モデル別の分課金に対応。設定が無ければ WHISPER_PRICE_PER_MIN をフォールバック。
+    # 無音除去した場合、課金対象は送信した（残した）分数。チャンク分割した場合は重なりも二重に数える。
+    # キャッシュから返したチャンク・前回のジョブで完了済みのチャンクは今回の課金なし（$0）。
     usd = jpy = None
-    if audio_min is not None:
-        price_per_min = TRANSCRIBE_PRICES_USD_PER_MIN.get(model, WHISPER_PRICE_PER_MIN)
-        usd = float(audio_min) * float(price_per_min)
+    price_per_min = TRANSCRIBE_PRICES_USD_PER_MIN.get(model, WHISPER_PRICE_PER_MIN)
+    removed_min = offset_map.removed_ms / 60_000 if offset_map is not None else 0.0
+    billed_min = None
+    if n_cached + n_resumed == n_chunks:
+        billed_min = 0.0
+    elif parts is not None or total_ms:
+        billed_min = sum(r.end_ms - r.start_ms for r in results if r.ok and not r.cached and not r.resumed) / 60_000
+    if billed_min is not None:
+        usd = billed_min * float(price_per_min)
+    # カスケード：送り直した区間は高精度モデルの単価（キャッシュ分は課金なし）
+    if cascade:
+        exp_price = TRANSCRIBE_PRICES_USD_PER_MIN.get(cascade["model"], WHISPER_PRICE_PER_MIN)
+        refine_min = sum(r.end_ms - r.start_ms for r in cascade["refined"] if r.ok) / 60_000
+        if usd is not None:
+            usd += sum(r.end_ms - r.start_ms for r in cascade["refined"] if r.ok and not r.cached) / 60_000 * float(exp_price)
+    if usd is not None:
         jpy = usd * float(st.session_state["usd_jpy"])
 
     metrics_data = {
@@ -244,12 +602,93 @@ if go:
         "音声長": [f"{audio_sec:.1f} 秒 / {audio_min:.2f} 分" if audio_sec else "—"],
         "概算 (USD/JPY)": [f"${usd:,.6f} / ¥{jpy:,.2f}" if usd is not None else "—"],
         "request-id": [req_id or "—"],
-        "モデル": [model],
+        "モデル": [f"{model} → {cascade['model']}" if cascade else model],
     }
+    if n_cached:
+        metrics_data["キャッシュ"] = [
+            "ヒット（課金なし・request-id は元のリクエスト）" if n_chunks == 1 else f"ヒット {n_cached} / {n_chunks} 件（課金なし）"
+        ]
+    if n_resumed:
+        metrics_data["再開"] = [f"前回のジョブで完了済み {n_resumed} / {n_chunks} 件（今回は課金なし）"]
+    if offset_map is not None:
+        saved_usd = removed_min * float(price_per_min)
+        metrics_data["無音除去"] = [f"{removed_min:.2f} 分（送信 {offset_map.kept_ms / 60_000:.2f} 分）"]
+        metrics_data["削減額 (USD/JPY)"] = [f"${saved_usd:,.6f} / ¥{saved_usd * float(st.session_state['usd_jpy']):,.2f}"]
+    if n_chunks > 1:
+        metrics_data["チャンク"] = [f"{n_chunks} 件（並列 {n_workers}・課金 {billed_min:.2f} 分）"]
+    if cascade:
+        # 比較はキャッシュ・再開を除いた名目の料金（全区間を安いモデル＋送り直し分 vs 全区間を高精度モデル）
+        full_min = sum(r.end_ms - r.start_ms for r in results) / 60_000
+        blended = full_min * float(price_per_min) + refine_min * float(exp_price)
+        baseline = full_min * float(exp_price)
+        metrics_data["カスケード"] = [
+            f"低信頼 {len(cascade['ranges'])} 区間・{refine_min:.2f} 分を {cascade['model']} で送り直し"
+            if cascade["ranges"] else "低信頼の区間なし（送り直し 0 件）"
+        ]
+        if baseline > 0:
+            metrics_data[f"全区間 {cascade['model']} との比較 (USD)"] = [
+                f"${blended:,.6f} vs ${baseline:,.6f}（{(blended / baseline - 1) * 100:+.0f}%）"
+            ]
     df_metrics = pd.DataFrame(metrics_data)
     st.subheader("料金の概要")
     st.table(df_metrics)
 
+    low_seams = [sm for sm in stitched.seams if sm.confidence < 0.5]
+    if low_seams:
+        st.warning(
+            "重なり部分を照合できなかった継ぎ目があります（重複や欠落がないか確認してください）: "
+            + ", ".join(f"チャンク {sm.index} の直後" for sm in low_seams)
+        )
+    if n_chunks > 1:
+        with st.expander("チャンクごとの結果", expanded=bool(failed or low_seams)):
+            st.dataframe(
+                [
+                    {
+                        "#": r.index,
+                        "開始": hhmmss(r.start_ms),
+                        "終了": hhmmss(r.end_ms),
+                        "送信サイズ(MB)": round(r.n_bytes / 1e6, 2),
+                        "処理時間(秒)": round(r.elapsed, 2),
+                        "request-id": r.request_id or "—",
+                        "キャッシュ": "前回のジョブ" if r.resumed else ("✓" if r.cached else ""),
+                        "次との継ぎ目の信頼度": seam_conf.get(r.index),
+                        "エラー": r.error,
+                    }
+                    for r in results
+                ],
+                hide_index=True,
+                use_container_width=True,
+            )
+
+    if cascade and cascade["ranges"]:
+        refine_failed = [r for r in cascade["refined"] if not r.ok]
+        if refine_failed:
+            st.warning(f"送り直しに失敗した {len(refine_failed)} 区間は {model} の結果のまま表示しています。")
+        with st.expander(f"カスケード：{cascade['model']} で送り直した区間", expanded=bool(refine_failed)):
+            st.dataframe(
+                [
+                    {
+                        "開始": hhmmss(rg.start_ms),
+                        "終了": hhmmss(rg.end_ms),
+                        "理由": "・".join(rg.reasons),
+                        "request-id": rr.request_id or "—",
+                        "キャッシュ": "✓" if rr.cached else "",
+                        "本文": rr.error or parse_response(rr.text)[0].strip()[:120],
+                    }
+                    for rg, rr in zip(cascade["ranges"], cascade["refined"])
+                ],
+                hide_index=True,
+                use_container_width=True,
+            )
+
+    if offset_map is not None and offset_map.removed_ms > 0:
+        st.download_button(
+            "🗺️ オフセットマップ（送信音声の時刻 → 元の録音の時刻, JSON）",
+            data=offset_map.to_json().encode("utf-8"),
+            file_name=f"{base_filename}_offset_map.json",
+            mime="application/json",
+        )
+
 # ================= 次タブへの引き継ぎ =================
 if st.session_state.get("transcribed_text"):
     st.info("👇 下のボタンで議事録タブへテキストを引き継げます。")
@@ -262,3 +701,6 @@ if st.session_state.get("transcribed_text"):
     if st.button("② 議事録タブへ引き継ぐ", type="primary", use_container_width=True):
         st.session_state["minutes_source_text"] = st.session_state["transcribed_text"]
         st.success("引き継ぎました。上部タブ『② 議事録作成（Markdown）』を開いてください。")
+
+# ================= デバッグ：HTTP 接続プール =================
+render_http_debug_panel()
@@ -8,24 +8,37 @@
 # - ✅ 料金計算: lib.costs.estimate_chat_cost_usd（config.MODEL_PRICES_USD 参照）
 # - ✅ トークン取得: lib.tokens.extract_tokens_from_response（modern専用）
 # - ✅ プロンプト管理: lib/prompts.py のレジストリに統一
+# - ✅ OpenAI クライアントは lib/http_clients の共有プール（再実行のたびに作らない）
+# - ✅ 呼び出しは lib/api_client 経由（rpm/tpm の流量制御。429・5xx は Retry-After に従って再送）
+#      ※「リトライなし」は出力が途中で切れたときに max_completion_tokens を増やして再実行しない、の意
+# - ✅ 実行は lib/job_queue のバックグラウンドジョブ（ストリーミングの途中経過を表示・キャンセル可。
+#      ウィジェット操作・再読み込み・同じタブでのページ移動で中断されず、結果はジョブから表示する。
+#      タブを閉じて JOB_ABANDON_SEC の間だれも確認しなければ中止）
 # ------------------------------------------------------------
 from __future__ import annotations
 
-import time
 from typing import Dict, Any
 
 import streamlit as st
-from openai import OpenAI
 
 # ==== 共通ユーティリティ ====
 from lib.costs import estimate_chat_cost_usd
-from lib.tokens import extract_tokens_from_response, debug_usage_snapshot
+from lib.tokens import extract_tokens_from_usage, debug_usage_snapshot
 from lib.prompts import SPEAKER_PREP, get_group, build_prompt
 from config.config import DEFAULT_USDJPY
+from lib.api_client import chat_job, get_api_client
+from lib.job_queue import DONE
+from lib.http_clients import get_openai_client
+from ui.http_debug import render_http_debug_panel
+from ui.job_panel import current_job, keep_session_jobs_alive, render_job_failure, render_job_panel, start_job
 from ui.style import disable_heading_anchors
 
 # ========================== 共通設定 ==========================
 st.set_page_config(page_title="③ 話者分離・整形（新）", page_icon="🎙️", layout="wide")
+
+with st.sidebar:
+    keep_session_jobs_alive()  # ほかのページで投入した実行中ジョブの生存確認
+
 disable_heading_anchors()
 st.title("③ 話者分離・整形（新）— 議事録の前処理")
 
@@ -34,7 +47,8 @@ if not OPENAI_API_KEY:
     st.error("OpenAI API Key が見つかりません。.streamlit/secrets.toml を確認してください。")
     st.stop()
 
-client = OpenAI(api_key=OPENAI_API_KEY)
+client = get_openai_client(OPENAI_API_KEY)  # 全セッション共通（キープアライブ）
+JOB_KEY = "prep_job"  # 実行中・直近のジョブ ID（session_state / URL のキー）
 
 # ========================== モデル設定補助 ==========================
 def supports_temperature(model_name: str) -> bool:
@@ -142,7 +156,7 @@ with right:
         placeholder="①ページの結果を引き継ぐか、ここに貼り付けるか、.txt をドロップしてください。",
     )
 
-# ========================== 実行（リトライなし一発実行） ==========================
+# ========================== 実行（バックグラウンドのジョブとして投入） ==========================
 if run_btn:
     if not src.strip():
         st.warning("文字起こしテキストを入力してください。")
@@ -155,117 +169,114 @@ if run_btn:
             src,
         )
 
-        def call_once(prompt_text: str, out_tokens: int):
-            chat_kwargs: Dict[str, Any] = dict(
-                model=model,
-                messages=[{"role": "user", "content": prompt_text}],
-                max_completion_tokens=int(out_tokens),
+        chat_kwargs: Dict[str, Any] = dict(
+            model=model,
+            messages=[{"role": "user", "content": combined}],
+            max_completion_tokens=int(max_completion_tokens),
+        )
+        # GPT-5系は温度固定なので送らない。それ以外で1.0と違う時のみ送る。
+        if supports_temperature(model) and abs(temperature - 1.0) > 1e-9:
+            chat_kwargs["temperature"] = float(temperature)
+        start_job(
+            JOB_KEY, "speaker_prep", chat_job, client, get_api_client("chat"), chat_kwargs,
+            label="話者分離・整形", meta={"model": model},
+        )
+
+# ========================== 実行状況・結果（ジョブから読む。再実行・再読み込みでも消えない） ==========================
+job = current_job(JOB_KEY)
+if job is not None and job.active:
+    render_job_panel(job, JOB_KEY)
+elif job is not None and job.status != DONE:
+    render_job_failure(job)
+elif job is not None:
+    resp = job.result  # lib/api_client.ChatResult
+    text = resp.text
+    elapsed = resp.elapsed
+    job_model = job.meta.get("model", model)
+
+    if text.strip():
+        st.markdown("### ✅ 整形結果")
+        st.markdown(text)
+        if resp.finish_reason == "length":
+            st.info("finish_reason=length: 出力が上限で切れています。必要に応じて最大出力トークンを増やしてください。")
+
+        # === ダウンロード & コピー ===
+        import json
+        base_filename = "speaker_prep_result"
+        txt_bytes = text.encode("utf-8")
+
+        dl_col, cp_col = st.columns([1, 1], gap="small")
+        with dl_col:
+            st.download_button(
+                "📝 テキスト（.txt）をダウンロード",
+                data=txt_bytes,
+                file_name=f"{base_filename}.txt",
+                mime="text/plain",
+                use_container_width=True,
             )
-            # GPT-5系は温度固定なので送らない。それ以外で1.0と違う時のみ送る。
-            if supports_temperature(model) and abs(temperature - 1.0) > 1e-9:
-                chat_kwargs["temperature"] = float(temperature)
-            return client.chat.completions.create(**chat_kwargs)
-
-        t0 = time.perf_counter()
-        with st.spinner("話者分離・整形を実行中…"):
-            resp = call_once(combined, max_completion_tokens)
-
-            text = ""
-            finish_reason = None
-            if resp and getattr(resp, "choices", None):
-                # 出力テキストの取り出し（リトライなし）
-                try:
-                    text = resp.choices[0].message.content or ""
-                except Exception:
-                    text = getattr(resp.choices[0], "text", "")
-                try:
-                    finish_reason = resp.choices[0].finish_reason
-                except Exception:
-                    finish_reason = None
-
-        elapsed = time.perf_counter() - t0
-
-        if text.strip():
-            st.markdown("### ✅ 整形結果")
-            st.markdown(text)
-
-            # === ダウンロード & コピー ===
-            import json
-            base_filename = "speaker_prep_result"
-            txt_bytes = text.encode("utf-8")
-
-            dl_col, cp_col = st.columns([1, 1], gap="small")
-            with dl_col:
-                st.download_button(
-                    "📝 テキスト（.txt）をダウンロード",
-                    data=txt_bytes,
-                    file_name=f"{base_filename}.txt",
-                    mime="text/plain",
-                    use_container_width=True,
-                )
-            with cp_col:
-                # クリップボードコピー（Clipboard API）
-                safe_json = json.dumps(text or "", ensure_ascii=False)
-                st.components.v1.html(f"""
-                <div style="display:flex;align-items:center;gap:.5rem">
-                  <button id="copyBtn" style="width:100%;padding:.6rem 1rem;border-radius:.5rem;border:1px solid #e0e0e0;cursor:pointer">
-                    📋 テキストをコピー
-                  </button>
-                  <span id="copyMsg" style="font-size:.9rem;color:#888"></span>
-                </div>
-                <script>
-                  const content = {safe_json};
-                  const btn = document.getElementById("copyBtn");
-                  const msg = document.getElementById("copyMsg");
-                  btn.addEventListener("click", async () => {{
-                    try {{
-                      await navigator.clipboard.writeText(content);
-                      msg.textContent = "コピーしました";
-                      setTimeout(() => msg.textContent = "", 1600);
-                    }} catch (e) {{
-                      msg.textContent = "コピーに失敗";
-                      setTimeout(() => msg.textContent = "", 1600);
-                    }}
-                  }});
-                </script>
-                """, height=60)
-            # === 追加ここまで ===
-
-        else:
-            st.warning("⚠️ モデルから空の応答が返されました。レスポンス全体を表示します。")
-            try:
-                st.json(resp.model_dump())
-            except Exception:
-                st.write(resp)
-
-        # === トークン算出（modern専用） ===
-        input_tok, output_tok, total_tok = extract_tokens_from_response(resp)
-
-        # 料金見積り（modern専用: input/output）
-        usd = estimate_chat_cost_usd(model, input_tok, output_tok)
-        jpy = (usd * usd_jpy) if usd is not None else None
-
-        import pandas as pd
-        metrics_data = {
-            "処理時間": [f"{elapsed:.2f} 秒"],
-            "入力トークン": [f"{input_tok:,}"],
-            "出力トークン": [f"{output_tok:,}"],
-            "合計トークン": [f"{total_tok:,}"],
-            "概算 (USD/JPY)": [f"${usd:,.6f} / ¥{jpy:,.2f}" if usd is not None else "—"],
-        }
-        df_metrics = pd.DataFrame(metrics_data)
-        st.subheader("トークンと料金の概要")
-        st.table(df_metrics)
-
-        # === デバッグ用：modern usage スナップショット ===
-        with st.expander("🔍 トークン算出の内訳（modern usage スナップショット）"):
-            try:
-                st.write(debug_usage_snapshot(getattr(resp, "usage", None)))
-            except Exception as e:
-                st.write({"error": str(e)})
+        with cp_col:
+            # クリップボードコピー（Clipboard API）
+            safe_json = json.dumps(text or "", ensure_ascii=False)
+            st.components.v1.html(f"""
+            <div style="display:flex;align-items:center;gap:.5rem">
+              <button id="copyBtn" style="width:100%;padding:.6rem 1rem;border-radius:.5rem;border:1px solid #e0e0e0;cursor:pointer">
+                📋 テキストをコピー
+              </button>
+              <span id="copyMsg" style="font-size:.9rem;color:#888"></span>
+            </div>
+            <script>
+              const content = {safe_json};
+              const btn = document.getElementById("copyBtn");
+              const msg = document.getElementById("copyMsg");
+              btn.addEventListener("click", async () => {{
+                try {{
+                  await navigator.clipboard.writeText(content);
+                  msg.textContent = "コピーしました";
+                  setTimeout(() => msg.textContent = "", 1600);
+                }} catch (e) {{
+                  msg.textContent = "コピーに失敗";
+                  setTimeout(() => msg.textContent = "", 1600);
+                }}
+              }});
+            </script>
+            """, height=60)
+        # === 追加ここまで ===
+
+    else:
+        st.warning("⚠️ モデルから空の応答が返されました。レスポンス全体を表示します。")
+        st.json({k: v for k, v in vars(resp).items() if k != "headers"})
+
+    # === トークン算出（modern専用） ===
+    input_tok, output_tok, total_tok = extract_tokens_from_usage(resp.usage)
+
+    # 料金見積り（modern専用: input/output）
+    usd = estimate_chat_cost_usd(job_model, input_tok, output_tok)
+    jpy = (usd * usd_jpy) if usd is not None else None
+
+    import pandas as pd
+    metrics_data = {
+        "処理時間": [f"{elapsed:.2f} 秒"],
+        "入力トークン": [f"{input_tok:,}"],
+        "出力トークン": [f"{output_tok:,}"],
+        "合計トークン": [f"{total_tok:,}"],
+        "概算 (USD/JPY)": [f"${usd:,.6f} / ¥{jpy:,.2f}" if usd is not None else "—"],
+    }
+    df_metrics = pd.DataFrame(metrics_data)
+    st.subheader("トークンと料金の概要")
+    st.table(df_metrics)
+
+    # === デバッグ用：modern usage スナップショット ===
+    with st.expander("🔍 トークン算出の内訳（modern usage スナップショット）"):
+        try:
+            st.write(debug_usage_snapshot(resp.usage))
+        except Exception as e:
+            st.write({"error": str(e)})
 
-        st.session_state["prep_last_output"] = text
+    st.session_state["prep_last_output"] = text
+    if st.session_state.get("_prep_pushed_job") != job.job_id:
+        # 新しい結果が出たときだけ議事録ページへの入力を上書きする（再描画のたびには上書きしない）
         st.session_state["minutes_source_text"] = text
+        st.session_state["_prep_pushed_job"] = job.job_id
 
 # ========================== 引き渡し ==========================
 if push_btn:
@@ -285,3 +296,6 @@ with st.expander("⚠️ 長文入力（2万文字前後）の注意点"):
 - 価格表は `config.MODEL_PRICES_USD`（USD/100万トークン）を運用価格に合わせて調整してください。
 """
     )
+
+# ========================== デバッグ：HTTP 接続プール ==========================
+render_http_debug_panel()
@@ -6,16 +6,20 @@
 # - .txt に加えて .docx（Word）入力にも対応
 # - ✅ 生成した議事録を .txt / .docx で保存できるダウンロードボタンを追加
 # - ✅ 生成結果は session_state から常時レンダリング（保存ボタン後も消えない）
+# - ✅ OpenAI クライアントは lib/http_clients の共有プール（再実行のたびに作らない）
+# - ✅ 呼び出しは lib/api_client 経由（rpm/tpm の流量制御。429・5xx は Retry-After に従って再送）
+#      ※「リトライなし」は出力が途中で切れたときに max_completion_tokens を増やして再実行しない、の意
+# - ✅ 実行は lib/job_queue のバックグラウンドジョブ（ストリーミングの途中経過を表示・キャンセル可。
+#      ウィジェット操作・再読み込み・同じタブでのページ移動で中断されず、結果はジョブから表示する。
+#      タブを閉じて JOB_ABANDON_SEC の間だれも確認しなければ中止）
 # ------------------------------------------------------------
 from __future__ import annotations
 
-import time
 from typing import Dict, Any
 from io import BytesIO
 
 import streamlit as st
 import pandas as pd
-from openai import OpenAI
 
 # ==== .docx 読み取り／書き出し（python-docx） ====
 try:
@@ -26,12 +30,21 @@ except Exception:
 
 # ==== 共通ユーティリティ ====
 from lib.prompts import MINUTES_MAKER, get_group, build_prompt
-from lib.tokens import extract_tokens_from_response, debug_usage_snapshot  # modern専用
+from lib.tokens import extract_tokens_from_usage, debug_usage_snapshot  # modern専用
 from lib.costs import estimate_chat_cost_usd  # def(model, input_tokens, output_tokens)
 from config.config import DEFAULT_USDJPY
+from lib.api_client import chat_job, get_api_client
+from lib.job_queue import DONE
+from lib.http_clients import get_openai_client
+from ui.http_debug import render_http_debug_panel
+from ui.job_panel import current_job, keep_session_jobs_alive, render_job_failure, render_job_panel, start_job
 
 # ========================== 共通設定 ==========================
 st.set_page_config(page_title="④ 議事録作成", page_icon="📝", layout="wide")
+
+with st.sidebar:
+    keep_session_jobs_alive()  # ほかのページで投入した実行中ジョブの生存確認
+
 st.title("④ 議事録作成 — 整形テキストから正式議事録へ")
 
 OPENAI_API_KEY = st.secrets.get("openai", {}).get("api_key") or st.secrets.get("OPENAI_API_KEY")
@@ -39,7 +52,8 @@ if not OPENAI_API_KEY:
     st.error("OpenAI API Key が見つかりません。.streamlit/secrets.toml を確認してください。")
     st.stop()
 
-client = OpenAI(api_key=OPENAI_API_KEY)
+client = get_openai_client(OPENAI_API_KEY)  # 全セッション共通（キープアライブ）
+JOB_KEY = "minutes_job"  # 実行中・直近のジョブ ID（session_state / URL のキー）
 
 # ---- セッション初期化（表示が消えない用の保険）----
 st.session_state.setdefault("minutes_final_output", "")
@@ -173,7 +187,7 @@ with right:
         placeholder="「③ 話者分離・整形（新）」の結果を流し込む想定です。",
     )
 
-# ========================== 実行（モデル呼び出し：リトライなし） ==========================
+# ========================== 実行（バックグラウンドのジョブとして投入） ==========================
 if run_btn:
     if not src.strip():
         st.warning("整形済みテキストを入力してください。")
@@ -186,68 +200,61 @@ if run_btn:
             src,
         )
 
-        def call_once(prompt_text: str, out_tokens: int):
-            chat_kwargs: Dict[str, Any] = dict(
-                model=model,
-                messages=[{"role": "user", "content": prompt_text}],
-                max_completion_tokens=int(out_tokens),
-            )
-            if temp_supported and abs(temperature - 1.0) > 1e-9:
-                chat_kwargs["temperature"] = float(temperature)
-            return client.chat.completions.create(**chat_kwargs)
-
-        t0 = time.perf_counter()
-        with st.spinner("議事録を生成中…"):
-            resp = call_once(combined, max_completion_tokens)
-
-            text = ""
-            finish_reason = None
-            if resp and getattr(resp, "choices", None):
-                try:
-                    text = resp.choices[0].message.content or ""
-                except Exception:
-                    text = getattr(resp.choices[0], "text", "")
-                try:
-                    finish_reason = resp.choices[0].finish_reason
-                except Exception:
-                    finish_reason = None
-
-        elapsed = time.perf_counter() - t0
+        chat_kwargs: Dict[str, Any] = dict(
+            model=model,
+            messages=[{"role": "user", "content": combined}],
+            max_completion_tokens=int(max_completion_tokens),
+        )
+        if temp_supported and abs(temperature - 1.0) > 1e-9:
+            chat_kwargs["temperature"] = float(temperature)
+        start_job(
+            JOB_KEY, "minutes", chat_job, client, get_api_client("chat"), chat_kwargs,
+            label="議事録の生成", meta={"model": model},
+        )
 
+# ========================== 実行状況・料金（ジョブから読む） ==========================
+job = current_job(JOB_KEY)
+if job is not None and job.active:
+    render_job_panel(job, JOB_KEY)
+elif job is not None and job.status != DONE:
+    render_job_failure(job)
+elif job is not None:
+    resp = job.result  # lib/api_client.ChatResult
+    text = resp.text
+    if st.session_state.get("_minutes_job_shown") != job.job_id:
+        # 新しい結果が出たときだけ表示用の本文を差し替える
+        st.session_state["_minutes_job_shown"] = job.job_id
         if text.strip():
             st.session_state["minutes_final_output"] = text
-            if finish_reason == "length":
-                st.info("finish_reason=length: 出力が上限で切れています。必要に応じて最大出力トークンを増やしてください。")
-        else:
-            st.warning("⚠️ モデルから空の応答が返されました。レスポンス全体を表示します。")
-            try:
-                st.json(resp.model_dump())
-            except Exception:
-                st.write(resp)
-
-        # === トークン算出（modern専用） ===
-        if 'resp' in locals():
-            input_tok, output_tok, total_tok = extract_tokens_from_response(resp)
-            usd = estimate_chat_cost_usd(model, input_tok, output_tok)
-            jpy = (usd * usd_jpy) if usd is not None else None
-
-            # ===== 概要テーブル =====
-            metrics_data = {
-                "処理時間": [f"{elapsed:.2f} 秒"],
-                "入力トークン": [f"{input_tok:,}"],
-                "出力トークン": [f"{output_tok:,}"],
-                "合計トークン": [f"{total_tok:,}"],
-                "概算 (USD/JPY)": [f"${usd:,.6f} / ¥{jpy:,.2f}" if usd is not None else "—"],
-            }
-            st.subheader("トークンと料金の概要")
-            st.table(pd.DataFrame(metrics_data))
-
-            # === デバッグ用：modern usage スナップショット ===
-            with st.expander("🔍 トークン算出の内訳（modern usage スナップショット）"):
-                try:
-                    st.write(debug_usage_snapshot(getattr(resp, "usage", None)))
-                except Exception as e:
-                    st.write({"error": str(e)})
+
+    if not text.strip():
+        st.warning("⚠️ モデルから空の応答が返されました。レスポンス全体を表示します。")
+        st.json({k: v for k, v in vars(resp).items() if k != "headers"})
+    elif resp.finish_reason == "length":
+        st.info("finish_reason=length: 出力が上限で切れています。必要に応じて最大出力トークンを増やしてください。")
+
+    # === トークン算出（modern専用） ===
+    input_tok, output_tok, total_tok = extract_tokens_from_usage(resp.usage)
+    usd = estimate_chat_cost_usd(job.meta.get("model", model), input_tok, output_tok)
+    jpy = (usd * usd_jpy) if usd is not None else None
+
+    # ===== 概要テーブル =====
+    metrics_data = {
+        "処理時間": [f"{resp.elapsed:.2f} 秒"],
+        "入力トークン": [f"{input_tok:,}"],
+        "出力トークン": [f"{output_tok:,}"],
+        "合計トークン": [f"{total_tok:,}"],
+        "概算 (USD/JPY)": [f"${usd:,.6f} / ¥{jpy:,.2f}" if usd is not None else "—"],
+    }
+    st.subheader("トークンと料金の概要")
+    st.table(pd.DataFrame(metrics_data))
+
+    # === デバッグ用：modern usage スナップショット ===
+    with st.expander("🔍 トークン算出の内訳（modern usage スナップショット）"):
+        try:
+            st.write(debug_usage_snapshot(resp.usage))
+        except Exception as e:
+            st.write({"error": str(e)})
 
 # ========================== 生成結果の表示 ＆ ダウンロード（常時レンダリング） ==========================
 final_text = (st.session_state.get("minutes_final_output") or "").strip()
@@ -291,3 +298,6 @@ if final_text:
             st.error(f"Word 出力でエラーが発生しました: {e}")
     else:
         st.info("Word 保存には `python-docx` が必要です。`pip install python-docx` を実行してください。")
+
+# ========================== デバッグ：HTTP 接続プール ==========================
+render_http_debug_panel()
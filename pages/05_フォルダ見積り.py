@@ -0,0 +1,122 @@
+# ------------------------------------------------------------
+# 📊 フォルダ見積り（プリフライト）— 一括文字起こしの前に合計時間と料金を確認
+# - サーバー上のフォルダを指定し、音声ファイルの再生時間を並列にプローブ（ヘッダのみ読む）
+# - 指定できるのは PREFLIGHT_ALLOWED_ROOTS（secrets）の下のフォルダだけ
+# - モデル別（TRANSCRIBE_PRICES_USD_PER_MIN）の概算料金表と処理時間の目安（TRANSCRIBE_SEC_PER_AUDIO_MIN）を表示
+# - 結果はパス＋mtime＋サイズでキャッシュ（2回目以降は変更されたファイルだけ再プローブ）
+# - CLI 版: python -m tools.preflight <folder>
+# ------------------------------------------------------------
+from __future__ import annotations
+
+import pandas as pd
+import streamlit as st
+
+from config.config import (
+    DEFAULT_USDJPY,
+    PREFLIGHT_ALLOWED_ROOTS,
+    PREFLIGHT_CACHE_PATH,
+    TRANSCRIBE_MAX_CONCURRENCY,
+    TRANSCRIBE_PRICES_USD_PER_MIN,
+    TRANSCRIBE_SEC_PER_AUDIO_MIN,
+)
+from lib.audio_split import hhmmss
+from lib.preflight import (
+    DEFAULT_PROBE_WORKERS,
+    allowed_folder,
+    cost_table,
+    preflight_csv,
+    run_preflight,
+    scan_audio_files,
+    within_roots,
+)
+from ui.job_panel import keep_session_jobs_alive
+
+st.set_page_config(page_title="⑤ フォルダ見積り", page_icon="📊", layout="wide")
+
+with st.sidebar:
+    keep_session_jobs_alive()  # ほかのページで投入した実行中ジョブの生存確認
+
+st.title("⑤ フォルダ見積り — 合計時間とモデル別の文字起こし料金")
+
+st.session_state.setdefault("usd_jpy", float(DEFAULT_USDJPY))
+
+with st.sidebar:
+    st.header("設定")
+    recursive = st.checkbox("サブフォルダも含める", value=True)
+    workers = st.number_input("並列数（スレッド）", min_value=1, max_value=128, value=DEFAULT_PROBE_WORKERS, step=1)
+    use_cache = st.checkbox("前回のプローブ結果を再利用（パス＋更新日時＋サイズ）", value=True)
+    usd_jpy = st.number_input(
+        "USD/JPY", min_value=50.0, max_value=500.0, value=float(st.session_state["usd_jpy"]), step=0.5
+    )
+    st.session_state["usd_jpy"] = float(usd_jpy)
+
+if not PREFLIGHT_ALLOWED_ROOTS:
+    st.info("見積もれるフォルダが設定されていません。secrets の PREFLIGHT_ALLOWED_ROOTS にルートのパス（リスト）を指定してください。")
+    st.stop()
+
+st.caption("指定できるフォルダ: " + " / ".join(f"`{r}`" for r in PREFLIGHT_ALLOWED_ROOTS) + " の下")
+folder = st.text_input("フォルダのパス（サーバー上）", placeholder=str(PREFLIGHT_ALLOWED_ROOTS[0]))
+go = st.button("見積もる", type="primary", disabled=not folder)
+
+if go:
+    root = allowed_folder(folder, PREFLIGHT_ALLOWED_ROOTS)
+    if root is None:
+        st.error("指定できるフォルダの下にある、存在するフォルダを指定してください。")
+        st.stop()
+    # シンボリックリンクでルートの外を指すファイルは除く
+    paths = [p for p in scan_audio_files(root, recursive=recursive) if within_roots(p, PREFLIGHT_ALLOWED_ROOTS)]
+    if not paths:
+        st.warning("音声ファイルが見つかりませんでした（対応拡張子: mp3 / wav / m4a / mp4 / webm / ogg / opus / flac など）。")
+        st.stop()
+
+    bar = st.progress(0.0, text=f"0 / {len(paths)}")
+
+    def on_progress(done: int, total: int) -> None:
+        bar.progress(done / max(1, total), text=f"{done} / {total}")
+
+    res = run_preflight(
+        paths,
+        workers=int(workers),
+        cache_path=PREFLIGHT_CACHE_PATH if use_cache else None,
+        on_progress=on_progress,
+    )
+    bar.empty()
+
+    c1, c2, c3, c4 = st.columns(4)
+    c1.metric("ファイル数", f"{len(res.files):,}")
+    c2.metric("合計時間", hhmmss(int(res.total_seconds * 1000)), f"{res.total_minutes:,.1f} 分", delta_color="off")
+    c3.metric("合計サイズ", f"{res.total_bytes / 1e9:,.2f} GB")
+    c4.metric("プローブ時間", f"{res.wall_seconds:.2f} 秒", f"キャッシュ {res.n_cached:,} 件", delta_color="off")
+
+    st.subheader("モデル別の概算料金と処理時間の目安")
+    table = cost_table(res.total_minutes, TRANSCRIBE_PRICES_USD_PER_MIN, float(usd_jpy),
+                       TRANSCRIBE_SEC_PER_AUDIO_MIN, TRANSCRIBE_MAX_CONCURRENCY)
+    for row in table:
+        sec = row.pop("処理時間（秒）")
+        row["処理時間（目安）"] = hhmmss(int(sec * 1000)) if sec is not None else "—"
+    st.table(pd.DataFrame(table))
+    st.caption(f"処理時間は音声 1 分あたりの目安 × 合計分数 ÷ 並列 {TRANSCRIBE_MAX_CONCURRENCY}（アップロード時間は含まない）。")
+
+    if res.failed:
+        st.warning(f"{len(res.failed)} ファイルの長さを取得できませんでした（合計に含まれていません）。")
+
+    st.subheader("ファイル一覧")
+    rows = [
+        {
+            "パス": f.path,
+            "サイズ(MB)": round(f.size / 1e6, 2),
+            "長さ": hhmmss(int(f.seconds * 1000)) if f.seconds is not None else "—",
+            "分": round(f.seconds / 60, 2) if f.seconds is not None else None,
+            "キャッシュ": "✓" if f.cached else "",
+            "エラー": f.error,
+        }
+        for f in res.files
+    ]
+    st.dataframe(rows, hide_index=True, use_container_width=True)
+
+    st.download_button(
+        "📄 ファイル一覧（CSV）をダウンロード",
+        data=preflight_csv(res).encode("utf-8"),
+        file_name="preflight.csv",
+        mime="text/csv",
+    )
@@ -5,8 +5,13 @@ from lib.utils_text import (
     sentence_split_with_inferred_periods, sentence_split_by_period,
     add_line_numbers, post_process
 )
+from ui.job_panel import keep_session_jobs_alive
 
 st.set_page_config(page_title="前処理（文分割＋句点改行）", page_icon="📝", layout="wide")
+
+with st.sidebar:
+    keep_session_jobs_alive()  # ほかのページで投入した実行中ジョブの生存確認
+
 st.title("📝 前処理（文分割＋句点改行）")
 
 with st.sidebar:
@@ -6,8 +6,13 @@ from lib.utils_text import (
     strip_bracketed, build_line_diff, build_sentence_diff,
     LINE_DIFF_STYLE, SENT_DIFF_STYLE
 )
+from ui.job_panel import keep_session_jobs_alive
 
 st.set_page_config(page_title="後処理（【…】削除のみ）", page_icon="✂️", layout="wide")
+
+with st.sidebar:
+    keep_session_jobs_alive()  # ほかのページで投入した実行中ジョブの生存確認
+
 st.title("✂️ 後処理（【…】削除のみ）")
 
 with st.sidebar:
@@ -0,0 +1,62 @@
+from email.utils import formatdate
+
+import pytest
+
+from lib import api_client
+from lib.api_client import TokenBucket, backoff_delay, parse_duration, retry_after_sec
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(api_client.time, "monotonic", lambda: now[0])
+    return now
+
+
+def test_token_bucket_refills_at_the_per_minute_rate(clock):
+    b = TokenBucket(60)  # 1 秒に 1 個、容量は BURST_SEC 秒分
+    assert b.capacity == pytest.approx(api_client.BURST_SEC)
+    assert b.wait_time(1) == 0.0
+
+    b.take(b.capacity)
+    assert b.wait_time(1) == pytest.approx(1.0)
+    clock[0] += 0.5
+    assert b.wait_time(1) == pytest.approx(0.5)
+    clock[0] += 1000
+    assert b.tokens <= b.capacity and b.wait_time(b.capacity) == 0.0
+    assert b.wait_time(1e6) == 0.0  # 容量を超える要求は容量で頭打ち
+
+
+def test_token_bucket_follows_server_limits(clock):
+    b = TokenBucket(600)
+    b.clamp(3)
+    assert b.tokens == pytest.approx(3)
+    b.shrink(60)
+    assert b.per_minute == 60 and b.tokens <= b.capacity
+    b.shrink(6000)  # 設定より大きい上限は無視
+    assert b.per_minute == 60
+
+    off = TokenBucket(0)
+    off.take(100)
+    assert not off.enabled and off.wait_time(100) == 0.0
+
+
+def test_retry_after_headers():
+    assert retry_after_sec(None) is None
+    assert retry_after_sec({}) is None
+    assert retry_after_sec({"retry-after-ms": "1500", "retry-after": "9"}) == pytest.approx(1.5)
+    assert retry_after_sec({"retry-after": "7"}) == pytest.approx(7.0)
+    assert retry_after_sec({"retry-after": "-3"}) == 0.0
+    assert retry_after_sec({"retry-after": formatdate(api_client.time.time() + 30, usegmt=True)}) == pytest.approx(30, abs=2)
+    assert retry_after_sec({"retry-after": "soon"}) is None
+    assert parse_duration("6m0s") == pytest.approx(360.0)
+    assert parse_duration("20ms") == pytest.approx(0.02)
+
+
+def test_backoff_delay_bounds():
+    for attempt in range(1, 8):
+        d = min(8.0, 0.5 * 2 ** (attempt - 1))
+        for _ in range(20):
+            assert d / 2 <= backoff_delay(attempt, base=0.5, cap=8.0) <= d
+    for _ in range(20):
+        assert 4.0 <= backoff_delay(3, retry_after=4.0) <= 4.5
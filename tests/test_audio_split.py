@@ -0,0 +1,33 @@
+import numpy as np
+
+from lib.audio_split import plan_silence_ranges
+
+
+def _flat(a, b):
+    return np.ones(-(-(b - a) // 20), dtype=np.float32)
+
+
+def test_tail_absorption_respects_strict_max():
+    # 60 秒チャンク・探索幅 30 秒 → 尻尾（30 秒未満）を吸収すると 60 秒を超える
+    kw = dict(total_ms=60_000 + 20_000, chunk_ms=60_000, overlap_ms=1_000, tolerance_ms=30_000, envelope_fn=_flat)
+    loose = plan_silence_ranges(**kw)
+    assert len(loose) == 1 and loose[0].duration_ms > 60_000
+
+    strict = plan_silence_ranges(**kw, strict_max=True)
+    assert len(strict) == 2
+    assert max(p.duration_ms for p in strict) <= 60_000
+    assert strict[-1].end_ms == 80_000
+
+
+def test_strict_max_still_absorbs_when_it_fits():
+    # 35 秒・75 秒に無音 → 2 つ目のチャンクが 34〜75 秒と短いので、尻尾（74〜80 秒）を吸収しても 60 秒以内
+    def dips(a, b):
+        t = np.arange(a, b, 20)
+        return np.where((abs(t - 35_000) < 100) | (abs(t - 75_000) < 100), 0.0, 1.0).astype(np.float32)
+
+    parts = plan_silence_ranges(
+        total_ms=80_000, chunk_ms=60_000, overlap_ms=1_000, tolerance_ms=30_000,
+        envelope_fn=dips, strict_max=True,
+    )
+    assert len(parts) == 2 and abs(parts[0].end_ms - 35_000) < 200
+    assert parts[1].end_ms == 80_000 and parts[1].duration_ms <= 60_000
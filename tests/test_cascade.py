@@ -0,0 +1,79 @@
+import json
+import random
+
+from lib.cascade import (
+    WINDOW_CHARS,
+    compression_ratio,
+    find_low_confidence,
+    splice_text,
+    stitch_cascade,
+)
+from lib.transcribe_chunks import ChunkResult, request_fields
+
+POOL = "あいうえおかきくけこさしすせそ会議予算資料確認今日明日担当部長課長説明検討報告案件"
+
+
+def _normal_text(n_chars: int, seed: int = 1) -> str:
+    """繰り返しの無い普通の本文（単語をランダムにつないだもの）。"""
+    rng = random.Random(seed)
+    words = []
+    while sum(map(len, words)) < n_chars:
+        words.append("".join(rng.choice(POOL) for _ in range(rng.randint(2, 5))) + rng.choice(["、", "。", ""]))
+    return "".join(words)[:n_chars]
+
+
+def _chunk(text: str, end_ms: int = 600_000, logprobs=None, index: int = 1) -> ChunkResult:
+    body = {"text": text}
+    if logprobs is not None:
+        body["logprobs"] = logprobs
+    return ChunkResult(index, 0, end_ms, json.dumps(body, ensure_ascii=False))
+
+
+def test_long_normal_text_is_not_flagged():
+    text = _normal_text(6000)
+    # チャンク全体の圧縮率は長さとともに上がり、しきい値を超える（以前はこれでチャンクごと送り直していた）
+    assert compression_ratio(text) > 2.4
+    assert find_low_confidence([_chunk(text)]) == []
+
+
+def test_loop_flags_only_its_window():
+    head, tail = _normal_text(3000, seed=2), _normal_text(3000, seed=3)
+    loop = "ありがとうございます。" * 30
+    text = head + loop + tail
+    ranges = find_low_confidence([_chunk(text)])
+    assert len(ranges) == 1
+    rg = ranges[0]
+    assert rg.chunk_index == 1 and "繰り返し" in rg.reasons
+    ca, cb = rg.chars
+    assert ca <= len(head) + len(loop) and cb >= len(head)
+    assert cb - ca <= len(loop) + 2 * WINDOW_CHARS
+    assert rg.end_ms - rg.start_ms < 600_000 // 3
+
+
+def test_low_logprob_window_is_flagged_and_spliced():
+    text = _normal_text(2000, seed=4)
+    # 1 トークン 10 文字。800〜1000 文字だけ自信の無いトークン
+    logprobs = [
+        {"token": text[i:i + 10], "logprob": -2.5 if 800 <= i < 1000 else -0.1}
+        for i in range(0, len(text), 10)
+    ]
+    r = _chunk(text, end_ms=200_000, logprobs=logprobs)
+    ranges = find_low_confidence([r])
+    assert len(ranges) == 1 and ranges[0].reasons == ("logprob",)
+    ca, cb = ranges[0].chars
+    assert ca <= 800 and cb >= 1000 and cb - ca <= 200 + 2 * WINDOW_CHARS
+
+    # 送り直した本文は前後の余白ぶん手前・後ろの本文と重なる → 重なりは 1 回分だけ残る
+    pad = 3 * len(text) // 200  # CASCADE_TEXT_PAD_MS=3 秒ぶんの文字数（200 秒で 2000 文字）
+    refined = text[ca - pad:ca] + "正しい本文" + text[cb:cb + pad]
+    out = splice_text(r, [(ranges[0], refined)])
+    assert out == text[:ca] + "正しい本文" + text[cb:]
+
+    res = stitch_cascade([r], ranges, [ChunkResult(1, ranges[0].start_ms, ranges[0].end_ms, json.dumps({"text": refined}, ensure_ascii=False))])
+    assert res.text == out
+
+
+def test_logprobs_are_requested_only_for_the_cascade():
+    assert "include[]" not in request_fields("gpt-4o-transcribe")
+    assert request_fields("gpt-4o-transcribe", logprobs=True)["include[]"] == "logprobs"
+    assert "include[]" not in request_fields("whisper-1", logprobs=True)
@@ -0,0 +1,35 @@
+from lib.decode_cache import DecodeCache
+
+
+class _Audio:
+    sample_width, frame_rate, channels = 2, 8000, 1
+
+    def __init__(self, n_bytes: int):
+        self.raw_data = b"\0" * n_bytes
+
+
+def test_pinned_spool_survives_eviction(tmp_path):
+    cache = DecodeCache(tmp_path, max_bytes=3000)
+    cache.put_audio("a", "v", _Audio(2000))
+    spool = cache.pcm_spool("a", "v")
+    assert spool is not None and not spool.owned
+
+    # 容量を超えても、ワーカーが使用中（pin）の PCM は消さない
+    cache.put_blob("b", {"i": 1}, b"x" * 1000)
+    with open(spool.path, "rb") as f:
+        assert len(f.read()) == 2000
+    assert not cache.has_blob("b", {"i": 1})
+
+    # unpin 後は古い順に追い出される
+    cache.unpin("a")
+    cache.put_blob("c", {"i": 1}, b"x" * 1000)
+    assert cache.pcm_spool("a", "v") is None
+    assert cache.has_blob("c", {"i": 1})
+    assert cache.total_bytes() <= 3000
+
+
+def test_index_is_loaded_from_disk(tmp_path):
+    DecodeCache(tmp_path, max_bytes=10_000).put_blob("a", {"i": 1}, b"x" * 1234)
+    cache = DecodeCache(tmp_path, max_bytes=10_000)
+    assert cache.total_bytes() == 1234
+    assert cache.get_blob("a", {"i": 1}) == b"x" * 1234
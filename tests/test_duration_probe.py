@@ -0,0 +1,82 @@
+import io
+import struct
+import wave
+
+import pytest
+
+from lib.duration_probe import header_duration_seconds
+
+FRAME_HDR = b"\xff\xfb\x90\x44"  # MPEG-1 Layer III, 128 kbps, 44.1 kHz, joint stereo
+FRAME_LEN = 144000 * 128 // 44100
+SIDE_INFO = 32                   # MPEG-1 ステレオ
+
+
+def _frame(body: bytes = b"") -> bytes:
+    return FRAME_HDR + body.ljust(FRAME_LEN - 4, b"\x00")
+
+
+def _box(typ: bytes, body: bytes) -> bytes:
+    return struct.pack(">I", 8 + len(body)) + typ + body
+
+
+def _ogg_page(granule: int, packet: bytes) -> bytes:
+    return b"OggS\x00\x02" + struct.pack("<q", granule) + b"\x00" * 12 + bytes([1, len(packet)]) + packet
+
+
+def test_wav():
+    out = io.BytesIO()
+    with wave.open(out, "wb") as w:
+        w.setnchannels(2)
+        w.setsampwidth(2)
+        w.setframerate(8000)
+        w.writeframes(b"\x00" * 4 * 12_000)
+    assert header_duration_seconds(out.getvalue()) == pytest.approx(1.5)
+
+
+def test_mp3_xing_frame_count():
+    xing = b"\x00" * SIDE_INFO + b"Xing" + struct.pack(">II", 1, 1000)
+    buf = _frame(xing) + _frame() * 3
+    assert header_duration_seconds(buf) == pytest.approx(1000 * 1152 / 44100)
+
+
+def test_mp3_vbri_frame_count():
+    vbri = b"\x00" * 32 + b"VBRI" + b"\x00" * 10 + struct.pack(">I", 500)
+    buf = b"ID3\x04\x00\x00\x00\x00\x00\x05" + b"\x00" * 5 + _frame(vbri) + _frame() * 3
+    assert header_duration_seconds(buf) == pytest.approx(500 * 1152 / 44100)
+
+
+def test_mp3_without_tag_is_estimated_as_cbr():
+    buf = _frame() * 10 + b"TAG" + b"\x00" * 125
+    assert header_duration_seconds(buf) == pytest.approx(10 * FRAME_LEN * 8 / 128_000)
+
+
+def test_mp4_moov_after_mdat():
+    mvhd = _box(b"mvhd", b"\x00" * 12 + struct.pack(">II", 1000, 90_500) + b"\x00" * 80)
+    buf = _box(b"ftyp", b"M4A \x00\x00\x00\x00") + _box(b"mdat", b"\x00" * 256) + _box(b"moov", mvhd)
+    assert header_duration_seconds(buf) == pytest.approx(90.5)
+
+
+def test_ogg_opus_subtracts_pre_skip():
+    head = b"OpusHead\x01\x02" + struct.pack("<H", 312) + struct.pack("<I", 48000) + b"\x00\x00\x00"
+    buf = _ogg_page(0, head) + b"\x00" * 1000 + _ogg_page(3 * 48000 + 312, b"\x00" * 10)
+    assert header_duration_seconds(buf) == pytest.approx(3.0)
+
+
+def test_ogg_vorbis_uses_identification_rate():
+    ident = b"\x01vorbis" + struct.pack("<IBI", 0, 2, 22050) + b"\x00" * 14
+    buf = _ogg_page(0, ident) + _ogg_page(22050 * 4, b"\x00" * 10)
+    assert header_duration_seconds(buf) == pytest.approx(4.0)
+
+
+def test_flac_streaminfo():
+    sr, total = 44100, 441_000
+    info = b"\x00" * 10 + bytes([sr >> 12, (sr >> 4) & 0xFF, (sr & 0x0F) << 4 | 0x02, (total >> 32) & 0x0F])
+    info += struct.pack(">I", total & 0xFFFFFFFF) + b"\x00" * 16
+    buf = b"fLaC" + b"\x80\x00\x00\x22" + info
+    assert header_duration_seconds(buf) == pytest.approx(10.0)
+
+
+def test_unknown_or_broken_headers_return_none():
+    assert header_duration_seconds(b"not an audio file") is None
+    assert header_duration_seconds(b"RIFF\x00\x00\x00\x00WAVE") is None
+    assert header_duration_seconds(b"\x00\x00\x00\x10ftypM4A \x00\x00\x00\x00") is None
@@ -0,0 +1,15 @@
+import numpy as np
+
+from lib.envelope import quietest_offset_ms
+
+
+def test_quiet_dip_in_loud_window_beats_edges():
+    # 一様に大きい音の中に少しだけ静かな谷（0.7）。端の移動平均が 0 埋めで下がると端が選ばれていた
+    env = np.ones(100, dtype=np.float32)
+    env[48:53] = 0.7
+    assert quietest_offset_ms(env, win_ms=20, smooth=5) == 50 * 20 + 10
+
+
+def test_flat_envelope_prefers_the_end():
+    env = np.ones(50, dtype=np.float32)
+    assert quietest_offset_ms(env, win_ms=20, smooth=5) == 49 * 20 + 10
@@ -0,0 +1,35 @@
+import hashlib
+
+from lib.multipart_upload import MultipartBody, Payload
+
+
+def test_content_length_matches_iterated_bytes_on_every_pass(tmp_path):
+    header = b"RIFF-header"
+    data = bytes(range(256)) * 40
+    tail = tmp_path / "tail.bin"
+    tail.write_bytes(b"\x01" * 3000)
+    payload = Payload(header, memoryview(data)[100:9000], str(tail), b"")
+    expected = header + data[100:9000] + tail.read_bytes()
+    assert len(payload) == len(expected)
+    assert payload.sha256() == hashlib.sha256(expected).hexdigest()
+
+    progress = []
+    body = MultipartBody(
+        {"model": "whisper-1", "prompt": "会議"}, "file", 'a "b".wav', payload, "audio/wav",
+        on_progress=lambda sent, total: progress.append((sent, total)), block_size=1024,
+    )
+    first = b"".join(bytes(b) for b in body)
+    second = b"".join(bytes(b) for b in body)  # 再送：先頭から同じ本文
+    assert len(first) == len(body) == len(second) and first == second
+
+    assert expected in first
+    assert 'name="prompt"\r\n\r\n会議\r\n'.encode() in first
+    assert b'filename="a %22b%22.wav"\r\nContent-Type: audio/wav\r\n\r\n' in first
+    assert first.endswith(f"\r\n--{body.boundary}--\r\n".encode())
+    assert body.content_type == f"multipart/form-data; boundary={body.boundary}"
+
+    # 進捗は 1 回ごとに 0 から数え直し、最後は全体に一致する
+    n = len(progress) // 2
+    assert progress[0] == (0, len(body)) and progress[n] == (0, len(body))
+    assert progress[n - 1] == progress[-1] == (len(body), len(body))
+    assert all(a[0] <= b[0] for a, b in zip(progress[:n - 1], progress[1:n]))
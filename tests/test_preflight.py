@@ -0,0 +1,27 @@
+import os
+
+from lib.preflight import allowed_folder, run_preflight, within_roots
+
+
+def test_allowed_folder_stays_under_roots(tmp_path):
+    root, other = tmp_path / "rec", tmp_path / "other"
+    (root / "2024").mkdir(parents=True)
+    other.mkdir()
+    os.symlink(other, root / "link")
+
+    assert allowed_folder(root / "2024", [root]) == (root / "2024").resolve()
+    assert allowed_folder(root / ".." / "other", [root]) is None
+    assert allowed_folder(root / "link", [root]) is None  # リンク先がルートの外
+    assert allowed_folder(root / "missing", [root]) is None
+    assert not within_roots(other, [root])
+
+
+def test_failed_probe_is_cached(tmp_path):
+    f = tmp_path / "broken.mp3"
+    f.write_bytes(b"not audio" * 10)
+    cache = tmp_path / "cache.json"
+
+    first = run_preflight([f], cache_path=cache).files[0]
+    second = run_preflight([f], cache_path=cache).files[0]
+    assert first.seconds is None and first.error and not first.cached
+    assert second.seconds is None and second.cached and second.error == first.error
@@ -0,0 +1,39 @@
+from lib.stitch import Piece, Segment, stitch_segments, stitch_texts
+
+
+def test_skipped_chunk_is_reported_as_gap():
+    pieces = [
+        Piece(0, 600_000, "はじめの話。", index=1),
+        Piece(1_198_000, 1_800_000, "三つ目の話。", index=3),  # 2 は失敗して除いた
+    ]
+    res = stitch_texts(pieces)
+    assert [(s.index, s.method, s.confidence) for s in res.seams] == [(1, "gap", 0.0)]
+    assert res.text == "はじめの話。\n三つ目の話。"
+
+
+def test_time_gap_without_indexes_is_a_gap():
+    res = stitch_texts([Piece(0, 1_000, "あ"), Piece(2_000, 3_000, "い")])
+    assert res.seams[0].method == "gap" and res.seams[0].confidence == 0.0
+
+
+def test_adjacent_chunks_without_overlap_are_not_gaps():
+    res = stitch_texts([Piece(0, 1_000, "あ", index=1), Piece(1_000, 2_000, "い", index=2)])
+    assert (res.seams[0].method, res.seams[0].confidence) == ("none", 1.0)
+
+
+def test_empty_chunk_in_between_is_not_a_gap():
+    res = stitch_texts([
+        Piece(0, 1_000, "あ", index=1),
+        Piece(1_000, 2_000, "", index=2),  # 無音で本文なし
+        Piece(2_000, 3_000, "い", index=3),
+    ])
+    assert [s.method for s in res.seams] == ["none"]
+
+
+def test_segments_gap():
+    res = stitch_segments([
+        Piece(0, 10_000, segments=[Segment(0, 9_000, "a")], index=1),
+        Piece(20_000, 30_000, segments=[Segment(20_000, 29_000, "c")], index=3),
+    ])
+    assert [(s.method, s.confidence) for s in res.seams] == [("gap", 0.0)]
+    assert res.text == "ac"
@@ -0,0 +1,65 @@
+import io
+import struct
+import wave
+
+import numpy as np
+
+from lib.stream_copy import index_mp3, parse_wav
+
+FRAME_HDR = b"\xff\xfb\x90\x44"  # MPEG-1 Layer III, 128 kbps, 44.1 kHz, joint stereo
+FRAME_LEN = 144000 * 128 // 44100
+
+
+def _frame(body: bytes = b"") -> bytes:
+    return FRAME_HDR + body.ljust(FRAME_LEN - 4, b"\x00")
+
+
+def _id3v2(size: int) -> bytes:
+    syncsafe = bytes([(size >> 21) & 0x7F, (size >> 14) & 0x7F, (size >> 7) & 0x7F, size & 0x7F])
+    return b"ID3\x04\x00\x00" + syncsafe + b"\x00" * size
+
+
+def test_mp3_index_skips_tags_junk_and_xing_frame():
+    junk = b"\x00\xff\x00\xff\xe0junk"  # 0xFF はあるがフレームヘッダではない
+    head = _id3v2(20) + _frame(b"\x00" * 32 + b"Xing")
+    audio = [_frame() for _ in range(3)] + [junk] + [_frame() for _ in range(2)]
+    buf = head + b"".join(audio) + b"TAG" + b"\x00" * 125
+
+    idx = index_mp3(buf)
+    assert idx is not None and idx.n_frames == 5
+    starts = list(idx.offsets[:-1])
+    assert starts[0] == len(head)
+    assert starts[3] == len(head) + 3 * FRAME_LEN + len(junk)
+    assert idx.offsets[-1] == len(buf) - 128
+    assert idx.duration_ms == 5 * 1152 * 1000 // 44100
+    assert all(buf[s:s + 4] == FRAME_HDR for s in starts)
+
+
+def _wav(samples: np.ndarray, rate: int = 1000) -> bytes:
+    out = io.BytesIO()
+    with wave.open(out, "wb") as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(rate)
+        w.writeframes(samples.astype("<i2").tobytes())
+    return out.getvalue()
+
+
+def test_wav_write_chunk_header_and_fade():
+    layout = parse_wav(_wav(np.full(1000, 1000)))
+    assert layout is not None and layout.duration_ms == 1000
+
+    out = io.BytesIO()
+    written = layout.write_chunk(200, 700, out, fade_ms=100)
+    data = out.getvalue()
+    assert written == len(data)
+
+    with wave.open(io.BytesIO(data), "rb") as w:
+        assert (w.getnchannels(), w.getsampwidth(), w.getframerate(), w.getnframes()) == (1, 2, 1000, 500)
+        pcm = np.frombuffer(w.readframes(500), dtype="<i2")
+    (riff_size,) = struct.unpack("<I", data[4:8])
+    assert riff_size == len(data) - 8
+
+    assert pcm[0] == 0 and pcm[-1] < 20  # 先頭・末尾 100 ms だけ線形にフェード
+    assert np.all(np.diff(pcm[:100]) >= 0) and np.all(np.diff(pcm[-100:]) <= 0)
+    assert np.all(pcm[100:400] == 1000)
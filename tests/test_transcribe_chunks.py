@@ -0,0 +1,48 @@
+import json
+
+from lib.transcribe_chunks import ChunkResult, parse_response, plan_chunks, render_transcript, stitch
+
+
+def _verbose(*segs) -> str:
+    return json.dumps({"text": "".join(t for _, _, t in segs),
+                       "segments": [{"start": s, "end": e, "text": t} for s, e, t in segs]}, ensure_ascii=False)
+
+
+def test_plan_chunks_overlaps_and_respects_the_size_cap():
+    assert [(p.start_ms, p.end_ms) for p in plan_chunks(500_000, 600_000)] == [(0, 500_000)]
+
+    parts = plan_chunks(1_500_000, 600_000, overlap_ms=2_000)
+    assert parts[0].start_ms == 0 and parts[-1].end_ms == 1_500_000
+    assert all(b.start_ms < a.end_ms for a, b in zip(parts, parts[1:]))  # 隣と重なる
+    assert max(p.end_ms - p.start_ms for p in parts) <= 600_000
+
+    # 32 kbps で 1 MB までなら 1 チャンクはおよそ 250 秒以下
+    capped = plan_chunks(1_500_000, 600_000, bitrate_bps=32_000, max_bytes=1_000_000)
+    assert len(capped) > len(parts)
+    assert max(p.end_ms - p.start_ms for p in capped) <= 250_000
+
+
+def test_stitch_shifts_chunk_segments_and_renumbers_cues():
+    results = [
+        ChunkResult(1, 0, 10_000, _verbose((0.0, 4.0, "はじめに"), (4.0, 9.5, "議題です"))),
+        ChunkResult(2, 9_000, 20_000, _verbose((1.0, 5.0, "予算の件"), (5.0, 10.0, "以上"))),
+    ]
+    res = stitch(results)
+    assert [(s.start_ms, s.end_ms) for s in res.segments] == [(0, 4_000), (4_000, 9_500), (10_000, 14_000), (14_000, 19_000)]
+
+    srt = render_transcript(res, "srt")
+    assert srt.startswith("1\n00:00:00,000 --> 00:00:04,000\nはじめに")
+    assert "4\n00:00:14,000 --> 00:00:19,000\n以上" in srt
+    assert render_transcript(res, "vtt").startswith("WEBVTT\n\n00:00:00.000 --> 00:00:04.000")
+
+    # 以前の設定で保存した SRT の本文もセグメントとして読める
+    text, segs = parse_response(srt)
+    assert text.splitlines()[0] == "はじめに" and segs[-1].start_ms == 14_000
+
+
+def test_stitch_skips_failed_chunks():
+    results = [
+        ChunkResult(1, 0, 10_000, json.dumps({"text": "前半の話"}, ensure_ascii=False)),
+        ChunkResult(2, 9_000, 20_000, error="500"),
+    ]
+    assert stitch(results).text == "前半の話"
@@ -0,0 +1,45 @@
+import os
+import time
+
+from lib.transcribe_chunks import ChunkResult
+from lib.transcribe_jobs import JobStore
+
+PLAN = [(0, 600_000), (598_000, 1_200_000), (1_198_000, 1_500_000)]
+SETTINGS = {"model": "whisper-1", "response_format": "verbose_json"}
+
+
+def test_resume_reads_appended_chunks(tmp_path):
+    store = JobStore(tmp_path)
+    job = store.open("sha", "a.mp3", SETTINGS, PLAN)
+    store.record(job, ChunkResult(1, 0, 600_000, '{"text": "one"}'))
+    store.record(job, ChunkResult(2, 598_000, 1_200_000, error="500"))
+    store.record(job, ChunkResult(3, 1_198_000, 1_500_000, '{"text": "three"}'))
+    store.record(job, ChunkResult(1, 0, 600_000, error="late failure"))  # 成功は失敗で上書きしない
+
+    # 再開ボタンの判定は要約だけ
+    [summary] = JobStore(tmp_path).incomplete_for("sha")
+    assert (summary.job_id, summary.n_done, summary.n_chunks) == (job.job_id, 2, 3)
+    assert summary.settings == SETTINGS
+    assert JobStore(tmp_path).incomplete_for("other") == []
+
+    again = JobStore(tmp_path).open("sha", "a.mp3", SETTINGS, PLAN)
+    assert {i: again.status(i) for i in (1, 2, 3)} == {1: "done", 2: "failed", 3: "done"}
+    assert again.chunks[1].text == '{"text": "one"}'
+
+    store.record(again, ChunkResult(2, 598_000, 1_200_000, '{"text": "two"}'))
+    assert store.finish(again)
+    assert store.incomplete_for("sha") == []
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["inputs"]
+
+
+def test_expired_jobs_are_purged(tmp_path):
+    store = JobStore(tmp_path, max_age_days=1)
+    job = store.open("sha", "a.mp3", SETTINGS, PLAN)
+    store.record(job, ChunkResult(1, 0, 600_000, '{"text": "one"}'))
+    old = time.time() - 3 * 86400
+    for p in list(tmp_path.glob("*")) + list((tmp_path / "inputs").glob("*")):
+        os.utime(p, (old, old))
+
+    store.purge_expired()
+    assert list(tmp_path.glob("*.json*")) == []
+    assert store.incomplete_for("sha") == []
@@ -0,0 +1,33 @@
+from lib.vad import OffsetMap
+
+# 0〜10 秒・30〜40 秒・50〜55 秒を残した 60 秒の録音（カット後は 25 秒）
+SPANS = [(0, 10_000), (30_000, 40_000), (50_000, 55_000)]
+
+
+def test_offset_map_maps_cut_times_to_original():
+    m = OffsetMap(SPANS, 60_000)
+    assert (m.kept_ms, m.removed_ms) == (25_000, 35_000)
+    assert m.to_original(0) == 0
+    assert m.to_original(5_000) == 5_000
+    assert m.to_original(12_500) == 32_500
+    assert m.to_original(24_000) == 54_000
+
+
+def test_offset_map_seams_map_to_either_side():
+    m = OffsetMap(SPANS, 60_000)
+    # 継ぎ目ちょうど：開始として使えば後ろの区間の先頭、終端として使えば前の区間の末尾
+    assert m.to_original(10_000) == 30_000
+    assert m.to_original(10_000, end=True) == 10_000
+    assert m.to_original(20_000) == 50_000
+    assert m.to_original(20_000, end=True) == 40_000
+    assert m.to_original(25_000, end=True) == 55_000
+
+
+def test_offset_map_json_round_trip_and_identity():
+    m = OffsetMap(SPANS, 60_000)
+    back = OffsetMap.from_json(m.to_json())
+    assert back.spans == SPANS and back.total_ms == 60_000
+    assert back.to_original(12_500) == 32_500
+
+    ident = OffsetMap.identity(60_000)
+    assert ident.removed_ms == 0 and ident.to_original(42_000) == 42_000
@@ -0,0 +1,80 @@
+# tools/bench_audio_io.py
+# ============================================================
+# 音声 I/O（lib/audio_io）のチャンクあたりオーバーヘッドのベンチマーク
+# ------------------------------------------------------------
+# 短いチャンク（既定: 10 秒 × 30 個）を
+#   - pydub（export / from_file のたびに ffmpeg を起動）
+#   - PyAV（プロセス内でエンコード・デコード）
+# で書き出し・読み戻しし、1 チャンクあたりの所要時間（ms）を表で出力する。
+#
+# 使い方（リポジトリ直下で）:
+#   python -m tools.bench_audio_io
+#   python -m tools.bench_audio_io --seconds 10 --chunks 30 --format mp3 --bitrate 128k
+#
+# ※ pydub 側の計測には ffmpeg が、PyAV 側の計測には `pip install av` が必要。
+#   どちらかが無ければその行は「—」になる。
+# ============================================================
+from __future__ import annotations
+
+import argparse
+import os
+import time
+
+from pydub import AudioSegment
+
+from lib import audio_io
+from tools.bench_encode_pool import synth_spool
+
+
+def synth_audio(seconds: float, frame_rate: int, channels: int) -> AudioSegment:
+    """bench_encode_pool と同じ合成音声を AudioSegment で（短い長さ用）。"""
+    spool = synth_spool(seconds / 60, frame_rate, channels)
+    try:
+        with open(spool.path, "rb") as f:
+            data = f.read()
+    finally:
+        os.remove(spool.path)
+    return AudioSegment(data=data, sample_width=spool.sample_width, frame_rate=frame_rate, channels=channels)
+
+
+def _time_per_chunk(fn, items) -> tuple[float, list]:
+    out = []
+    t0 = time.perf_counter()
+    for x in items:
+        out.append(fn(x))
+    return (time.perf_counter() - t0) * 1000 / max(1, len(items)), out
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="pydub と PyAV（lib/audio_io）のチャンクあたりの書き出し・読み戻し時間を計測")
+    ap.add_argument("--seconds", type=float, default=10.0, help="1 チャンクの長さ（秒）")
+    ap.add_argument("--chunks", type=int, default=30)
+    ap.add_argument("--rate", type=int, default=44100)
+    ap.add_argument("--channels", type=int, default=2)
+    ap.add_argument("--format", choices=sorted(audio_io.AV_CONTAINERS), default="mp3")
+    ap.add_argument("--bitrate", default="128k")
+    args = ap.parse_args()
+
+    audio = synth_audio(args.seconds * args.chunks, args.rate, args.channels)
+    step = int(args.seconds * 1000)
+    segs = [audio[s:s + step] for s in range(0, len(audio), step)]
+    export_kwargs = {"format": args.format}
+    if args.format in ("mp3", "opus", "ogg"):
+        export_kwargs["bitrate"] = args.bitrate
+
+    backends = ["pydub"] + (["av"] if audio_io.av is not None else [])
+
+    print(f"chunks={len(segs)} × {args.seconds:g}s, format={args.format}, pyav={'yes' if audio_io.av else 'no'}")
+    print(f"{'backend':>8} {'encode[ms/chunk]':>17} {'decode[ms/chunk]':>17} {'out[KB/chunk]':>14}")
+    for name in backends:
+        try:
+            enc_ms, blobs = _time_per_chunk(lambda s: audio_io.export_bytes(s, export_kwargs, backend=name), segs)
+            dec_ms, _ = _time_per_chunk(lambda b: audio_io.decode(b, format=args.format, backend=name), blobs)
+            kb = sum(len(b) for b in blobs) / len(blobs) / 1000
+            print(f"{name:>8} {enc_ms:>17.1f} {dec_ms:>17.1f} {kb:>14.1f}")
+        except Exception as e:  # ffmpeg が無い等
+            print(f"{name:>8} {'—':>17} {'—':>17} {'—':>14}  ({type(e).__name__}: {e})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+# tools/bench_encode_pool.py
+# ============================================================
+# 並列エンコード（lib/encode_pool）のベンチマーク
+# ------------------------------------------------------------
+# 合成した長時間音声（既定: 2時間, 44.1kHz ステレオ。数秒ずつ一時ファイルへ書き出す）を 20 チャンクに分け、
+# ワーカー数ごとのエンコード所要時間（wall-clock）を表で出力する。
+#
+# 使い方（リポジトリ直下で）:
+#   python -m tools.bench_encode_pool
+#   python -m tools.bench_encode_pool --minutes 120 --chunks 20 --workers 1 2 4 8 --format mp3
+#
+# ※ mp3 のエンコードには ffmpeg が必要。wav は ffmpeg なしでも計測できる。
+# ============================================================
+from __future__ import annotations
+
+import argparse
+import tempfile
+import time
+
+import numpy as np
+
+from lib.audio_split import ChunkPlan
+from lib.encode_pool import PcmSpool, encode_chunks
+
+
+def synth_spool(minutes: float, frame_rate: int, channels: int, block_sec: float = 5.0) -> PcmSpool:
+    """
+    話し声の代わりに、振幅がゆっくり変わるトーン＋ノイズを合成し、一時ファイル（生 PCM）へ書き出す。
+    block_sec 秒ずつ作って書くので、メモリに持つのは常に 1 ブロック分だけ（2 時間分を配列で作らない）。
+    """
+    n = int(minutes * 60 * frame_rate)
+    block = max(1, int(block_sec * frame_rate))
+    rng = np.random.default_rng(0)
+    with tempfile.NamedTemporaryFile(delete=False, suffix=".pcm") as tmp:
+        for start in range(0, n, block):
+            t = np.arange(start, min(start + block, n), dtype=np.float64) / frame_rate
+            env = 0.5 + 0.5 * np.sin(2 * np.pi * 0.2 * t)
+            x = np.sin(2 * np.pi * 220 * t) * env * 0.3 + rng.normal(0, 0.02, len(t))
+            pcm = (np.clip(x, -1, 1) * 32767).astype(np.int16)
+            if channels > 1:
+                pcm = np.repeat(pcm, channels)
+            tmp.write(pcm.tobytes())
+        path = tmp.name
+    return PcmSpool(path, 2, frame_rate, channels)
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="並列エンコード（lib/encode_pool）のワーカー数ごとの所要時間を計測")
+    ap.add_argument("--minutes", type=float, default=120.0)
+    ap.add_argument("--rate", type=int, default=44100)
+    ap.add_argument("--channels", type=int, default=2)
+    ap.add_argument("--chunks", type=int, default=20)
+    ap.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    ap.add_argument("--format", choices=["mp3", "wav"], default="mp3")
+    ap.add_argument("--bitrate", default="128k")
+    args = ap.parse_args()
+
+    spool = synth_spool(args.minutes, args.rate, args.channels)
+    total_ms = int(args.minutes * 60 * 1000)
+    step = -(-total_ms // args.chunks)
+    parts = [ChunkPlan(s, min(s + step, total_ms)) for s in range(0, total_ms, step)]
+    export_kwargs = {"format": args.format}
+    if args.format == "mp3":
+        export_kwargs["bitrate"] = args.bitrate
+
+    try:
+        print(f"audio={args.minutes:.0f} min, chunks={len(parts)}, format={args.format}")
+        print(f"{'workers':>8} {'wall[s]':>10} {'speedup':>8} {'out[MB]':>9}")
+        base = None
+        for w in args.workers:
+            t0 = time.perf_counter()
+            out_bytes = sum(len(b) for b in encode_chunks(spool, parts, export_kwargs, workers=w))
+            wall = time.perf_counter() - t0
+            base = base or wall
+            print(f"{w:>8} {wall:>10.2f} {base / wall:>7.2f}x {out_bytes / 1e6:>9.1f}")
+    finally:
+        spool.remove()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+# tools/preflight.py
+# ============================================================
+# フォルダ内の音声の合計時間とモデル別の文字起こし料金を見積もる CLI
+# ------------------------------------------------------------
+# 使い方（リポジトリ直下で）:
+#   python -m tools.preflight /path/to/recordings
+#   python -m tools.preflight /path/to/recordings --workers 32 --usdjpy 150 --csv preflight.csv
+#   python -m tools.preflight /path/to/recordings --no-cache --no-recursive
+#
+# 単価は config.TRANSCRIBE_PRICES_USD_PER_MIN。プローブ結果は PREFLIGHT_CACHE_PATH に
+# パス＋mtime＋サイズをキーとしてキャッシュする（--no-cache で無効）。
+# ============================================================
+from __future__ import annotations
+
+import argparse
+import sys
+
+from config.config import (
+    DEFAULT_USDJPY,
+    PREFLIGHT_CACHE_PATH,
+    TRANSCRIBE_MAX_CONCURRENCY,
+    TRANSCRIBE_PRICES_USD_PER_MIN,
+    TRANSCRIBE_SEC_PER_AUDIO_MIN,
+)
+from lib.audio_split import hhmmss
+from lib.preflight import DEFAULT_PROBE_WORKERS, cost_table, preflight_csv, run_preflight, scan_audio_files
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="フォルダ内の音声の合計時間と文字起こし料金の見積り")
+    ap.add_argument("folder")
+    ap.add_argument("--workers", type=int, default=DEFAULT_PROBE_WORKERS)
+    ap.add_argument("--usdjpy", type=float, default=DEFAULT_USDJPY)
+    ap.add_argument("--no-recursive", action="store_true", help="サブフォルダを含めない")
+    ap.add_argument("--no-cache", action="store_true", help="プローブ結果のキャッシュを使わない")
+    ap.add_argument("--csv", help="ファイルごとの結果を CSV に書き出す")
+    args = ap.parse_args()
+
+    paths = scan_audio_files(args.folder, recursive=not args.no_recursive)
+    if not paths:
+        print(f"音声ファイルが見つかりません: {args.folder}", file=sys.stderr)
+        sys.exit(1)
+
+    res = run_preflight(paths, workers=args.workers, cache_path=None if args.no_cache else PREFLIGHT_CACHE_PATH)
+
+    print(
+        f"files={len(res.files)}  total={hhmmss(int(res.total_seconds * 1000))} ({res.total_minutes:,.1f} min)  "
+        f"size={res.total_bytes / 1e9:,.2f} GB  cached={res.n_cached}  failed={len(res.failed)}  "
+        f"probe={res.wall_seconds:.2f}s"
+    )
+    print()
+    print(f"{'model':<26} {'USD/min':>8} {'USD':>12} {'JPY':>14} {'time':>10}")
+    rows = cost_table(res.total_minutes, TRANSCRIBE_PRICES_USD_PER_MIN, args.usdjpy,
+                      TRANSCRIBE_SEC_PER_AUDIO_MIN, TRANSCRIBE_MAX_CONCURRENCY)
+    for row in rows:
+        sec = row["処理時間（秒）"]
+        print(f"{row['モデル']:<26} {row['単価 (USD/分)']:>8.4f} {row['概算 (USD)']:>12,.2f} {row['概算 (JPY)']:>14,.0f} "
+              f"{hhmmss(int(sec * 1000)) if sec is not None else '—':>10}")
+
+    if res.failed:
+        print()
+        print("長さを取得できなかったファイル（合計に含まれていません）:")
+        for f in res.failed[:20]:
+            print(f"  {f.path}" + (f"  ({f.error})" if f.error else ""))
+        if len(res.failed) > 20:
+            print(f"  ... ほか {len(res.failed) - 20} 件")
+
+    if args.csv:
+        with open(args.csv, "w", newline="", encoding="utf-8") as fp:
+            fp.write(preflight_csv(res))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,21 @@
+# ui/http_debug.py
+import streamlit as st
+
+from lib.api_client import rate_stats
+from lib.http_clients import pool_stats
+from lib.job_queue import STATUS_LABELS, get_job_queue
+
+
+def render_http_debug_panel():
+    """サイドバーに共有 HTTP プールの状況（リクエスト数・新規接続・再利用率）と流量制御の累計を表示する。"""
+    with st.sidebar.expander("🔌 HTTP 接続プール（デバッグ）", expanded=False):
+        st.dataframe(pool_stats(), hide_index=True, use_container_width=True)
+        st.caption("再利用率 = 1 − 新規接続 ÷ リクエスト（サーバー起動後の累計・全セッション共通）")
+        st.dataframe(rate_stats(), hide_index=True, use_container_width=True)
+        st.caption("流量制御（lib/api_client）：送信は再送を含む。待ち時間はレート制限・バックオフで待った合計")
+        queue = get_job_queue()
+        counts = queue.stats()
+        st.caption(
+            f"ジョブキュー（ワーカー {queue.max_workers}）："
+            + " / ".join(f"{STATUS_LABELS[k]} {v}" for k, v in counts.items())
+        )
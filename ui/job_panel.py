@@ -0,0 +1,109 @@
+# ui/job_panel.py
+from typing import Optional
+
+import streamlit as st
+
+from config.config import JOB_ABANDON_SEC
+from lib.job_queue import CANCELLED, STATUS_LABELS, Job, get_job_queue
+
+_SESSION_JOBS = "_session_job_ids"  # このセッションで投入したジョブ（どのページからでも生存確認する）
+
+
+def start_job(key: str, kind: str, fn, *args, label: str = "", meta: Optional[dict] = None) -> str:
+    """
+    ジョブを投入し、ID をセッションと URL（?key=...）に残す（ブラウザを再読み込みしても追える）。
+    同じページの前のジョブが実行中なら中止する（結果を見る人がいなくなるため）。
+    """
+    queue = get_job_queue()
+    prev = queue.get(st.session_state.get(key) or st.query_params.get(key))
+    if prev is not None and prev.active:
+        queue.cancel(prev.job_id)
+    job_id = queue.submit(kind, fn, *args, label=label, meta=meta)
+    st.session_state[key] = job_id
+    _remember(job_id)
+    st.query_params[key] = job_id
+    return job_id
+
+
+def _remember(job_id: str) -> None:
+    ids = st.session_state.setdefault(_SESSION_JOBS, [])
+    if job_id not in ids:
+        ids.append(job_id)
+
+
+def forget_job(key: str) -> None:
+    st.session_state.pop(key, None)
+    if key in st.query_params:
+        del st.query_params[key]
+
+
+def current_job(key: str) -> Optional[Job]:
+    """このページのジョブ（セッション → URL の順に探す）。期限切れ・サーバー再起動で消えていれば None。"""
+    job_id = st.session_state.get(key) or st.query_params.get(key)
+    job = get_job_queue().get(job_id)
+    if job is None and job_id:
+        forget_job(key)
+    elif job is not None:
+        st.session_state[key] = job.job_id
+        _remember(job.job_id)
+    return job
+
+
+def keep_session_jobs_alive() -> None:
+    """
+    このセッションの実行中ジョブを、どのページを開いていても定期的に get() して生存確認する
+    （JOB_ABANDON_SEC の間だれも見に来ないジョブはキューが中止するため）。各ページのサイドバーで呼ぶ。
+    タブを閉じれば確認が止まり、JOB_ABANDON_SEC 後に中止される。
+    """
+    queue = get_job_queue()
+    ids = [j for j in st.session_state.get(_SESSION_JOBS, []) if (job := queue.get(j)) is not None and job.active]
+    st.session_state[_SESSION_JOBS] = ids
+    if not ids:
+        return
+
+    @st.fragment(run_every=max(1.0, min(10.0, JOB_ABANDON_SEC / 3)))
+    def _keepalive():
+        jobs = [j for j in (queue.get(i) for i in ids) if j is not None]
+        running = [j for j in jobs if j.active]
+        if running:
+            st.caption("⏳ 実行中：" + "・".join(f"{j.label} {j.progress:.0%}" for j in running))
+
+    _keepalive()
+
+
+def render_job_panel(job: Job, key: str, partial_height: int = 300, poll_sec: float = 1.0) -> None:
+    """実行中のジョブ：進捗・途中経過・キャンセル。poll_sec ごとにこの部分だけ再描画し、終わったらページ全体を再実行する。"""
+    job_id = job.job_id
+
+    @st.fragment(run_every=poll_sec)
+    def _panel():
+        j = get_job_queue().get(job_id)
+        if j is None or j.finished:
+            st.rerun()
+        waiting = "（順番待ち）" if j.started_at is None else ""
+        st.progress(
+            j.progress,
+            text=f"{j.label}：{STATUS_LABELS[j.status]}{waiting} {j.message}（経過 {j.elapsed:.0f} 秒）",
+        )
+        if j.partial:
+            st.container(height=partial_height).text(j.partial)
+        st.caption(
+            "このタブでほかのページを開いても処理は続きます（再読み込みしたらこのページで結果を確認）。"
+            f"タブを閉じて {JOB_ABANDON_SEC / 60:.0f} 分ほどだれも確認しないジョブは中止されます。"
+        )
+        if st.button("⏹ キャンセル", key=f"{key}_cancel"):
+            get_job_queue().cancel(job_id)
+            st.rerun()
+
+    _panel()
+
+
+def render_job_failure(job: Job) -> None:
+    """失敗・キャンセルしたジョブのメッセージ（途中経過があれば折りたたんで表示）。"""
+    if job.status == CANCELLED:
+        st.warning(f"{job.label}をキャンセルしました（以降の送信・生成は止めています）。")
+    else:
+        st.error(f"{job.label}に失敗しました: {job.error}")
+    if job.partial:
+        with st.expander("キャンセル・失敗までの途中経過", expanded=False):
+            st.text(job.partial)